@@ -0,0 +1,125 @@
+from django.db import IntegrityError, connection, transaction
+from utils import logger, convert_many
+from .cards import card_number_pool, random_cvv
+from .models import Account, AccountRequest, Card, CardRequest, StatusChoices
+from .rates import PIVOT_CURRENCY, exchange_rates
+from .registry import currency_registry
+
+# Bulk processing of pending requests, a batch costs a handful of statements no matter how big it is
+
+NOT_PENDING = "Request not found or already processed."
+
+
+def claim_pending(queryset, **changes):
+    """
+    Claim the still pending rows of queryset with a single UPDATE ... WHERE status = 'PENDING' RETURNING id,
+    setting the given field values. A row claimed by a concurrent banker is simply not returned, so each
+    request is processed exactly once. Returns the claimed primary keys.
+    """
+    meta = queryset.model._meta
+    quote = connection.ops.quote_name
+    subquery, params = queryset.values('pk').query.sql_with_params()
+    assignments = ', '.join(f"{quote(meta.get_field(name).column)} = %s" for name in changes)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(meta.db_table)} SET {assignments} "
+            f"WHERE {quote(meta.get_field('status').column)} = %s AND {quote(meta.pk.column)} IN ({subquery}) "
+            f"RETURNING {quote(meta.pk.column)}",
+            [*changes.values(), StatusChoices.PENDING, *params],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def unclaimed(requested_ids, claimed_ids):
+    """Failures for the explicitly requested ids that couldn't be claimed"""
+    claimed_ids = set(claimed_ids)
+    return [{"id": pk, "error": NOT_PENDING} for pk in requested_ids if pk not in claimed_ids]
+
+
+def approve_requests(queryset, requested_ids=()):
+    """Approve the pending account requests of queryset and open their accounts in bulk.
+    Returns the approved {id, account} pairs and the failed {id, error} ones, which stay pending"""
+    with transaction.atomic():
+        claimed = AccountRequest.objects.in_bulk(claim_pending(queryset, status=StatusChoices.APPROVED))
+
+        approved, failed = [], unclaimed(requested_ids, claimed)
+        for pk, account_request in sorted(claimed.items()):
+            if account_request.initial_deposit < 0:
+                failed.append({"id": pk, "error": "Initial deposit cannot be negative."})
+            elif not currency_registry.is_active(account_request.currency_id):
+                failed.append({"id": pk, "error": "This currency is not active"})
+            else:
+                approved.append(account_request)
+
+        rolled_back = [item["id"] for item in failed if item["id"] in claimed]
+        if rolled_back:
+            AccountRequest.objects.filter(pk__in=rolled_back).update(status=StatusChoices.PENDING)
+
+        accounts = Account.open_many([
+            Account(balance=request.initial_deposit, currency_id=request.currency_id, user_id=request.user_id, is_active=True)
+            for request in approved
+        ])
+
+    logger('ACCOUNTS').info("Bulk approved %s account requests, %s failed", len(accounts), len(failed))
+    return [{"id": request.pk, "account": str(account.pk)} for request, account in zip(approved, accounts)], failed
+
+
+def reject_requests(queryset, description, requested_ids=()):
+    """Reject the pending account requests of queryset with one statement, returns the rejected ids and the failures"""
+    rejected = sorted(claim_pending(queryset, status=StatusChoices.REJECTED, description=description))
+    logger('ACCOUNTS').info("Bulk rejected %s account requests", len(rejected))
+    return rejected, unclaimed(requested_ids, rejected)
+
+
+# salary in EUR needed for a card, same rule as CardRequest.approve
+MINIMUM_CARD_SALARY = 500
+LOW_SALARY = "Salary didn't meet the requirements"
+
+
+def issue_cards(queryset, requested_ids=()):
+    """
+    Approve or reject the pending card requests of queryset in one transaction: the salaries are converted
+    to EUR in a single pass, the card numbers come from one pre checked pool and the cards are inserted at once.
+    Returns the issued {id, card_number}, the rejected ids and the failed {id, error}, which stay pending.
+    """
+    with transaction.atomic():
+        claimed = CardRequest.objects.select_related('account').in_bulk(claim_pending(queryset, status=StatusChoices.APPROVED))
+
+        convertible = exchange_rates.current_matrix().column(PIVOT_CURRENCY)
+        eligible, failed = [], unclaimed(requested_ids, claimed)
+        for pk, card_request in sorted(claimed.items()):
+            if not card_request.account.is_active:
+                failed.append({"id": pk, "error": "Account is not active or approved."})
+            elif card_request.salary_currency_id not in convertible:
+                failed.append({"id": pk, "error": f"No exchange rate from {card_request.salary_currency_id} to {PIVOT_CURRENCY}."})
+            else:
+                eligible.append(card_request)
+
+        salaries = convert_many([request.user_salary for request in eligible], [request.salary_currency_id for request in eligible], PIVOT_CURRENCY)
+        approved = [request for request, salary in zip(eligible, salaries) if salary >= MINIMUM_CARD_SALARY]
+        rejected = [request.pk for request, salary in zip(eligible, salaries) if salary < MINIMUM_CARD_SALARY]
+
+        if failed:
+            CardRequest.objects.filter(pk__in=[item["id"] for item in failed if item["id"] in claimed]).update(status=StatusChoices.PENDING)
+        if rejected:
+            CardRequest.objects.filter(pk__in=rejected).update(status=StatusChoices.REJECTED, description=LOW_SALARY)
+
+        cards = [Card(card_type=request.card_type, cvv=random_cvv(), account_id=request.account_id) for request in approved]
+        insert_cards(cards)
+
+    logger('ACCOUNTS').info("Issued %s cards, rejected %s card requests, %s failed", len(cards), len(rejected), len(failed))
+    return [{"id": request.pk, "card_number": card.card_number} for request, card in zip(approved, cards)], rejected, failed
+
+
+def insert_cards(cards, attempts=3):
+    """bulk_create the cards with numbers from a fresh pool, a number taken in the meantime by another worker redraws the pool"""
+    for attempt in range(attempts):
+        for card, number in zip(cards, card_number_pool(len(cards))):
+            card.card_number = number
+        try:
+            with transaction.atomic():
+                return Card.objects.bulk_create(cards)
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
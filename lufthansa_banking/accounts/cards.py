@@ -0,0 +1,49 @@
+import secrets
+from django.conf import settings
+
+# Card data generation, numbers are random but Luhn valid and checked against the issued cards up front
+
+
+def luhn_check_digit(digits):
+    """Check digit making digits + check digit pass the Luhn test"""
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if position % 2 == 0 else 1)
+        total += value - 9 if value > 9 else value
+    return str(-total % 10)
+
+
+def is_luhn_valid(number):
+    return luhn_check_digit(number[:-1]) == number[-1]
+
+
+def random_card_number(rng=None):
+    """rng is a random.Random for reproducible numbers, the secrets module otherwise"""
+    body_length = 15 - len(settings.CARD_BIN)
+    draw = rng.randrange if rng else secrets.randbelow
+    return with_check_digit(settings.CARD_BIN + f"{draw(10 ** body_length):0{body_length}d}")
+
+
+def with_check_digit(digits):
+    return digits + luhn_check_digit(digits)
+
+
+def random_cvv(rng=None):
+    draw = rng.randrange if rng else secrets.randbelow
+    return f"{draw(1000):03d}"
+
+
+def card_number_pool(count, rng=None):
+    """
+    count distinct Luhn valid card numbers that no card has yet. The candidates are drawn at once and
+    the issued ones among them are found with a single query per round, collisions are redrawn.
+    """
+    from .models import Card
+
+    pool = set()
+    while len(pool) < count:
+        # sorted, so a seeded rng keeps giving the same pool
+        candidates = sorted({random_card_number(rng) if rng else random_card_number() for _ in range(count - len(pool))} - pool)
+        taken = set(Card.objects.filter(card_number__in=candidates).values_list('card_number', flat=True))
+        pool |= set(candidates) - taken
+    return sorted(pool)
@@ -0,0 +1,68 @@
+import os
+import threading
+from django.conf import settings
+
+# IBAN allocation: every worker reserves a block of account numbers with a single insert
+# and hands them out from memory, so opening an account needs no probing for a free IBAN
+
+
+def format_iban(account_number, country_code=None, bank_code=None):
+    """IBAN of the account number under our bank code, with its ISO 13616 (mod 97) check digits"""
+    country_code = country_code or settings.IBAN_COUNTRY_CODE
+    bank_code = bank_code or settings.IBAN_BANK_CODE
+    bban = f"{bank_code}{account_number:010d}"
+    # letters count as 10..35 and the country code moves behind the BBAN
+    numeric = ''.join(str(int(char, 36)) for char in f"{bban}{country_code}00")
+    return f"{country_code}{98 - int(numeric) % 97:02d}{bban}"
+
+
+def is_valid_iban(iban):
+    numeric = ''.join(str(int(char, 36)) for char in iban[4:] + iban[:4])
+    return int(numeric) % 97 == 1
+
+
+class IbanAllocator:
+    """
+    Hands out IBANs from blocks of IBAN_BLOCK_SIZE account numbers. A block is reserved by inserting an
+    IbanBlock row, its id is the block number. On postgres ids come from a sequence that never hands the
+    same value out twice, even when the reserving transaction rolls back, so blocks are never shared.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_number = 0
+        self.end = 0
+        self.pid = None
+
+    def allocate(self):
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count):
+        """count IBANs, reserving as many new blocks as needed"""
+        ibans = []
+        with self.lock:
+            if self.pid != os.getpid():
+                # a forked worker must not share its parent's block
+                self.next_number = self.end = 0
+                self.pid = os.getpid()
+
+            while len(ibans) < count:
+                if self.next_number >= self.end:
+                    self.reserve_block()
+                taken = min(count - len(ibans), self.end - self.next_number)
+                ibans += [format_iban(number) for number in range(self.next_number, self.next_number + taken)]
+                self.next_number += taken
+        return ibans
+
+    def reserve_block(self):
+        from .models import IbanBlock
+        block = IbanBlock.objects.create()
+        self.next_number = block.pk * settings.IBAN_BLOCK_SIZE
+        self.end = self.next_number + settings.IBAN_BLOCK_SIZE
+
+    def invalidate(self):
+        """Drop what is left of the current block, the next IBAN comes from a new one"""
+        with self.lock:
+            self.next_number = self.end = 0
+
+
+iban_allocator = IbanAllocator()
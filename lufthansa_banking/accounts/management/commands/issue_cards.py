@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from accounts.bulk import issue_cards
+from accounts.models import CardRequest
+
+
+class Command(BaseCommand):
+    help = "Issue the cards of the pending card requests matching the filters in one transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--card-type', help="Only requests for this card type")
+        parser.add_argument('--salary-currency', help="Only requests with the salary in this currency")
+        parser.add_argument('--requested-before', help="Only requests made before this ISO datetime")
+        parser.add_argument('--limit', type=int, help="Issue at most this many requests")
+
+    def handle(self, *args, **options):
+        queryset = CardRequest.objects.filter(CardRequest.available_to(), status='PENDING').order_by('pk')
+        if options['card_type']:
+            queryset = queryset.filter(card_type=options['card_type'].upper())
+        if options['salary_currency']:
+            queryset = queryset.filter(salary_currency_id=options['salary_currency'].upper())
+        if options['requested_before']:
+            requested_before = parse_datetime(options['requested_before'])
+            if requested_before is None:
+                raise CommandError(f"Invalid datetime: {options['requested_before']}")
+            queryset = queryset.filter(requested_at__lt=requested_before)
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+
+        issued, rejected, failed = issue_cards(queryset)
+        for item in failed:
+            self.stderr.write(f"Card request {item['id']}: {item['error']}")
+        self.stdout.write(self.style.SUCCESS(f"{len(issued)} card(s) issued, {len(rejected)} request(s) rejected, {len(failed)} failed"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import Currencies, CurrencyRetirement
+
+
+class Command(BaseCommand):
+    help = "Convert all the accounts of a currency to EUR in committed batches and delete the currency, resumable"
+
+    def add_arguments(self, parser):
+        parser.add_argument('currency_code')
+        parser.add_argument('--batch-size', type=int, help="Accounts converted per batch")
+        parser.add_argument('--status', action='store_true', help="Only report the progress of the retirement")
+
+    def handle(self, *args, **options):
+        code = options['currency_code'].upper()
+
+        if options['status']:
+            retirement = CurrencyRetirement.objects.filter(currency_code=code).first()
+            if not retirement:
+                raise CommandError(f"No retirement of {code} was started")
+            self.stdout.write(f"{retirement} ({retirement.status})")
+            return
+
+        try:
+            currency = Currencies.objects.get(pk=code)
+            retirement = CurrencyRetirement.start(currency)
+        except Currencies.DoesNotExist:
+            raise CommandError(f"Currency {code} does not exist")
+        except Exception as e:
+            raise CommandError(str(e))
+
+        retirement.run(batch_size=options['batch_size'], progress=lambda retirement: self.stdout.write(str(retirement)))
+        self.stdout.write(self.style.SUCCESS(f"{code} retired, {retirement.converted_accounts} account(s) converted to EUR"))
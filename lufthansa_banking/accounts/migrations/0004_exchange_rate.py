@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:48
+
+import django.utils.timezone
+from datetime import datetime, timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+# the rates that used to be hardcoded in utils.get_exchange_rate
+INITIAL_RATES = [
+    ('USD', 'EUR', '0.85'), ('USD', 'ALL', '100.0'),
+    ('EUR', 'USD', '1.18'), ('EUR', 'ALL', '123.0'),
+    ('ALL', 'USD', '0.01'), ('ALL', 'EUR', '0.0081'),
+]
+
+
+def add_initial_rates(apps, schema_editor):
+    ExchangeRate = apps.get_model('accounts', 'ExchangeRate')
+    valid_from = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    ExchangeRate.objects.bulk_create([
+        ExchangeRate(from_currency=from_currency, to_currency=to_currency, rate=Decimal(rate), valid_from=valid_from)
+        for from_currency, to_currency, rate in INITIAL_RATES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_account_balance_non_negative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_currency', models.CharField(max_length=10)),
+                ('to_currency', models.CharField(max_length=10)),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('valid_from', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('from_currency', 'to_currency', 'valid_from'), name='unique_exchange_rate')],
+            },
+        ),
+        migrations.RunPython(add_initial_rates, migrations.RunPython.noop),
+    ]
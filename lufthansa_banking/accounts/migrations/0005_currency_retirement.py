@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_exchange_rate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRetirement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency_code', models.CharField(max_length=10, unique=True)),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18, null=True)),
+                ('status', models.CharField(choices=[('RUNNING', 'Running'), ('DONE', 'Done')], default='RUNNING', max_length=10)),
+                ('total_accounts', models.PositiveIntegerField(default=0)),
+                ('converted_accounts', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
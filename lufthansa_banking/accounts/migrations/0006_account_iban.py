@@ -0,0 +1,58 @@
+from django.db import migrations, models
+
+# Frozen here as they were when the migration was written, later changes to accounts.iban or
+# the IBAN settings must not change what replaying it gives
+COUNTRY_CODE = 'DE'
+BANK_CODE = '20040000'
+BLOCK_SIZE = 1000
+
+
+def format_iban(account_number):
+    """IBAN of the account number with its ISO 13616 (mod 97) check digits"""
+    bban = f"{BANK_CODE}{account_number:010d}"
+    numeric = ''.join(str(int(char, 36)) for char in f"{bban}{COUNTRY_CODE}00")
+    return f"{COUNTRY_CODE}{98 - int(numeric) % 97:02d}{bban}"
+
+
+def assign_ibans(apps, schema_editor):
+    """Give every existing account an IBAN, numbered from freshly reserved blocks"""
+    Account = apps.get_model('accounts', 'Account')
+    IbanBlock = apps.get_model('accounts', 'IbanBlock')
+
+    accounts = list(Account.objects.filter(iban__isnull=True).order_by('creation_date', 'id'))
+    numbers = []
+    while len(numbers) < len(accounts):
+        start = IbanBlock.objects.create().pk * BLOCK_SIZE
+        numbers += range(start, start + BLOCK_SIZE)
+
+    for account, number in zip(accounts, numbers):
+        account.iban = format_iban(number)
+    Account.objects.bulk_update(accounts, ['iban'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_currency_retirement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IbanBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reserved_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='iban',
+            field=models.CharField(editable=False, max_length=34, null=True),
+        ),
+        migrations.RunPython(assign_ibans, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='account',
+            name='iban',
+            field=models.CharField(editable=False, max_length=34, unique=True),
+        ),
+    ]
@@ -1,8 +1,15 @@
-from django.db import models
+from decimal import ROUND_HALF_EVEN
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.apps import apps
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from utils import convert_currency
+from django.utils import timezone
+from utils import CENTS, convert_currency
+from .registry import currency_registry
+from .iban import iban_allocator
+from .cards import card_number_pool, random_cvv
 from uuid import uuid4
-import random
 
 class Currencies(models.Model):
     """
@@ -15,23 +22,18 @@ class Currencies(models.Model):
     def delete(self, *args, **kwargs):
         """
         Override the delete method to prevent deletion of the default currency (EUR).
-        If the currency is not EUR, convert all associated account balances to EUR before deletion.
+        A currency without accounts is deleted right away. Otherwise the currency is deactivated and a
+        CurrencyRetirement is started, the retire_currency command then converts the accounts to EUR
+        in the background and deletes the currency. Returns the retirement.
         """
         
         if self.currency_code == 'EUR':
             raise ValidationError("Cannot delete default currency")
         
-        default_currency = Currencies.objects.get(currency_code='EUR')
-
-        accounts = Account.objects.filter(currency=self)
-        
-        for account in accounts:
-            new_balance = convert_currency(account.balance, self.currency_code, 'EUR')
-            account.currency = default_currency
-            account.balance = new_balance
-            account.save()
-
-        super().delete(*args, **kwargs)
+        retirement = CurrencyRetirement.start(self)
+        if not Account.objects.filter(currency_id=self.currency_code).exists():
+            retirement.run()
+        return retirement
 
     def save(self, *args, **kwargs):
         if not self.is_active and self.currency_code == 'EUR':
@@ -40,6 +42,112 @@ class Currencies(models.Model):
         super().save(*args, **kwargs)
 
 
+class ExchangeRate(models.Model):
+    """Rate to convert an amount from one currency to another, valid from the given moment on"""
+    from_currency = models.CharField(max_length=10)
+    to_currency = models.CharField(max_length=10)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    valid_from = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['from_currency', 'to_currency', 'valid_from'], name='unique_exchange_rate'),
+        ]
+
+    def __str__(self):
+        return f"{self.from_currency}/{self.to_currency} {self.rate} from {self.valid_from}"
+
+
+class CurrencyRetirement(models.Model):
+    """
+    Resumable conversion of all the accounts of a currency to EUR before the currency is deleted.
+    Every batch is converted with the rounding of utils.convert_currency and written with one bulk UPDATE
+    committed on its own, the converted accounts leave the currency so a restarted run just picks up the rest.
+    """
+    class Statuses(models.TextChoices):
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Done'
+
+    currency_code = models.CharField(max_length=10, unique=True)
+    rate = models.DecimalField(max_digits=18, decimal_places=8, null=True)
+    status = models.CharField(max_length=10, choices=Statuses.choices, default=Statuses.RUNNING)
+    total_accounts = models.PositiveIntegerField(default=0)
+    converted_accounts = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+
+    @classmethod
+    def start(cls, currency):
+        """Start retiring the currency, or pick up the retirement already running for it.
+        The currency is deactivated first so no new accounts are opened in it meanwhile"""
+        from utils import get_exchange_rate
+
+        if currency.currency_code == 'EUR':
+            raise ValidationError("Cannot delete default currency")
+
+        Currencies.objects.filter(pk=currency.pk).update(is_active=False)
+        currency_registry.invalidate()
+        retirement, created = cls.objects.get_or_create(currency_code=currency.currency_code)
+        if created or retirement.status == cls.Statuses.DONE:
+            retirement.status = cls.Statuses.RUNNING
+            retirement.total_accounts = Account.objects.filter(currency_id=currency.currency_code).count()
+            retirement.converted_accounts = 0
+            retirement.finished_at = None
+            # a currency created again is retired at the rate of now, not the one of the earlier run
+            retirement.rate = None
+        if retirement.rate is None and retirement.total_accounts:
+            # fixed for the whole run so resumed batches convert at the same rate
+            retirement.rate = get_exchange_rate(currency.currency_code, 'EUR')
+            if retirement.rate is None:
+                raise ValueError(f"No exchange rate from {currency.currency_code} to EUR.")
+        retirement.save()
+        return retirement
+
+    def run(self, batch_size=None, progress=None):
+        """Convert the remaining accounts batch by batch, then delete the currency.
+        progress is called with the retirement after every committed batch"""
+        batch_size = batch_size or settings.CURRENCY_RETIREMENT_BATCH_SIZE
+        while self.convert_batch(batch_size):
+            if progress:
+                progress(self)
+
+        with transaction.atomic():
+            Currencies.objects.filter(pk=self.currency_code).delete()
+            self.status = self.Statuses.DONE
+            self.finished_at = timezone.now()
+            self.save()
+
+    def convert_batch(self, batch_size):
+        """Convert the next batch of accounts in one transaction, returns how many were converted"""
+        LedgerEntry = apps.get_model('transactions', 'LedgerEntry')
+
+        with transaction.atomic():
+            old_balances = dict(
+                Account.objects.select_for_update().filter(currency_id=self.currency_code)
+                .order_by('pk').values_list('pk', 'balance')[:batch_size]
+            )
+            if not old_balances:
+                return 0
+
+            # ROUND of the databases goes half away from zero, convert_currency rounds half to even
+            converted = [
+                Account(pk=pk, balance=(balance * self.rate).quantize(CENTS, rounding=ROUND_HALF_EVEN), currency_id='EUR')
+                for pk, balance in old_balances.items()
+            ]
+            Account.objects.bulk_update(converted, ['balance', 'currency'])
+            LedgerEntry.objects.bulk_create([
+                LedgerEntry(account_id=account.pk, amount=account.balance - old_balances[account.pk], entry_type=LedgerEntry.EntryTypes.REVALUATION)
+                for account in converted
+            ])
+
+            self.converted_accounts += len(old_balances)
+            CurrencyRetirement.objects.filter(pk=self.pk).update(converted_accounts=F('converted_accounts') + len(old_balances))
+        return len(old_balances)
+
+    def __str__(self):
+        return f"Retirement of {self.currency_code}: {self.converted_accounts}/{self.total_accounts} accounts"
+
+
 class StatusChoices(models.TextChoices):
         """Global status choices for the account and card statuses"""
         PENDING = 'PENDING', 'Pending'
@@ -49,37 +157,112 @@ class StatusChoices(models.TextChoices):
 class Account(models.Model):
     """Account model representing a user's account"""
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False, max_length=100)
+    iban = models.CharField(max_length=34, unique=True, editable=False)
     balance = models.DecimalField(max_digits=10, decimal_places=2)
     creation_date = models.DateTimeField(auto_now_add=True)
     currency = models.ForeignKey('accounts.Currencies', on_delete=models.SET_DEFAULT, default='EUR')
     user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        constraints = [
+            # Backs up the balance validation for updates that don't go through save
+            models.CheckConstraint(condition=models.Q(balance__gte=0), name='account_balance_non_negative'),
+        ]
+
     def save(self, *args, **kwargs):
         """Save account instance with validations"""
-        if not self.id:
-            self.id = self.generate_unique_iban()
+        if not self.iban:
+            self.iban = self.generate_unique_iban()
         
-        if not self.currency.is_active:
+        if not currency_registry.is_active(self.currency_id):
             raise ValidationError("This currency is not active")
 
         if self.balance < 0:
             raise ValidationError("Balance cannot be negative")
         
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        # a new account opens its ledger with the initial balance
+        LedgerEntry = apps.get_model('transactions', 'LedgerEntry')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            LedgerEntry.objects.create(account=self, amount=self.balance, entry_type=LedgerEntry.EntryTypes.OPENING)
 
     def generate_unique_iban(self):
-        """Generate a unique IBAN for the account which is a uuid, not sure if it is the proper format but the idea stands"""
-        #TODO: Could implement the proper IBAN generation from a mock API
-        while True:
-            id = self.generate_iban()
-            if not Account.objects.filter(id=id).exists():
-                return id
-    
-    def generate_iban(self):
-        return str(uuid4().hex[:22]).upper()
+        """Next IBAN of the block reserved by this worker, unique without checking the table"""
+        return iban_allocator.allocate()
+
+    @classmethod
+    def open_many(cls, accounts):
+        """Bulk version of save for new accounts, same validations, one insert for the accounts and one for their opening ledger entries"""
+        for account in accounts:
+            if not currency_registry.is_active(account.currency_id):
+                raise ValidationError("This currency is not active")
+            if account.balance < 0:
+                raise ValidationError("Balance cannot be negative")
+
+        without_iban = [account for account in accounts if not account.iban]
+        for account, iban in zip(without_iban, iban_allocator.allocate_many(len(without_iban))):
+            account.iban = iban
+
+        LedgerEntry = apps.get_model('transactions', 'LedgerEntry')
+        with transaction.atomic():
+            accounts = cls.objects.bulk_create(accounts)
+            LedgerEntry.objects.bulk_create([
+                LedgerEntry(account=account, amount=account.balance, entry_type=LedgerEntry.EntryTypes.OPENING)
+                for account in accounts
+            ])
+        return accounts
+
+
+class IbanBlock(models.Model):
+    """A reserved block of IBAN account numbers, the id is the block number"""
+    reserved_at = models.DateTimeField(auto_now_add=True)
     
-class AccountRequest(models.Model):
+class ClaimableRequest(models.Model):
+    """
+    Base of the requests worked by bankers. A banker claims pending requests for a while (a lease), the
+    others skip them until the lease expires. Pending rows sit in a partial index, so finding the next
+    ones costs the same however many processed requests pile up.
+    """
+    claimed_by = models.ForeignKey('users.CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+        indexes = [
+            models.Index(fields=['id'], condition=Q(status='PENDING'), name='%(class)s_pending_idx'),
+        ]
+
+    @classmethod
+    def available_to(cls, user=None):
+        """Filter for the requests without a running lease of another banker"""
+        free = Q(claim_expires_at__isnull=True) | Q(claim_expires_at__lte=timezone.now())
+        return free | Q(claimed_by=user) if user is not None else free
+
+    @classmethod
+    def claim_next(cls, user, count):
+        """
+        Lease the next count free pending requests to user. SELECT ... FOR UPDATE SKIP LOCKED lets concurrent
+        bankers claim side by side, each skipping the rows another one is claiming at the same moment.
+        """
+        with transaction.atomic():
+            ids = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(cls.available_to(), status=StatusChoices.PENDING)
+                .order_by('pk').values_list('pk', flat=True)[:count]
+            )
+            expires_at = timezone.now() + settings.WORK_QUEUE_LEASE
+            cls.objects.filter(pk__in=ids).update(claimed_by=user, claim_expires_at=expires_at)
+        return list(cls.objects.filter(pk__in=ids).order_by('pk')), expires_at
+
+    def leased_to_other(self, user):
+        return self.claimed_by_id not in (None, user.pk) and self.claim_expires_at > timezone.now()
+
+
+class AccountRequest(ClaimableRequest):
     """Model representing a user's account request"""
     requested_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE)
@@ -123,7 +306,7 @@ class Card(models.Model):
     cvv = models.CharField(max_length=3)
     account = models.ForeignKey('accounts.Account', on_delete=models.CASCADE)
     
-class CardRequest(models.Model):
+class CardRequest(ClaimableRequest):
     """Model representing a user's card request"""
 
     card_type = models.CharField(max_length=10, choices=Card.CardTypes.choices, default=Card.CardTypes.DEBIT)
@@ -139,15 +322,15 @@ class CardRequest(models.Model):
         if not self.account.is_active and not self.account.status == 'APPROVED':
             raise ValidationError("Account is not active or approved.")
 
-        if self.salary_currency.currency_code != 'EUR':
-            self.user_salary = convert_currency(self.user_salary, self.salary_currency.currency_code, 'EUR')
+        if self.salary_currency_id != 'EUR':
+            self.user_salary = convert_currency(self.user_salary, self.salary_currency_id, 'EUR')
 
         if self.user_salary >= 500:  
             #TODO the generation of the card data could be replaced with an 'api'-like service
             Card.objects.create(
-                card_number=str(random.randint(1000000000000000, 9999999999999999)),
+                card_number=card_number_pool(1)[0],
                 card_type=self.card_type,
-                cvv = str(random.randint(100, 999)),
+                cvv=random_cvv(),
                 account=self.account, 
             )
             self.status = 'APPROVED'
@@ -0,0 +1,118 @@
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_EVEN
+from django.conf import settings
+from django.utils import timezone
+
+# Process local cache of the exchange rates, so converting an amount is a list lookup
+# instead of a database round trip
+
+# the default currency, pairs without a stored rate are triangulated through it
+PIVOT_CURRENCY = 'EUR'
+CENTS = Decimal('0.01')
+
+
+class RateMatrix:
+    """
+    Dense matrix of the rates between every known currency, indexed by currency position.
+    Stored rates are used as is, missing pairs are derived as from -> EUR -> to when both legs exist.
+    """
+    def __init__(self, rates):
+        self.codes = sorted({code for pair in rates for code in pair} | {PIVOT_CURRENCY})
+        self.index = {code: position for position, code in enumerate(self.codes)}
+        self.rows = [[None] * len(self.codes) for _ in self.codes]
+
+        for (from_currency, to_currency), rate in rates.items():
+            self.rows[self.index[from_currency]][self.index[to_currency]] = rate
+
+        pivot = self.index[PIVOT_CURRENCY]
+        for i, row in enumerate(self.rows):
+            row[i] = Decimal(1)
+            for j in range(len(self.codes)):
+                if row[j] is None and row[pivot] is not None and self.rows[pivot][j] is not None:
+                    row[j] = row[pivot] * self.rows[pivot][j]
+
+    def get(self, from_currency, to_currency):
+        if from_currency not in self.index or to_currency not in self.index:
+            return None
+        return self.rows[self.index[from_currency]][self.index[to_currency]]
+
+    def column(self, to_currency):
+        """Rate of every currency into to_currency, by currency code"""
+        j = self.index.get(to_currency)
+        if j is None:
+            return {}
+        return {code: self.rows[i][j] for code, i in self.index.items() if self.rows[i][j] is not None}
+
+
+class ExchangeRateCache:
+    """
+    Holds the rate matrix of the currently valid rates. The whole (small) table is loaded at once and
+    reloaded after EXCHANGE_RATE_CACHE_TTL seconds, or as soon as a rate of this process is written,
+    so a rate update is visible to every worker within the TTL.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.matrix = RateMatrix({})
+        self.expires_at = 0.0
+
+    def get_rate(self, from_currency, to_currency):
+        """Rate to convert from_currency into to_currency, None if the pair is unknown"""
+        return self.current_matrix().get(from_currency, to_currency)
+
+    def convert_many(self, amounts, from_currencies, to_currency, minor_units=False):
+        """
+        Convert a whole list of amounts into to_currency in one pass. from_currencies is either one code for
+        all the amounts or a code per amount. Decimal amounts are rounded to cents, integer minor units
+        (cents) stay integers and are rounded half up. Every source currency is resolved once.
+        """
+        column = self.current_matrix().column(to_currency)
+        if isinstance(from_currencies, str):
+            from_currencies = [from_currencies] * len(amounts)
+
+        missing = set(from_currencies) - set(column)
+        if missing:
+            raise ValueError(f"No exchange rate from {', '.join(sorted(missing))} to {to_currency}.")
+
+        if minor_units:
+            ratios = {code: rate.as_integer_ratio() for code, rate in column.items()}
+            return [
+                (2 * amount * ratios[code][0] + ratios[code][1]) // (2 * ratios[code][1])
+                for amount, code in zip(amounts, from_currencies)
+            ]
+        return [(amount * column[code]).quantize(CENTS, rounding=ROUND_HALF_EVEN) for amount, code in zip(amounts, from_currencies)]
+
+    def current_matrix(self):
+        if time.monotonic() >= self.expires_at:
+            with self.lock:
+                if time.monotonic() >= self.expires_at:
+                    self.load()
+        return self.matrix
+
+    def load(self):
+        from .models import ExchangeRate
+        now = timezone.now()
+        rates = {}
+        next_change = None
+        for from_currency, to_currency, rate, valid_from in ExchangeRate.objects.order_by('valid_from').values_list(
+            'from_currency', 'to_currency', 'rate', 'valid_from'
+        ):
+            if valid_from <= now:
+                # ordered by valid_from, the latest valid rate of a pair wins
+                rates[(from_currency, to_currency)] = rate
+            elif next_change is None:
+                next_change = valid_from
+
+        ttl = settings.EXCHANGE_RATE_CACHE_TTL
+        if next_change is not None:
+            # a rate becoming valid later expires the cache early
+            ttl = min(ttl, (next_change - now).total_seconds())
+        # swapped in one assignment, readers never see a half built matrix
+        self.matrix = RateMatrix(rates)
+        self.expires_at = time.monotonic() + ttl
+
+    def invalidate(self):
+        self.expires_at = 0.0
+
+
+exchange_rates = ExchangeRateCache()
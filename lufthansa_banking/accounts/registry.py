@@ -0,0 +1,56 @@
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError
+from utils import logger
+from .rates import exchange_rates
+
+# Process local registry of the currencies, the table only holds a handful of rows but
+# every account save and every transaction needs them
+
+
+class CurrencyRegistry:
+    """
+    All the Currencies rows by code. Reloaded when this process writes a currency (post_save/post_delete
+    signals, or an explicit invalidate after a bulk update) and after CURRENCY_CACHE_TTL seconds, the bound
+    on how long a change made by another worker takes to show up.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.currencies = {}
+        self.expires_at = 0.0
+
+    def get(self, currency_code):
+        """The Currencies instance of the code, None if it doesn't exist"""
+        return self.current().get(currency_code)
+
+    def is_active(self, currency_code):
+        currency = self.get(currency_code)
+        return bool(currency and currency.is_active)
+
+    def current(self):
+        if time.monotonic() >= self.expires_at:
+            with self.lock:
+                if time.monotonic() >= self.expires_at:
+                    self.load()
+        return self.currencies
+
+    def load(self):
+        from .models import Currencies
+        self.currencies = Currencies.objects.in_bulk()
+        self.expires_at = time.monotonic() + settings.CURRENCY_CACHE_TTL
+
+    def invalidate(self):
+        self.expires_at = 0.0
+
+
+currency_registry = CurrencyRegistry()
+
+
+def warm_caches():
+    """Load the currencies and exchange rates when a worker starts, so the first requests don't pay for it"""
+    try:
+        currency_registry.current()
+        exchange_rates.current_matrix()
+    except DatabaseError as e:
+        logger('ACCOUNTS').warning("Couldn't warm the currency caches: %s", e)
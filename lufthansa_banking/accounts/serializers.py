@@ -1,4 +1,5 @@
-from rest_framework.serializers import ModelSerializer, ValidationError, UUIDField
+from django.conf import settings
+from rest_framework.serializers import ModelSerializer, Serializer, ValidationError, UUIDField, ListField, IntegerField, CharField, DateTimeField, ChoiceField
 from .models import Account, AccountRequest, Card, CardRequest
 from users.models import CustomUser
 from rest_framework.exceptions import ValidationError
@@ -6,7 +7,7 @@ from rest_framework.exceptions import ValidationError
 class AccountSerializer(ModelSerializer):
     class Meta:
         model = Account
-        fields = ['id','user', 'currency', 'balance', 'is_active', 'creation_date']
+        fields = ['id', 'iban', 'user', 'currency', 'balance', 'is_active', 'creation_date']
         extra_kwargs= {
             'user': {'read_only': True},
             'id': {'read_only': True},
@@ -38,25 +39,25 @@ class CardSerializer(ModelSerializer):
         fields = ['card_type', 'account', 'card_number', 'cvv']
         
     def validate(self, attrs):
-        account = Account.objects.get(account=attrs.pop('account'))
-        if account.exists():
-            raise ValidationError("Account does not exist.")
-
-        if account.user != self.context['request'].user:
+        # the account field already loaded the account or rejected an unknown id
+        account = attrs.get('account')
+        user = self.context['request'].user
+        if account is not None and user.type == 'CUSTOMER' and account.user_id != user.id:
             raise ValidationError("You can only request a card for your own account.")
 
         return attrs
 
 
 class CardRequestSerializer(ModelSerializer):
-    account = UUIDField()
+    # the id is on the row already, reading the related account would cost a query per request
+    account = UUIDField(source='account_id')
     class Meta:
         model = CardRequest
         fields = ['id', 'card_type', 'account', 'user_salary', 'salary_currency']
 
     def create(self, data):
         try:
-            account = Account.objects.get(id=data.pop('account')) 
+            account = Account.objects.get(id=data.pop('account_id')) 
             data["account"] = account
             card = CardRequest.objects.create(**data)  
             card.save()
@@ -70,7 +71,7 @@ class CardRequestSerializer(ModelSerializer):
         if self.context['request'].user.type == 'CUSTOMER' and attrs.get("description"):
             raise ValidationError("Customer can't add descriptions.")
 
-        if Account.objects.get(id=str(attrs['account'])).user != self.context['request'].user and self.context['request'].user.type not in ["ADMIN", "BANKER"]:
+        if Account.objects.get(id=str(attrs['account_id'])).user != self.context['request'].user and self.context['request'].user.type not in ["ADMIN", "BANKER"]:
             raise ValidationError("You can only request a card for your own account.")
         
         return attrs
@@ -94,3 +95,72 @@ class AccountRequestSerializer(ModelSerializer):
         request = AccountRequest.objects.create(**validated_data)
         request.save()
         return request
+
+
+class BulkRequestSerializer(Serializer):
+    """Selects the pending requests of a bulk call, either by id or by a filter"""
+    model = None
+    ids = ListField(child=IntegerField(), required=False, max_length=settings.BULK_REQUEST_MAX_SIZE)
+    requested_before = DateTimeField(required=False)
+    requested_after = DateTimeField(required=False)
+    limit = IntegerField(required=False, min_value=1, max_value=settings.BULK_REQUEST_MAX_SIZE)
+
+    FILTERS = {
+        'requested_before': 'requested_at__lt',
+        'requested_after': 'requested_at__gte',
+    }
+
+    def validate(self, data):
+        if 'ids' not in data and not any(name in data for name in self.FILTERS):
+            raise ValidationError("Give the request ids or at least one filter.")
+        return data
+
+    def get_queryset(self, user=None):
+        """The pending requests picked, oldest first and capped at the limit, leaving out the ones leased to another banker"""
+        data = self.validated_data
+        queryset = self.model.objects.filter(self.model.available_to(user), status='PENDING')
+        if 'ids' in data:
+            queryset = queryset.filter(pk__in=data['ids'])
+        queryset = queryset.filter(**{lookup: data[name] for name, lookup in self.FILTERS.items() if name in data})
+        return queryset.order_by('pk')[:data.get('limit', settings.BULK_REQUEST_MAX_SIZE)]
+
+
+class BulkAccountRequestSerializer(BulkRequestSerializer):
+    model = AccountRequest
+    currency = CharField(required=False)
+    account_type = CharField(required=False)
+    description = CharField(required=False, allow_blank=True, default='')
+
+    FILTERS = {
+        **BulkRequestSerializer.FILTERS,
+        'currency': 'currency_id',
+        'account_type': 'account_type',
+    }
+
+
+class BulkCardRequestSerializer(BulkRequestSerializer):
+    model = CardRequest
+    card_type = CharField(required=False)
+    salary_currency = CharField(required=False)
+
+    FILTERS = {
+        **BulkRequestSerializer.FILTERS,
+        'card_type': 'card_type',
+        'salary_currency': 'salary_currency_id',
+    }
+
+
+class WorkQueueClaimSerializer(Serializer):
+    queue = ChoiceField(choices=['account', 'card'], default='account')
+    count = IntegerField(min_value=1, max_value=settings.WORK_QUEUE_MAX_CLAIM, default=10)
+
+
+class StatementSerializer(Serializer):
+    """Query parameters of a statement, the range defaults to the account's creation up to now"""
+    start = DateTimeField(required=False)
+    end = DateTimeField(required=False)
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise ValidationError("Start must be before end.")
+        return data
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Currencies, ExchangeRate
+from .rates import exchange_rates
+from .registry import currency_registry
+
+
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def invalidate_exchange_rates(sender, **kwargs):
+    """Reload the rates of this process on the next conversion, the other workers follow within the TTL"""
+    exchange_rates.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Currencies)
+def invalidate_currencies(sender, **kwargs):
+    """Reload the currency registry of this process on its next use"""
+    currency_registry.invalidate()
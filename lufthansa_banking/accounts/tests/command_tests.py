@@ -0,0 +1,24 @@
+import pytest
+from io import StringIO
+from decimal import Decimal
+from django.core.management import call_command
+from accounts.models import Account, Card, CardRequest, Currencies
+from users.models import CustomUser
+
+
+@pytest.fixture
+def account():
+    currency = Currencies.objects.create(currency_name='Euro', currency_code='EUR', is_active=True)
+    user = CustomUser.objects.create(username='testuser', email='test@example.com', password='testpass')
+    return Account.objects.create(balance=Decimal('1000.00'), currency=currency, user=user, is_active=True)
+
+
+@pytest.mark.django_db
+def test_issue_cards_command(account):
+    CardRequest.objects.create(account=account, user_salary=Decimal('600.00'), card_type='CREDIT')
+    CardRequest.objects.create(account=account, user_salary=Decimal('600.00'), card_type='DEBIT')
+    out = StringIO()
+    call_command('issue_cards', '--card-type', 'credit', stdout=out)
+    assert Card.objects.get().card_type == 'CREDIT'
+    assert CardRequest.objects.filter(status='PENDING').count() == 1
+    assert "1 card(s) issued, 0 request(s) rejected, 0 failed" in out.getvalue()
@@ -158,3 +158,182 @@ def test_card_request_reject(account, active_currency):
     request.reject("Salary too low.")
     assert request.status == 'REJECTED'
     assert request.description == "Salary too low."
+
+@pytest.mark.django_db
+def test_convert_currency_uses_stored_rates(django_assert_num_queries):
+    """Conversions read the stored rates once and are then served from memory."""
+    from utils import convert_currency
+    assert convert_currency(Decimal('100.00'), 'USD', 'EUR') == Decimal('85.00')
+    with django_assert_num_queries(0):
+        assert convert_currency(Decimal('10.00'), 'EUR', 'ALL') == Decimal('1230.00')
+        assert convert_currency(Decimal('10.00'), 'EUR', 'EUR') == Decimal('10.00')
+
+@pytest.mark.django_db
+def test_exchange_rate_update_invalidates_cache():
+    """A new rate is picked up right away by the process writing it."""
+    from utils import convert_currency
+    from accounts.models import ExchangeRate
+    assert convert_currency(Decimal('100.00'), 'USD', 'EUR') == Decimal('85.00')
+    ExchangeRate.objects.create(from_currency='USD', to_currency='EUR', rate=Decimal('0.9'))
+    assert convert_currency(Decimal('100.00'), 'USD', 'EUR') == Decimal('90.00')
+
+@pytest.mark.django_db
+def test_future_exchange_rate_not_used_yet():
+    """A rate only applies once it is valid."""
+    from datetime import timedelta
+    from django.utils import timezone
+    from utils import convert_currency
+    from accounts.models import ExchangeRate
+    ExchangeRate.objects.create(from_currency='USD', to_currency='EUR', rate=Decimal('0.5'), valid_from=timezone.now() + timedelta(days=1))
+    assert convert_currency(Decimal('100.00'), 'USD', 'EUR') == Decimal('85.00')
+
+@pytest.mark.django_db
+def test_convert_currency_unknown_pair():
+    """Amounts are no longer passed through unconverted for unknown pairs."""
+    from utils import convert_currency
+    with pytest.raises(ValueError):
+        convert_currency(Decimal('100.00'), 'EUR', 'GBP')
+
+@pytest.mark.django_db
+def test_missing_pair_triangulated_through_eur():
+    """Pairs without a stored rate go through EUR."""
+    from utils import get_exchange_rate, convert_currency
+    from accounts.models import ExchangeRate
+    ExchangeRate.objects.create(from_currency='GBP', to_currency='EUR', rate=Decimal('1.2'))
+    assert get_exchange_rate('GBP', 'USD') == Decimal('1.2') * Decimal('1.18')
+    assert convert_currency(Decimal('100.00'), 'GBP', 'ALL') == Decimal('14760.00')
+    with pytest.raises(ValueError):
+        convert_currency(Decimal('100.00'), 'USD', 'GBP')
+
+@pytest.mark.django_db
+def test_convert_many(django_assert_num_queries):
+    """Batch conversion of Decimals and of integer cents."""
+    from utils import convert_many, get_exchange_rate
+    get_exchange_rate('USD', 'EUR')
+    with django_assert_num_queries(0):
+        assert convert_many([Decimal('100.00'), Decimal('10.00'), Decimal('1000.00')], ['USD', 'EUR', 'ALL'], 'EUR') == [
+            Decimal('85.00'), Decimal('10.00'), Decimal('8.10')
+        ]
+        assert convert_many([10000, 1, 3], 'USD', 'EUR', minor_units=True) == [8500, 1, 3]
+    with pytest.raises(ValueError):
+        convert_many([Decimal('1.00')], 'GBP', 'EUR')
+
+@pytest.mark.django_db
+def test_currency_deletion_converts_accounts_in_batches(active_currency, user, settings):
+    """Deleting a currency only starts its retirement, the command converts its accounts to EUR batch by batch
+    and records the revaluation."""
+    from django.core.management import call_command
+    from io import StringIO
+    from accounts.models import CurrencyRetirement
+    from transactions.models import LedgerEntry
+    settings.CURRENCY_RETIREMENT_BATCH_SIZE = 2
+    usd = Currencies.objects.create(currency_name='Dollar', currency_code='USD', is_active=True)
+    accounts = [Account.objects.create(balance=Decimal('100.00'), currency=usd, user=user) for _ in range(5)]
+
+    usd.delete()
+
+    assert not Currencies.objects.get(currency_code='USD').is_active
+    assert CurrencyRetirement.objects.get(currency_code='USD').status == 'RUNNING'
+    assert Account.objects.filter(currency_id='USD').count() == 5
+
+    call_command('retire_currency', 'USD', stdout=StringIO())
+
+    assert not Currencies.objects.filter(currency_code='USD').exists()
+    retirement = CurrencyRetirement.objects.get(currency_code='USD')
+    assert retirement.status == 'DONE'
+    assert (retirement.converted_accounts, retirement.total_accounts) == (5, 5)
+    for account in accounts:
+        account.refresh_from_db()
+        assert account.currency_id == 'EUR'
+        assert account.balance == Decimal('85.00')
+        assert LedgerEntry.balance_of(account) == Decimal('85.00')
+
+@pytest.mark.django_db
+def test_currency_retirement_rounds_half_even(active_currency, user):
+    """Balances convert with the rounding of convert_currency, 12.10 USD at 0.85 is 10.285 and gives 10.28 EUR."""
+    from accounts.models import CurrencyRetirement
+    usd = Currencies.objects.create(currency_name='Dollar', currency_code='USD', is_active=True)
+    account = Account.objects.create(balance=Decimal('12.10'), currency=usd, user=user)
+
+    CurrencyRetirement.start(usd).run()
+    account.refresh_from_db()
+    assert account.balance == Decimal('10.28')
+
+@pytest.mark.django_db
+def test_currency_retired_again_at_the_current_rate(active_currency, user):
+    """A currency created again after its retirement is retired at the rate of the new run."""
+    from datetime import timedelta
+    from django.utils import timezone
+    from accounts.models import CurrencyRetirement, ExchangeRate
+    from accounts.rates import exchange_rates
+    usd = Currencies.objects.create(currency_name='Dollar', currency_code='USD', is_active=True)
+    Account.objects.create(balance=Decimal('100.00'), currency=usd, user=user)
+    CurrencyRetirement.start(usd).run()
+    assert CurrencyRetirement.objects.get(currency_code='USD').rate == Decimal('0.85')
+
+    usd = Currencies.objects.create(currency_name='Dollar', currency_code='USD', is_active=True)
+    account = Account.objects.create(balance=Decimal('100.00'), currency=usd, user=user)
+    ExchangeRate.objects.create(from_currency='USD', to_currency='EUR', rate=Decimal('0.5'), valid_from=timezone.now() - timedelta(seconds=1))
+    exchange_rates.invalidate()
+
+    CurrencyRetirement.start(usd).run()
+    assert CurrencyRetirement.objects.get(currency_code='USD').rate == Decimal('0.5')
+    account.refresh_from_db()
+    assert account.balance == Decimal('50.00')
+
+@pytest.mark.django_db
+def test_currency_retirement_resumes(active_currency, user):
+    """A retirement stopped half way picks up the accounts that are left."""
+    from accounts.models import CurrencyRetirement
+    usd = Currencies.objects.create(currency_name='Dollar', currency_code='USD', is_active=True)
+    for _ in range(3):
+        Account.objects.create(balance=Decimal('100.00'), currency=usd, user=user)
+
+    CurrencyRetirement.start(usd).convert_batch(2)
+    assert Account.objects.filter(currency_id='USD').count() == 1
+
+    CurrencyRetirement.start(usd).run()
+    assert Account.objects.filter(currency_id='EUR').count() == 3
+    assert CurrencyRetirement.objects.get(currency_code='USD').converted_accounts == 3
+
+def test_format_iban_check_digits():
+    """Generated IBANs carry valid mod 97 check digits."""
+    from accounts.iban import format_iban, is_valid_iban
+    iban = format_iban(532013000, 'DE', '37040044')
+    assert iban == 'DE89370400440532013000'
+    assert is_valid_iban(iban)
+    assert not is_valid_iban('DE88370400440532013000')
+
+@pytest.mark.django_db
+def test_account_iban_allocated_from_block(active_currency, user, settings, django_assert_num_queries):
+    """Accounts get unique IBANs from the reserved block, without probing the account table."""
+    from accounts.iban import iban_allocator, is_valid_iban
+    settings.IBAN_BLOCK_SIZE = 3
+    iban_allocator.allocate()
+
+    ibans = iban_allocator.allocate_many(2)
+    with django_assert_num_queries(1):
+        # the block is used up, the next IBAN reserves a new one
+        ibans += iban_allocator.allocate_many(1)
+    accounts = [Account.objects.create(balance=Decimal('10.00'), currency=active_currency, user=user) for _ in range(4)]
+
+    ibans += [account.iban for account in accounts]
+    assert len(set(ibans)) == 7
+    assert all(iban.startswith('DE') and is_valid_iban(iban) for iban in ibans)
+
+def test_card_numbers_are_luhn_valid(settings):
+    """Generated card numbers carry our BIN and a valid Luhn check digit."""
+    from accounts.cards import is_luhn_valid, luhn_check_digit, random_card_number
+    assert luhn_check_digit('7992739871') == '3'
+    assert not is_luhn_valid('79927398710')
+    number = random_card_number()
+    assert len(number) == 16 and number.startswith(settings.CARD_BIN)
+    assert is_luhn_valid(number)
+
+@pytest.mark.django_db
+def test_card_number_pool_skips_issued_numbers(card, monkeypatch):
+    """Numbers already on a card are redrawn."""
+    from accounts import cards
+    draws = iter([card.card_number, '4123450000000017'])
+    monkeypatch.setattr(cards, 'random_card_number', lambda: next(draws))
+    assert cards.card_number_pool(1) == ['4123450000000017']
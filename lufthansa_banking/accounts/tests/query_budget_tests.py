@@ -0,0 +1,64 @@
+import pytest
+from decimal import Decimal
+from django.urls import reverse
+from accounts.models import Account, AccountRequest, Card, CardRequest, Currencies
+
+# Every account endpoint within its baseline query budget, with enough rows to show an N+1
+
+
+@pytest.fixture
+def accounts(customer):
+    """A few accounts of the customer with cards and pending account and card requests"""
+    Currencies.objects.create(currency_name='Euro', currency_code='EUR', is_active=True)
+    accounts = [Account.objects.create(user=customer, balance=Decimal('1000.00'), currency_id='EUR') for _ in range(5)]
+    for position, account in enumerate(accounts):
+        Card.objects.create(card_number=f'412345000000{position:04d}', account=account, cvv='123')
+        CardRequest.objects.create(account=account, user_salary=Decimal('600.00'))
+        AccountRequest.objects.create(user=customer, initial_deposit=Decimal('100.00'))
+    return accounts
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('view, method, url, data, expected_status', [
+    ('AccountViewSet.list', 'get', lambda accounts: reverse('account-list'), None, 200),
+    ('AccountViewSet.retrieve', 'get', lambda accounts: reverse('account-detail', kwargs={'pk': accounts[0].pk}), None, 200),
+    ('AccountViewSet.create', 'post', lambda accounts: reverse('account-list'), {'currency': 'EUR', 'balance': '10.00'}, 201),
+    ('AccountViewSet.partial_update', 'patch', lambda accounts: reverse('account-detail', kwargs={'pk': accounts[0].pk}), {'is_active': True}, 200),
+    ('AccountViewSet.destroy', 'delete', lambda accounts: reverse('account-detail', kwargs={'pk': accounts[0].pk}), None, 204),
+    ('CardViewSet.list', 'get', lambda accounts: reverse('card-list'), None, 200),
+    ('CardViewSet.retrieve', 'get', lambda accounts: reverse('card-detail', kwargs={'pk': Card.objects.first().pk}), None, 200),
+    ('CardViewSet.create', 'post', lambda accounts: reverse('card-list'),
+     lambda accounts: {'card_type': 'DEBIT', 'account': str(accounts[0].pk), 'card_number': '4123450000009999', 'cvv': '321'}, 201),
+    ('CardViewSet.partial_update', 'patch', lambda accounts: reverse('card-detail', kwargs={'pk': Card.objects.first().pk}), {'card_type': 'CREDIT'}, 200),
+    ('CardViewSet.destroy', 'delete', lambda accounts: reverse('card-detail', kwargs={'pk': Card.objects.first().pk}), None, 204),
+    ('AccountRequestViewSet.list', 'get', lambda accounts: reverse('account-request-list'), None, 200),
+    ('AccountRequestViewSet.retrieve', 'get', lambda accounts: reverse('account-request-detail', kwargs={'pk': AccountRequest.objects.first().pk}), None, 200),
+    ('AccountRequestViewSet.create', 'post', lambda accounts: reverse('account-request-list'), {'initial_deposit': '50.00', 'currency': 'EUR'}, 201),
+    ('CardRequestViewSet.list', 'get', lambda accounts: reverse('card-request-list'), None, 200),
+    ('CardRequestViewSet.retrieve', 'get', lambda accounts: reverse('card-request-detail', kwargs={'pk': CardRequest.objects.first().pk}), None, 200),
+    ('CardRequestViewSet.create', 'post', lambda accounts: reverse('card-request-list'),
+     lambda accounts: {'account': str(accounts[0].pk), 'card_type': 'DEBIT', 'user_salary': '600.00', 'salary_currency': 'EUR'}, 201),
+    ('ApproveAccountRequestView.post', 'post', lambda accounts: reverse('approve-account-request', kwargs={'id': AccountRequest.objects.first().pk}), None, 200),
+    ('RejectAccountRequestView.post', 'post', lambda accounts: reverse('reject-account-request', kwargs={'id': AccountRequest.objects.first().pk}), None, 200),
+    ('ApproveCardRequestView.post', 'post', lambda accounts: reverse('approve-card-request', kwargs={'id': CardRequest.objects.first().pk}), None, 200),
+    ('RejectCardRequestView.post', 'post', lambda accounts: reverse('reject-card-request', kwargs={'id': CardRequest.objects.first().pk}), None, 200),
+    ('BulkApproveAccountRequestView.post', 'post', lambda accounts: reverse('bulk-approve-account-requests'), {'currency': 'EUR'}, 200),
+    ('BulkRejectAccountRequestView.post', 'post', lambda accounts: reverse('bulk-reject-account-requests'), {'currency': 'EUR'}, 200),
+    ('BulkApproveCardRequestView.post', 'post', lambda accounts: reverse('bulk-approve-card-requests'), {'card_type': 'DEBIT'}, 200),
+    ('WorkQueueClaimView.post', 'post', lambda accounts: reverse('work-queue-claim'), {'queue': 'card', 'count': 5}, 200),
+])
+def test_endpoint_budget(api_client, accounts, banker, query_budget, view, method, url, data, expected_status):
+    api_client.force_authenticate(user=banker)
+    url = url(accounts)
+    data = data(accounts) if callable(data) else data
+
+    with query_budget(view):
+        response = getattr(api_client, method)(url, data=data, format='json')
+    assert response.status_code == expected_status
+
+@pytest.mark.django_db
+def test_statement_budget(api_client, accounts, customer, query_budget):
+    api_client.force_authenticate(user=customer)
+    with query_budget('AccountViewSet.statement'):
+        response = api_client.get(reverse('account-statement', kwargs={'pk': accounts[0].pk}))
+        b''.join(response.streaming_content)
+    assert response.status_code == 200
@@ -152,4 +152,206 @@ def test_reject_card_request(api_client, create_admin_user, account, active_curr
 
     assert response.status_code == status.HTTP_200_OK
     card_request.refresh_from_db()
-    assert card_request.status == 'REJECTED'
\ No newline at end of file
+    assert card_request.status == 'REJECTED'
+
+@pytest.mark.django_db
+def test_account_statement_csv(api_client, user, account, active_currency):
+    """Test that the CSV statement carries a running balance ending at the current balance."""
+    import csv
+    from transactions.models import Transaction
+    Transaction.objects.create(transaction_type='CREDIT', to_account=account, currency=active_currency, amount=Decimal('100.00'))
+    Transaction.objects.create(transaction_type='DEBIT', from_account=account, currency=active_currency, amount=Decimal('30.00'))
+    api_client.force_authenticate(user=user)
+
+    response = api_client.get(reverse('account-statement', kwargs={'pk': account.id}), {'export': 'csv'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response['Content-Type'] == 'text/csv'
+    rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+    assert [row['type'] for row in rows] == ['OPENING', 'MOVEMENT', 'MOVEMENT']
+    assert [row['amount'] for row in rows] == ['1000.00', '100.00', '-30.00']
+    assert [row['balance'] for row in rows] == ['1000.00', '1100.00', '1070.00']
+
+
+@pytest.mark.django_db
+def test_account_statement_ndjson_date_range(api_client, user, account, active_currency):
+    """Test that a statement starting later opens with the balance at that point."""
+    import json
+    from datetime import timedelta
+    from transactions.models import Transaction, LedgerEntry
+    old = Transaction.objects.create(transaction_type='CREDIT', to_account=account, currency=active_currency, amount=Decimal('100.00'))
+    LedgerEntry.objects.filter(account=account).update(created_at=old.date - timedelta(days=10))
+    Transaction.objects.create(transaction_type='DEBIT', from_account=account, currency=active_currency, amount=Decimal('30.00'))
+    api_client.force_authenticate(user=user)
+
+    start = (old.date - timedelta(days=5)).isoformat()
+    response = api_client.get(reverse('account-statement', kwargs={'pk': account.id}), {'export': 'ndjson', 'start': start})
+
+    assert response.status_code == status.HTTP_200_OK
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert len(rows) == 1
+    assert rows[0]['amount'] == '-30.00'
+    assert rows[0]['balance'] == '1070.00'
+
+
+@pytest.mark.django_db
+def test_account_statement_opens_from_the_snapshot(api_client, user, account, active_currency):
+    """Test that the opening balance starts from the latest snapshot before the start, not from the whole ledger."""
+    import json
+    from datetime import timedelta
+    from transactions.models import BalanceSnapshot, Transaction, LedgerEntry
+    credit = Transaction.objects.create(transaction_type='CREDIT', to_account=account, currency=active_currency, amount=Decimal('100.00'))
+    start = credit.date - timedelta(days=5)
+    LedgerEntry.objects.filter(account=account).exclude(transaction=credit).update(created_at=start - timedelta(days=10))
+    LedgerEntry.objects.filter(transaction=credit).update(created_at=start)
+    # a snapshot off the ledger shows which one the statement opened with
+    BalanceSnapshot.objects.create(account=account, balance=Decimal('900.00'), taken_at=start - timedelta(days=1))
+    BalanceSnapshot.objects.create(account=account, balance=Decimal('5000.00'), taken_at=start)
+    api_client.force_authenticate(user=user)
+
+    response = api_client.get(reverse('account-statement', kwargs={'pk': account.id}), {'export': 'ndjson', 'start': start.isoformat()})
+
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert [(row['amount'], row['balance']) for row in rows] == [('100.00', '1000.00')]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [{'start': 'yesterday'}, {'end': '2024-02-30T00:00:00'}, {'start': '2024-03-01', 'end': '2024-02-01'}])
+def test_account_statement_invalid_range(api_client, user, account, params):
+    """Test that unparseable, impossible or reversed dates are rejected."""
+    api_client.force_authenticate(user=user)
+    response = api_client.get(reverse('account-statement', kwargs={'pk': account.id}), params)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_bulk_approve_account_requests(api_client, create_admin_user, create_banker_user, active_currency, django_assert_max_num_queries):
+    """Bulk approval opens the accounts of the pending requests and reports the rest per id."""
+    api_client.force_authenticate(user=create_admin_user)
+    pending = [AccountRequest.objects.create(user=create_banker_user, initial_deposit=Decimal('100.00')) for _ in range(20)]
+    negative = AccountRequest.objects.create(user=create_banker_user, initial_deposit=Decimal('-1.00'))
+    done = AccountRequest.objects.create(user=create_banker_user, initial_deposit=Decimal('1.00'), status='REJECTED')
+    ids = [request.id for request in pending] + [negative.id, done.id]
+
+    # the statement count doesn't grow with the batch, savepoints and the cold currency and IBAN caches included
+    with django_assert_max_num_queries(11):
+        response = api_client.post(reverse('bulk-approve-account-requests'), data={"ids": ids}, format='json')
+
+    assert response.status_code == 207
+    assert [item["id"] for item in response.data["approved"]] == [request.id for request in pending]
+    assert {item["id"]: item["error"] for item in response.data["failed"]} == {
+        negative.id: "Initial deposit cannot be negative.",
+        done.id: "Request not found or already processed.",
+    }
+    assert AccountRequest.objects.filter(status='APPROVED').count() == 20
+    assert AccountRequest.objects.get(pk=negative.id).status == 'PENDING'
+    accounts = Account.objects.filter(user=create_banker_user)
+    assert accounts.count() == 20
+    assert len({account.iban for account in accounts}) == 20
+    assert all(account.ledger_entries.get().amount == Decimal('100.00') for account in accounts)
+
+
+@pytest.mark.django_db
+def test_bulk_approve_twice_processes_once(api_client, create_admin_user, create_banker_user, active_currency):
+    """Requests already claimed by an earlier call are not approved again."""
+    api_client.force_authenticate(user=create_admin_user)
+    request = AccountRequest.objects.create(user=create_banker_user, initial_deposit=Decimal('100.00'))
+    url = reverse('bulk-approve-account-requests')
+
+    assert api_client.post(url, data={"ids": [request.id]}, format='json').status_code == 200
+    response = api_client.post(url, data={"ids": [request.id]}, format='json')
+
+    assert response.status_code == 400
+    assert Account.objects.filter(user=create_banker_user).count() == 1
+
+
+@pytest.mark.django_db
+def test_bulk_reject_by_filter(api_client, create_admin_user, create_banker_user, active_currency):
+    """A filter picks the pending requests to reject, up to the limit."""
+    api_client.force_authenticate(user=create_admin_user)
+    for _ in range(3):
+        AccountRequest.objects.create(user=create_banker_user, initial_deposit=Decimal('10.00'), account_type='Savings')
+    other = AccountRequest.objects.create(user=create_banker_user, initial_deposit=Decimal('10.00'))
+
+    response = api_client.post(reverse('bulk-reject-account-requests'),
+                               data={"account_type": "Savings", "limit": 2, "description": "Campaign closed"}, format='json')
+
+    assert response.status_code == 200
+    assert len(response.data["rejected"]) == 2
+    assert AccountRequest.objects.filter(status='REJECTED', description='Campaign closed').count() == 2
+    assert AccountRequest.objects.get(pk=other.id).status == 'PENDING'
+
+
+@pytest.mark.django_db
+def test_bulk_approve_requires_selection(api_client, create_admin_user, create_customer_user):
+    """Customers can't bulk approve, and a call without ids or filter is rejected."""
+    api_client.force_authenticate(user=create_customer_user)
+    assert api_client.post(reverse('bulk-approve-account-requests'), data={"ids": [1]}, format='json').status_code == 403
+
+    api_client.force_authenticate(user=create_admin_user)
+    assert api_client.post(reverse('bulk-approve-account-requests'), data={}, format='json').status_code == 400
+
+
+@pytest.mark.django_db
+def test_bulk_approve_card_requests(api_client, create_admin_user, user, account, active_currency, django_assert_max_num_queries):
+    """Bulk issuance creates the cards, rejects low salaries in any currency and reports the rest."""
+    from accounts.cards import is_luhn_valid
+    api_client.force_authenticate(user=create_admin_user)
+    Currencies.objects.create(currency_name='Dollar', currency_code='USD', is_active=True)
+    Currencies.objects.create(currency_name='Yen', currency_code='JPY', is_active=True)
+    issued = [CardRequest.objects.create(account=account, user_salary=Decimal('600.00'), salary_currency_id='USD') for _ in range(10)]
+    low = CardRequest.objects.create(account=account, user_salary=Decimal('500.00'), salary_currency_id='USD')
+    no_rate = CardRequest.objects.create(account=account, user_salary=Decimal('900.00'), salary_currency_id='JPY')
+
+    with django_assert_max_num_queries(14):
+        response = api_client.post(reverse('bulk-approve-card-requests'), data={"requested_after": "2000-01-01T00:00:00Z"}, format='json')
+
+    assert response.status_code == 207
+    assert [item["id"] for item in response.data["issued"]] == [request.id for request in issued]
+    assert response.data["rejected"] == [low.id]
+    assert [item["id"] for item in response.data["failed"]] == [no_rate.id]
+    cards = Card.objects.filter(account=account)
+    assert cards.count() == 10
+    assert all(is_luhn_valid(card.card_number) for card in cards)
+    assert CardRequest.objects.get(pk=low.id).description == "Salary didn't meet the requirements"
+    assert CardRequest.objects.get(pk=no_rate.id).status == 'PENDING'
+
+
+@pytest.mark.django_db
+def test_work_queue_claims_are_exclusive(api_client, create_admin_user, create_banker_user, active_currency):
+    """Two bankers claiming from the queue get different requests, and only the lease holder can approve one."""
+    requests = [AccountRequest.objects.create(user=create_banker_user, initial_deposit=Decimal('10.00')) for _ in range(3)]
+    url = reverse('work-queue-claim')
+
+    api_client.force_authenticate(user=create_admin_user)
+    first = api_client.post(url, data={"queue": "account", "count": 2}, format='json')
+    api_client.force_authenticate(user=create_banker_user)
+    second = api_client.post(url, data={"queue": "account", "count": 2}, format='json')
+
+    assert first.status_code == second.status_code == 200
+    assert [item["id"] for item in first.data["requests"]] == [requests[0].id, requests[1].id]
+    assert [item["id"] for item in second.data["requests"]] == [requests[2].id]
+
+    response = api_client.post(reverse('approve-account-request', kwargs={'id': requests[0].id}))
+    assert response.status_code == 409
+    assert AccountRequest.objects.get(pk=requests[0].id).status == 'PENDING'
+
+    api_client.force_authenticate(user=create_admin_user)
+    response = api_client.post(reverse('approve-account-request', kwargs={'id': requests[0].id}))
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_work_queue_lease_expires(api_client, create_admin_user, create_banker_user, account):
+    """Requests of an expired lease go back to the queue."""
+    from django.utils import timezone
+    card_request = CardRequest.objects.create(account=account, user_salary=Decimal('600.00'))
+    url = reverse('work-queue-claim')
+
+    api_client.force_authenticate(user=create_admin_user)
+    assert len(api_client.post(url, data={"queue": "card"}, format='json').data["requests"]) == 1
+    api_client.force_authenticate(user=create_banker_user)
+    assert api_client.post(url, data={"queue": "card"}, format='json').data["requests"] == []
+
+    CardRequest.objects.filter(pk=card_request.pk).update(claim_expires_at=timezone.now())
+    assert len(api_client.post(url, data={"queue": "card"}, format='json').data["requests"]) == 1
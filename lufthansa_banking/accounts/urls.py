@@ -3,6 +3,10 @@ from .views import (
                     ApproveCardRequestView, 
                     ApproveAccountRequestView, 
                     RejectAccountRequestView, 
+                    BulkApproveAccountRequestView,
+                    BulkRejectAccountRequestView,
+                    BulkApproveCardRequestView,
+                    WorkQueueClaimView,
                     RejectCardRequestView, 
                     CardRequestViewSet, 
                     AccountRequestViewSet, 
@@ -19,9 +23,13 @@ router.register(r'accounts', AccountViewSet, basename='account')
 router.register(r'cards', CardViewSet, basename='card')
 
 urlpatterns = [
+    path('card/approve/bulk', BulkApproveCardRequestView.as_view(), name='bulk-approve-card-requests'),
     path('card/approve/<int:id>', ApproveCardRequestView.as_view(), name='approve-card-request'),
+    path('account/approve/bulk', BulkApproveAccountRequestView.as_view(), name='bulk-approve-account-requests'),
+    path('account/reject/bulk', BulkRejectAccountRequestView.as_view(), name='bulk-reject-account-requests'),
     path('account/approve/<int:id>', ApproveAccountRequestView.as_view(), name='approve-account-request'),
     path('account/reject/<int:id>', RejectAccountRequestView.as_view(), name='reject-account-request'),
     path('card/reject/<int:id>', RejectCardRequestView.as_view(), name='reject-card-request'),
+    path('work_queue/claim/', WorkQueueClaimView.as_view(), name='work-queue-claim'),
     path('', include(router.urls)),
 ]
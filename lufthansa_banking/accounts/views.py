@@ -1,8 +1,15 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.decorators import action
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from utils import logger
+from transactions.statements import RENDERERS, statement_rows
+from pagination import AccountPagination, CardPagination
 from .models import Account, AccountRequest, Card, CardRequest
-from .serializers import AccountSerializer, AccountRequestSerializer, CardSerializer, CardRequestSerializer
+from .serializers import AccountSerializer, AccountRequestSerializer, CardSerializer, CardRequestSerializer, BulkAccountRequestSerializer, BulkCardRequestSerializer, WorkQueueClaimSerializer, StatementSerializer
+from .bulk import approve_requests, reject_requests, issue_cards
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.exceptions import ValidationError
 
@@ -11,13 +18,14 @@ class AccountViewSet(ModelViewSet):
     """Viewset for Account model"""
     queryset = Account.objects.all()
     serializer_class = AccountSerializer
+    pagination_class = AccountPagination
 
     def create(self, request):
         """Account POST method"""
         if self.request.user.type == "CUSTOMER":
             return Response({"error": "Only bankers or admins can create accounts."}, status=403)
 
-        serializer = AccountSerializer(data=request.data)
+        serializer = self.get_serializer(data=request.data)
         try:
             serializer.is_valid(raise_exception=True)
             if request.user.type == 'CUSTOMER':
@@ -25,10 +33,10 @@ class AccountViewSet(ModelViewSet):
             serializer.save()
             return Response(serializer.data, status=201)
         except ValidationError as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').info(f"Account creation problem")
+            logger('ACCOUNTS').info("Account creation problem")
             return Response({"error": "Something went wrong"}, status=500)
     
     def update(self, request, *args, **kwargs):
@@ -44,12 +52,31 @@ class AccountViewSet(ModelViewSet):
             serializer.save() 
             return Response(serializer.data, status=200)
         except ValidationError as e:
-            logger('USERS').info(f"User update problem: {str(e)}")
+            logger('USERS').info("User update problem: %s", e)
             return Response({"error": str(e)}, status=400)
         except Exception as e:
-            logger('USERS').info(f"User update problem: {str(e)}")
+            logger('USERS').info("User update problem: %s", e)
             return Response({"error": "Something went wrong"}, status=400)
 
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Statement of the account between ?start= and ?end=, streamed as CSV or NDJSON (?export=csv|ndjson)"""
+        account = self.get_object()
+        export = request.query_params.get('export', 'csv')
+        if export not in RENDERERS:
+            return Response({"error": f"Unknown export format, use one of {', '.join(RENDERERS)}."}, status=400)
+
+        serializer = StatementSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=400)
+        start = serializer.validated_data.get('start', account.creation_date)
+        end = serializer.validated_data.get('end', timezone.now())
+
+        render, content_type = RENDERERS[export]
+        response = StreamingHttpResponse(render(statement_rows(account, start, end)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="statement-{account.pk}.{export}"'
+        return response
+
     def get_queryset(self):
         """GET, PUT, DELETE methods for Account"""
         try:
@@ -60,23 +87,22 @@ class AccountViewSet(ModelViewSet):
                 accounts = Account.objects.filter(user=user)
             else:
                 accounts = Account.objects.all()
-            if accounts.exists():
-                return accounts
-            raise Account.DoesNotExist
+            return accounts
         except Exception as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
-            return Card.objects.none()
+            logger('ACCOUNTS').error("Error: %s", e)
+            return Account.objects.none()
         
 class CardViewSet(ModelViewSet):
     """Viewset for Card model"""
     queryset = Card.objects.all()
     serializer_class = CardSerializer
+    pagination_class = CardPagination
 
     def create(self, request):
         """Card POST method"""
         if self.request.user.type == 'CUSTOMER':
             return Response({"error": "Customer can't create cards"}, 403)
-        serializer = CardSerializer(data=request.data)
+        serializer = self.get_serializer(data=request.data)
         try:
             serializer.is_valid(raise_exception=True)
             if self.request.user.type == "CUSTOMER":
@@ -85,10 +111,10 @@ class CardViewSet(ModelViewSet):
             serializer.save()
             return Response(serializer.data, status=201)
         except ValidationError as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').info(f"Card creation problem")
+            logger('ACCOUNTS').info("Card creation problem")
             return Response({"error": "Something went wrong"}, status=500)
     
     def update(self, request, *args, **kwargs):
@@ -104,10 +130,10 @@ class CardViewSet(ModelViewSet):
             serializer.save() 
             return Response(serializer.data, status=200)
         except ValidationError as e:
-            logger('USERS').info(f"User update problem: {str(e)}")
+            logger('USERS').info("User update problem: %s", e)
             return Response({"error": str(e)}, status=400)
         except Exception as e:
-            logger('USERS').info(f"User update problem: {str(e)}")
+            logger('USERS').info("User update problem: %s", e)
             return Response({"error": "Something went wrong"}, status=400)
 
     def get_queryset(self):
@@ -123,9 +149,9 @@ class CardViewSet(ModelViewSet):
             else:
                 cards = Card.objects.all()
 
-            return cards if cards.exists() else Card.DoesNotExist
+            return cards
         except Exception as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Card.objects.none()
 
 class AccountRequestViewSet(ModelViewSet):
@@ -139,10 +165,10 @@ class AccountRequestViewSet(ModelViewSet):
             serializer.save()
             return Response(serializer.data, status=201)
         except ValidationError as e:
-            logger('ACCOUNTS').info(f"Account request creation problem")
+            logger('ACCOUNTS').info("Account request creation problem")
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').info(f"Account request creation problem")
+            logger('ACCOUNTS').info("Account request creation problem")
             return Response({"error": "Something went wrong"}, status=500)
             
     def get_queryset(self):
@@ -158,10 +184,10 @@ class AccountRequestViewSet(ModelViewSet):
                 return account_request
             raise AccountRequest.DoesNotExist
         except ValidationError as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return AccountRequest.objects.none()
 
 class CardRequestViewSet(ModelViewSet):
@@ -178,7 +204,7 @@ class CardRequestViewSet(ModelViewSet):
         except ValidationError as e:
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').info(f"Card request creation problem")
+            logger('ACCOUNTS').info("Card request creation problem")
             return Response({"error": "Something went wrong"}, status=500)
             
     def get_queryset(self):
@@ -200,7 +226,7 @@ class CardRequestViewSet(ModelViewSet):
                 return card_request
             raise CardRequest.DoesNotExist
         except Exception as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return CardRequest.objects.none()
         
 
@@ -212,17 +238,21 @@ class ApproveAccountRequestView(APIView):
         if request.user.type == 'CUSTOMER':
             return Response({"error": "Customer can't approve account"}, 403)
         try:
-            account_request = AccountRequest.objects.get(pk=id, status='PENDING')
-            account_request.approve() 
+            with transaction.atomic():
+                # the row lock makes a concurrent approve or reject of the same request wait, then miss it
+                account_request = AccountRequest.objects.select_for_update().get(pk=id, status='PENDING')
+                if account_request.leased_to_other(request.user):
+                    return Response({"error": "Account request is claimed by another banker."}, status=409)
+                account_request.approve()
             return Response({"message": "Account request approved."}, status=200)
-        except AccountRequest.DoesNotExist:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+        except AccountRequest.DoesNotExist as e:
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Account request not found or already processed."}, status=404)
         except ValidationError as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Something went wrong"}, status=500)
         
 class RejectAccountRequestView(APIView):
@@ -233,19 +263,61 @@ class RejectAccountRequestView(APIView):
         if request.user.type == 'CUSTOMER':
             return Response({"error": "Customer can't reject accounts"}, 403)
         try:
-            account_request = AccountRequest.objects.get(pk=id, status='PENDING')
-            account_request.reject(request.data.get('description', ''))
+            with transaction.atomic():
+                account_request = AccountRequest.objects.select_for_update().get(pk=id, status='PENDING')
+                if account_request.leased_to_other(request.user):
+                    return Response({"error": "Account request is claimed by another banker."}, status=409)
+                account_request.reject(request.data.get('description', ''))
             return Response({"message": "Account request rejected."}, status=200)
-        except AccountRequest.DoesNotExist:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+        except AccountRequest.DoesNotExist as e:
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Account request not found or already processed."}, status=404)
         except ValidationError as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Something went wrong"}, status=500)
         
+class BulkApproveAccountRequestView(APIView):
+    """Approve many account requests at once"""
+    def post(self, request):
+        """POST method for approving the account requests picked by ids or a filter"""
+        if request.user.type == 'CUSTOMER':
+            return Response({"error": "Customer can't approve account"}, 403)
+
+        serializer = BulkAccountRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=400)
+        try:
+            approved, failed = approve_requests(serializer.get_queryset(request.user), serializer.validated_data.get('ids', ()))
+        except Exception as e:
+            logger('ACCOUNTS').error("Error: %s", e)
+            return Response({"error": "Something went wrong"}, status=500)
+
+        status = 200 if not failed else 207 if approved else 400
+        return Response({"approved": approved, "failed": failed}, status=status)
+
+class BulkRejectAccountRequestView(APIView):
+    """Reject many account requests at once"""
+    def post(self, request):
+        """POST method for rejecting the account requests picked by ids or a filter"""
+        if request.user.type == 'CUSTOMER':
+            return Response({"error": "Customer can't reject accounts"}, 403)
+
+        serializer = BulkAccountRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=400)
+        try:
+            data = serializer.validated_data
+            rejected, failed = reject_requests(serializer.get_queryset(request.user), data['description'], data.get('ids', ()))
+        except Exception as e:
+            logger('ACCOUNTS').error("Error: %s", e)
+            return Response({"error": "Something went wrong"}, status=500)
+
+        status = 200 if not failed else 207 if rejected else 400
+        return Response({"rejected": rejected, "failed": failed}, status=status)
+
 
 class ApproveCardRequestView(APIView):
     """Approve card request"""
@@ -255,19 +327,41 @@ class ApproveCardRequestView(APIView):
         if request.user.type == 'CUSTOMER':
             return Response({"error": "Customer can't approve cards"}, 403)
         try:
-            card_request = CardRequest.objects.get(pk=id, status='PENDING')
-            card_request.approve() 
+            with transaction.atomic():
+                card_request = CardRequest.objects.select_for_update().get(pk=id, status='PENDING')
+                if card_request.leased_to_other(request.user):
+                    return Response({"error": "Card request is claimed by another banker."}, status=409)
+                card_request.approve()
             return Response({"message": "Card request approved."}, status=200)
         except CardRequest.DoesNotExist:
-            logger('ACCOUNTS').error(f"Warning: card request does not exist")
+            logger('ACCOUNTS').error("Warning: card request does not exist")
             return Response({"error": "Card request not found or already processed."}, status=404)
         except ValidationError as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Something went wrong"}, status=500)
     
+class BulkApproveCardRequestView(APIView):
+    """Issue the cards of many card requests at once"""
+    def post(self, request):
+        """POST method for approving the card requests picked by ids or a filter, low salaries get rejected"""
+        if request.user.type == 'CUSTOMER':
+            return Response({"error": "Customer can't approve cards"}, 403)
+
+        serializer = BulkCardRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=400)
+        try:
+            issued, rejected, failed = issue_cards(serializer.get_queryset(request.user), serializer.validated_data.get('ids', ()))
+        except Exception as e:
+            logger('ACCOUNTS').error("Error: %s", e)
+            return Response({"error": "Something went wrong"}, status=500)
+
+        status = 200 if not failed else 207 if issued or rejected else 400
+        return Response({"issued": issued, "rejected": rejected, "failed": failed}, status=status)
+
 class RejectCardRequestView(APIView):
     """Reject card request"""
 
@@ -277,15 +371,44 @@ class RejectCardRequestView(APIView):
             return Response({"error": "Customer can't reject cards"}, 403)
         try:
 
-            card_request = CardRequest.objects.get(pk=id, status='PENDING')
-            card_request.reject(request.data.get('description', ''))
+            with transaction.atomic():
+                card_request = CardRequest.objects.select_for_update().get(pk=id, status='PENDING')
+                if card_request.leased_to_other(request.user):
+                    return Response({"error": "Card request is claimed by another banker."}, status=409)
+                card_request.reject(request.data.get('description', ''))
             return Response({"message": "Card request rejected."}, status=200)
-        except CardRequest.DoesNotExist:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+        except CardRequest.DoesNotExist as e:
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Card request not found or already processed."}, status=404)
         except ValidationError as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
+            logger('ACCOUNTS').error("Error: %s", e)
             return Response({"error": "Couldn't validate"}, status=400)
         except Exception as e:
-            logger('ACCOUNTS').error(f"Error: {str(e)}")
-            return Response({"error": "Something went wrong"}, status=500)
\ No newline at end of file
+            logger('ACCOUNTS').error("Error: %s", e)
+            return Response({"error": "Something went wrong"}, status=500)
+
+
+class WorkQueueClaimView(APIView):
+    """Hands a banker the next pending requests, leased to them for WORK_QUEUE_LEASE"""
+    QUEUES = {
+        'account': (AccountRequest, AccountRequestSerializer),
+        'card': (CardRequest, CardRequestSerializer),
+    }
+
+    def post(self, request):
+        """POST method claiming the next count account or card requests"""
+        if request.user.type == 'CUSTOMER':
+            return Response({"error": "Customer can't work requests"}, 403)
+
+        claim = WorkQueueClaimSerializer(data=request.data)
+        if not claim.is_valid():
+            return Response({"error": claim.errors}, status=400)
+        try:
+            model, serializer_class = self.QUEUES[claim.validated_data['queue']]
+            requests, expires_at = model.claim_next(request.user, claim.validated_data['count'])
+        except Exception as e:
+            logger('ACCOUNTS').error("Error: %s", e)
+            return Response({"error": "Something went wrong"}, status=500)
+
+        serializer = serializer_class(requests, many=True, context={'request': request})
+        return Response({"claim_expires_at": expires_at, "requests": serializer.data}, status=200)
@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+from decimal import Decimal
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+from accounts.models import Account, AccountRequest, CardRequest
+from transactions.models import Transaction
+from users.models import CustomUser
+from utils import convert_currency
+
+# The benchmarked operations. Each case returns the latencies of its operations in seconds, paired with
+# the wall clock time when the operations overlap, and raises Skip when it can't run on this database
+
+
+class Skip(Exception):
+    pass
+
+
+def timed(operation, iterations, setup=None):
+    """Latency of every call of operation, setup runs before each call and is not timed"""
+    latencies = []
+    for _ in range(iterations):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        operation(argument) if setup else operation()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def summarize(latencies, wall=None):
+    ordered = sorted(latencies)
+    percentile = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+    return {
+        'iterations': len(ordered),
+        'ops_per_sec': round(len(ordered) / (wall or sum(ordered)), 2),
+        'p50_ms': round(percentile(0.50) * 1000, 3),
+        'p99_ms': round(percentile(0.99) * 1000, 3),
+    }
+
+
+def succeeded(response):
+    """A failing request would be timed as a fast one, stop the run instead"""
+    assert response.status_code < 400, f"{response.status_code} {getattr(response, 'data', '')}"
+    return response
+
+
+class Context:
+    """Seeded rows and clients shared by the cases"""
+    def __init__(self, users, accounts, seed=0):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.accounts = accounts
+        self.banker = CustomUser.objects.create_user(username='bench-banker', email='banker@bench.test', password='x', type='BANKER')
+        self.client = APIClient()
+
+    def account_pair(self):
+        return self.rng.sample(self.accounts, 2)
+
+    def as_user(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client
+
+
+def transaction_create(transaction_type):
+    def case(context, iterations):
+        def create():
+            from_account, to_account = context.account_pair()
+            Transaction.objects.create(
+                transaction_type=transaction_type,
+                from_account=from_account if transaction_type in ('DEBIT', 'TRANSFER') else None,
+                to_account=to_account if transaction_type in ('CREDIT', 'TRANSFER') else None,
+                currency_id=(from_account if transaction_type == 'DEBIT' else to_account).currency_id, amount=Decimal('25.00'),
+            )
+        return timed(create, iterations)
+    return case
+
+
+def transfer_contention(context, iterations, threads=8, hot_accounts=4):
+    """Transfers of many threads between a handful of accounts, they all wait on the same row locks"""
+    if connection.vendor == 'sqlite':
+        raise Skip("needs concurrent writers, run it against postgres")
+    accounts = context.accounts[:hot_accounts]
+    latencies, lock = [], threading.Lock()
+
+    def worker(seed):
+        from django.db import connection as thread_connection
+        rng = random.Random(seed)
+        mine = []
+        try:
+            for _ in range(iterations // threads):
+                from_account, to_account = rng.sample(accounts, 2)
+                start = time.perf_counter()
+                Transaction.objects.create(transaction_type='TRANSFER', from_account=from_account, to_account=to_account,
+                                           currency_id=from_account.currency_id, amount=Decimal('1.00'))
+                mine.append(time.perf_counter() - start)
+        finally:
+            thread_connection.close()
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def account_list(context, iterations):
+    client = context.as_user(context.banker)
+    return timed(lambda: succeeded(client.get(reverse('account-list'))), iterations)
+
+
+def transaction_list(context, iterations):
+    """A customer's own history, the UNION of incoming and outgoing transactions"""
+    client = context.as_user(context.accounts[0].user)
+    return timed(lambda: succeeded(client.get(reverse('transaction-list'))), iterations)
+
+
+def account_request_approval(context, iterations):
+    client = context.as_user(context.banker)
+    pending = lambda: AccountRequest.objects.create(user=context.rng.choice(context.users), initial_deposit=Decimal('100.00'))
+    return timed(lambda request: succeeded(client.post(reverse('approve-account-request', kwargs={'id': request.pk}))), iterations, setup=pending)
+
+
+def card_request_approval(context, iterations):
+    client = context.as_user(context.banker)
+    pending = lambda: CardRequest.objects.create(account=context.rng.choice(context.accounts), user_salary=Decimal('900.00'))
+    return timed(lambda request: succeeded(client.post(reverse('approve-card-request', kwargs={'id': request.pk}))), iterations, setup=pending)
+
+
+def currency_conversion(context, iterations):
+    pairs = [('USD', 'EUR'), ('EUR', 'ALL'), ('ALL', 'USD'), ('EUR', 'EUR')]
+    amount = Decimal('123.45')
+    # a conversion is cheap, time it a hundred at a time
+    return [latency / 100 for latency in timed(lambda: [convert_currency(amount, *pair) for pair in pairs * 25], iterations)]
+
+
+CASES = {
+    'transaction_create_credit': transaction_create('CREDIT'),
+    'transaction_create_debit': transaction_create('DEBIT'),
+    'transaction_create_transfer': transaction_create('TRANSFER'),
+    'transfer_contention': transfer_contention,
+    'account_list': account_list,
+    'transaction_list': transaction_list,
+    'account_request_approval': account_request_approval,
+    'card_request_approval': card_request_approval,
+    'convert_currency': currency_conversion,
+}
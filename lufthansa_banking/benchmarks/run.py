@@ -0,0 +1,114 @@
+"""
+Benchmarks of the core banking operations.
+
+    BENCH_DB=sqlite python -m benchmarks.run --output results.json
+    BENCH_DB=postgres python -m benchmarks.run --accounts 10000 --transactions 100000 --compare baseline.json
+
+The database is migrated and seeded first (sqlite runs in memory, postgres should be an empty scratch database),
+then every case runs and the ops/sec and p50/p99 latencies are written as JSON. With --compare the run fails
+when a case got slower than --tolerance compared to an earlier result file.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the core banking operations")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=200, help="Operations timed per case")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cases', nargs='*', help="Only run these cases")
+    parser.add_argument('--output', help="JSON file for the results, printed when missing")
+    parser.add_argument('--compare', help="Earlier results to compare the p50 latencies with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p50 slowdown before --compare fails")
+    return parser.parse_args(argv)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(options, log=print):
+    """Seed the database and run the cases, returns the results document"""
+    from django.db import connection
+    from .cases import CASES, Context, Skip, summarize
+    from .seed import seed
+
+    log(f"Seeding {options.users} users, {options.accounts} accounts and {options.transactions} transactions")
+    users, accounts = seed(options.users, options.accounts, options.transactions, seed=options.seed)
+    context = Context(users, accounts, seed=options.seed)
+
+    results = {}
+    for name, case in CASES.items():
+        if options.cases and name not in options.cases:
+            continue
+        try:
+            outcome = case(context, options.iterations)
+        except Skip as e:
+            log(f"{name}: skipped, {e}")
+            results[name] = {'skipped': str(e)}
+            continue
+        latencies, wall = outcome if isinstance(outcome, tuple) else (outcome, None)
+        results[name] = summarize(latencies, wall)
+        log(f"{name}: {results[name]['ops_per_sec']} ops/s, p50 {results[name]['p50_ms']} ms, p99 {results[name]['p99_ms']} ms")
+
+    return {
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'volumes': {'users': options.users, 'accounts': options.accounts, 'transactions': options.transactions},
+        'iterations': options.iterations,
+        'results': results,
+    }
+
+
+def regressions(document, baseline, tolerance):
+    """The cases whose p50 grew by more than tolerance compared to the baseline results"""
+    slower = []
+    for name, result in document['results'].items():
+        before = baseline['results'].get(name, {})
+        if 'p50_ms' in result and before.get('p50_ms') and result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            slower.append(f"{name}: p50 {before['p50_ms']} ms -> {result['p50_ms']} ms")
+    return slower
+
+
+def main(argv=None):
+    options = parse_args(argv)
+
+    import django
+    from django.core.management import call_command
+    django.setup()
+    call_command('migrate', verbosity=0)
+
+    document = run_suite(options)
+    output = json.dumps(document, indent=2)
+    if options.output:
+        with open(options.output, 'w') as results:
+            results.write(output + '\n')
+    else:
+        print(output)
+
+    if options.compare:
+        with open(options.compare) as baseline:
+            slower = regressions(document, json.load(baseline), options.tolerance)
+        for line in slower:
+            print(f"Regression {line}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import random
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from accounts.models import Account, Currencies
+from transactions.models import Transaction
+from users.models import CustomUser
+
+# Deterministic data set of the benchmarks, the same volumes and seed give the same rows
+
+CURRENCIES = [('EUR', 'Euro'), ('USD', 'Dollar'), ('ALL', 'Lek')]
+BATCH_SIZE = 1000
+
+
+def seed(users, accounts, transactions, seed=0):
+    """Create the users, their accounts and transfers between them, returns (users, accounts)"""
+    rng = random.Random(seed)
+    for code, name in CURRENCIES:
+        Currencies.objects.get_or_create(currency_code=code, defaults={'currency_name': name, 'is_active': True})
+
+    # one hash for everybody, hashing is not what is measured
+    password = make_password('benchmark')
+    created_users = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench{i}', email=f'bench{i}@bench.test', password=password, type='CUSTOMER')
+        for i in range(users)
+    ], batch_size=BATCH_SIZE)
+
+    created_accounts = []
+    for start in range(0, accounts, BATCH_SIZE):
+        created_accounts += Account.open_many([
+            Account(user=rng.choice(created_users), currency_id=rng.choice(CURRENCIES)[0], balance=Decimal('100000.00'))
+            for _ in range(start, min(start + BATCH_SIZE, accounts))
+        ])
+
+    # amounts are in the currency of the sending account, so no account is drained by the exchange rates
+    for start in range(0, transactions, BATCH_SIZE):
+        Transaction.create_batch([
+            {'from_account': from_account.pk, 'to_account': to_account.pk, 'currency': from_account.currency_id,
+             'transaction_type': 'TRANSFER', 'amount': Decimal(rng.randint(21, 500))}
+            for from_account, to_account in (rng.sample(created_accounts, 2) for _ in range(start, min(start + BATCH_SIZE, transactions)))
+        ])
+    return created_users, created_accounts
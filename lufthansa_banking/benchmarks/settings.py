@@ -0,0 +1,33 @@
+import os
+from lufthansa_banking.settings import *  # noqa: F401,F403
+
+# Settings of the benchmark runs: BENCH_DB=sqlite (in memory, the default) or postgres,
+# the postgres connection comes from the BENCH_DB_* variables and falls back to the project database, whatever its engine
+
+if os.environ.get('BENCH_DB', 'sqlite') == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('BENCH_DB_NAME', 'lufthansa_banking_bench'),
+            'USER': os.environ.get('BENCH_DB_USER', DATABASES['default'].get('USER', '')),
+            'PASSWORD': os.environ.get('BENCH_DB_PASSWORD', DATABASES['default'].get('PASSWORD', '')),
+            'HOST': os.environ.get('BENCH_DB_HOST', DATABASES['default'].get('HOST', '')),
+            'PORT': os.environ.get('BENCH_DB_PORT', DATABASES['default'].get('PORT', '')),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+    }
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver']
+
+# hashing is not what is measured
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+LOG_LEVELS = {name: 'WARNING' for name in LOG_LEVELS}
+LOGGING['loggers'] = {name: {'level': level} for name, level in LOG_LEVELS.items()}
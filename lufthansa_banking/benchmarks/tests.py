@@ -0,0 +1,52 @@
+import importlib
+import pytest
+from accounts.models import Account
+from lufthansa_banking import settings as project_settings
+from transactions.models import LedgerEntry
+from . import settings as bench_settings
+from .cases import CASES, summarize
+from .run import parse_args, regressions, run_suite
+from .seed import seed
+
+
+@pytest.mark.django_db
+def test_seed_balances_match_the_ledger():
+    """Every seeded balance is the sum of its ledger entries"""
+    users, accounts = seed(3, 10, 50, seed=1)
+    assert len(users) == 3 and len(accounts) == 10
+    for account in Account.objects.all():
+        assert account.balance == sum(entry.amount for entry in LedgerEntry.objects.filter(account=account))
+
+
+@pytest.mark.django_db
+def test_run_suite_reports_every_case():
+    """A tiny run goes through all the cases, the ones that can't run here are reported as skipped"""
+    document = run_suite(parse_args(['--users', '2', '--accounts', '5', '--transactions', '10', '--iterations', '3']), log=lambda line: None)
+    assert set(document['results']) == set(CASES)
+    assert document['results']['transfer_contention'] == {'skipped': 'needs concurrent writers, run it against postgres'}
+    assert document['results']['transaction_create_transfer']['iterations'] == 3
+
+
+def test_summarize_and_regressions():
+    """Percentiles come from the sorted latencies, only slowdowns past the tolerance count as regressions"""
+    summary = summarize([0.004, 0.001, 0.002, 0.003])
+    assert summary == {'iterations': 4, 'ops_per_sec': 400.0, 'p50_ms': 3.0, 'p99_ms': 4.0}
+
+    baseline = {'results': {'a': {'p50_ms': 10.0}, 'b': {'p50_ms': 10.0}, 'c': {'skipped': 'sqlite'}}}
+    current = {'results': {'a': {'p50_ms': 11.0}, 'b': {'p50_ms': 13.0}, 'c': {'skipped': 'sqlite'}}}
+    assert regressions(current, baseline, tolerance=0.2) == ['b: p50 10.0 ms -> 13.0 ms']
+
+
+def test_postgres_settings_over_sqlite_project(monkeypatch):
+    """The postgres benchmark settings load while the project database is sqlite, which has no USER or HOST"""
+    # django fills the missing keys of the configured databases in, start from the bare sqlite config
+    monkeypatch.setattr(project_settings, 'DATABASES', {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}})
+    monkeypatch.setenv('BENCH_DB', 'postgres')
+    monkeypatch.setenv('BENCH_DB_HOST', 'bench-db')
+    try:
+        importlib.reload(bench_settings)
+        assert bench_settings.DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+        assert bench_settings.DATABASES['default']['HOST'] == 'bench-db'
+    finally:
+        monkeypatch.undo()
+        importlib.reload(bench_settings)
@@ -0,0 +1,55 @@
+import csv
+import io
+from django.db import connection, transaction
+
+# Loading generated rows in bulk: COPY ... FROM STDIN on postgres, bulk_create / bulk_update everywhere else.
+# Rows are tuples holding the values of the listed fields (attnames, so foreign keys are given by id)
+
+
+def supports_copy():
+    return connection.vendor == 'postgresql'
+
+
+def csv_buffer(rows):
+    """The rows as an in-memory CSV file, None is written as an empty field which COPY reads as NULL"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(table, columns, rows):
+    """COPY the rows into the table in a single round trip"""
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {quote(table)} ({', '.join(map(quote, columns))}) FROM STDIN WITH (FORMAT csv)", csv_buffer(rows))
+
+
+def write_rows(model, fields, rows, batch_size=5000):
+    """Insert the rows without going through save, signals or auto_now fields"""
+    if supports_copy():
+        copy_rows(model._meta.db_table, [model._meta.get_field(field).column for field in fields], rows)
+    else:
+        model.objects.bulk_create([model(**dict(zip(fields, row))) for row in rows], batch_size=batch_size)
+
+
+def update_field(model, field, values, batch_size=1000):
+    """Set the field of many rows, values maps primary keys to the new values.
+    On postgres the values are copied into a temporary table and applied with one UPDATE ... FROM"""
+    if not supports_copy():
+        model.objects.bulk_update([model(pk=pk, **{field: value}) for pk, value in values.items()], [field], batch_size=batch_size)
+        return
+
+    quote = connection.ops.quote_name
+    pk, target = model._meta.pk, model._meta.get_field(field)
+    table = quote(model._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE bulk_update_values (pk {pk.db_type(connection)}, value {target.db_type(connection)}) ON COMMIT DROP"
+        )
+        cursor.copy_expert("COPY bulk_update_values (pk, value) FROM STDIN WITH (FORMAT csv)", csv_buffer(values.items()))
+        cursor.execute(
+            f"UPDATE {table} SET {quote(target.column)} = bulk_update_values.value FROM bulk_update_values "
+            f"WHERE {table}.{quote(pk.column)} = bulk_update_values.pk"
+        )
+        cursor.execute("DROP TABLE bulk_update_values")
@@ -0,0 +1,50 @@
+import pytest
+from rest_framework.test import APIClient
+from accounts.iban import iban_allocator
+from accounts.rates import exchange_rates
+from accounts.registry import currency_registry
+from users.authentication import validated_tokens
+from metrics import registry as metrics_registry
+from users.models import CustomUser
+
+
+@pytest.fixture(autouse=True)
+def clear_process_caches():
+    """Process local caches would otherwise keep rows of rolled back test transactions"""
+    exchange_rates.invalidate()
+    currency_registry.invalidate()
+    iban_allocator.invalidate()
+    validated_tokens.invalidate()
+    metrics_registry.reset()
+    yield
+    exchange_rates.invalidate()
+    currency_registry.invalidate()
+    iban_allocator.invalidate()
+    validated_tokens.invalidate()
+
+
+@pytest.fixture
+def query_budget():
+    """query_budget('TransactionViewSet.list') or query_budget(3) as a context manager, see query_budget.py"""
+    from query_budget import query_budget
+    return query_budget
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def customer():
+    return CustomUser.objects.create_user(email='user@test.com', username='customer', password='password', type='CUSTOMER')
+
+
+@pytest.fixture
+def banker():
+    return CustomUser.objects.create_user(email='banker@test.com', username='banker', password='password', type='BANKER')
+
+
+@pytest.fixture
+def admin_user():
+    return CustomUser.objects.create_user(email='admin@test.com', username='admin', password='password', type='ADMIN')
@@ -0,0 +1,67 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+# Logging pipeline wired up by settings.LOGGING: callers only put records on an in-memory queue,
+# a background thread turns them into JSON lines and appends them to the log file. Every worker process
+# appends to the same file, so none of them rotates it: logrotate (or the like) moves it away and each
+# process reopens the file once it notices
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueuedFileHandler(QueueHandler):
+    """
+    Handler of the request threads, it never touches the file: the record is queued and a QueueListener
+    thread formats and writes it. Only the %s arguments are merged into the message before queueing,
+    so objects changed afterwards are logged as they were. Records below a logger's level are dropped
+    before any formatting happens. A forked worker starts its own listener.
+    """
+    def __init__(self, filename):
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self.file_handler = WatchedFileHandler(filename, encoding='utf-8', delay=True)
+        self.file_handler.setFormatter(JsonFormatter())
+        super().__init__(queue.SimpleQueue())
+        self.start()
+        os.register_at_fork(after_in_child=self.start)
+        atexit.register(self.stop)
+
+    def start(self):
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, self.file_handler, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """Write out what is still queued"""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            # tracebacks keep whole frames alive, the text is all the listener needs
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
@@ -14,3 +14,6 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lufthansa_banking.settings')
 
 application = get_asgi_application()
+
+from accounts.registry import warm_caches
+warm_caches()
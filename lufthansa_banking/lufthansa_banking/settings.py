@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+import os
 import sys
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 CORS_ALLOW_ALL_ORIGINS = True
 
 MIDDLEWARE = [
+    'metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -148,7 +150,7 @@ REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
     # or allow read-only access for unauthenticated users.
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.TokenUserAuthentication',
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',    
     ],
@@ -159,6 +161,34 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Keyset pagination of the transaction, account and card listings (see pagination.py),
+# clients can ask for another page size with ?page_size= up to the max
+KEYSET_PAGE_SIZE = 100
+KEYSET_MAX_PAGE_SIZE = 1000
+
+# Rows fetched per round trip when streaming account statements
+STATEMENT_CHUNK_SIZE = 2000
+
+# Balance snapshots (see the snapshot_balances command): how often they are taken, and how far behind
+# real time they are taken so transactions that are still in flight have committed
+BALANCE_SNAPSHOT_INTERVAL = timedelta(days=1)
+BALANCE_SNAPSHOT_DELAY = timedelta(minutes=5)
+
+# Seconds a worker keeps its exchange rates before reloading them, the bound on how long
+# a rate update takes to reach every worker
+EXCHANGE_RATE_CACHE_TTL = 60
+
+# Same for the currency registry (the active flags of the currencies)
+CURRENCY_CACHE_TTL = 60
+
+# Accounts converted per committed batch when a currency is retired
+CURRENCY_RETIREMENT_BATCH_SIZE = 10000
+
+# IBANs of new accounts: country and bank code, and how many account numbers a worker reserves at once
+IBAN_COUNTRY_CODE = 'DE'
+IBAN_BANK_CODE = '20040000'
+IBAN_BLOCK_SIZE = 1000
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),   # Short-lived access tokens
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),     # Long-lived refresh tokens
@@ -167,7 +197,76 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),                # Token will be passed in Authorization header as Bearer token
 }
 
-if 'pytest' in sys.modules:
+# Bulk user import: users per committed batch, password hashing processes (0 hashes in process),
+# the processes of an import uploaded to the API and how many rejected rows are reported back
+USER_IMPORT_BATCH_SIZE = 1000
+USER_IMPORT_WORKERS = os.cpu_count() or 1
+USER_IMPORT_REQUEST_WORKERS = 0
+USER_IMPORT_MAX_ERRORS = 100
+
+# Logging, JSON lines written by a background thread (logs.QueuedFileHandler) to a file rotated by logrotate,
+# the processes reopen it once it was moved. The file defaults to the git-ignored logs/ directory, the level
+# of each of our loggers can be set here without touching the others
+LOG_FILE = os.environ.get('LOG_FILE', str(BASE_DIR / 'logs' / 'lufthansa_banking.log'))
+LOG_LEVELS = {
+    'ACCOUNTS': 'INFO',
+    'USERS': 'INFO',
+    'TRANSACTIONS': 'INFO',
+    'METRICS': 'INFO',
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queued_file': {
+            '()': 'logs.QueuedFileHandler',
+            'filename': LOG_FILE,
+        },
+    },
+    'root': {'handlers': ['queued_file'], 'level': 'WARNING'},
+    'loggers': {name: {'level': level} for name, level in LOG_LEVELS.items()},
+}
+
+# Request metrics served at /metrics: latency histogram buckets in seconds, the bearer token the scraper
+# must send (without one /metrics is only served when DEBUG is on) and the duration from which a request is logged with its SQL (off when None)
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_SLOW_REQUEST_SECONDS = None
+
+# Validated access tokens kept in memory by users.authentication.TokenUserAuthentication
+JWT_VALIDATION_CACHE_SIZE = 10000
+
+# How Transaction.save moves money: 'LOCKING' locks both accounts with SELECT ... FOR UPDATE,
+# 'CONDITIONAL_UPDATE' applies the moves as single UPDATE ... SET balance = balance +/- X statements
+TRANSACTION_EXECUTION_MODE = 'LOCKING'
+
+# Upper bound on the number of transactions accepted by /transactions/transactions/batch/
+TRANSACTION_BATCH_MAX_SIZE = 10000
+
+# Upper bound on the account or card requests handled by one bulk call
+BULK_REQUEST_MAX_SIZE = 10000
+
+# How long requests claimed from the banker work queue stay reserved, and how many one claim may take
+WORK_QUEUE_LEASE = timedelta(minutes=15)
+WORK_QUEUE_MAX_CLAIM = 100
+
+# Leading digits of the card numbers we issue
+CARD_BIN = '412345'
+
+# seed_bank: transactions generated and written per chunk, and the processes writing them (postgres only, 0 writes in process)
+SEED_BANK_CHUNK_SIZE = 50000
+SEED_BANK_WORKERS = os.cpu_count() or 1
+
+# import_transactions: rows read from the file and copied (or created without COPY) at once
+TRANSACTION_IMPORT_BATCH_SIZE = 10000
+
+# How many months of transaction partitions partition_transactions keeps created ahead of the current one
+TRANSACTION_PARTITION_MONTHS_AHEAD = 3
+
+# The tests run on an in-memory sqlite database, TEST_DB=postgres runs them on the postgres above instead
+# (docker compose up -d db), which the row locking, query plan and partitioning tests need
+if 'pytest' in sys.modules and os.environ.get('TEST_DB', 'sqlite') != 'postgres':
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
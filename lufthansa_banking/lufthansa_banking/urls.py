@@ -22,6 +22,7 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from users.views import CustomTokenObtainPairView
+from metrics import metrics_view
 
 
 urlpatterns = [
@@ -31,4 +32,5 @@ urlpatterns = [
     path('users/', include('users.urls')),
     path('accounts/', include('accounts.urls')),
     path('transactions/', include('transactions.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
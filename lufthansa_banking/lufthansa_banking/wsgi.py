@@ -14,3 +14,6 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lufthansa_banking.settings')
 
 application = get_wsgi_application()
+
+from accounts.registry import warm_caches
+warm_caches()
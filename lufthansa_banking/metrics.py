@@ -0,0 +1,162 @@
+import bisect
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from utils import logger
+
+# Per view request metrics, kept in process memory and exposed at /metrics in the Prometheus text format.
+# Every worker process has its own numbers, the scraper sums them up per instance
+
+
+class ViewStats:
+    def __init__(self, buckets):
+        self.latency_buckets = [0] * len(buckets)
+        self.latency_sum = 0.0
+        self.count = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.responses = {}
+
+    def observe(self, view, method, status, seconds, queries, db_seconds, response_bytes):
+        buckets = settings.METRICS_LATENCY_BUCKETS
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats(buckets)
+            position = bisect.bisect_left(buckets, seconds)
+            if position < len(buckets):
+                stats.latency_buckets[position] += 1
+            stats.latency_sum += seconds
+            stats.count += 1
+            stats.queries += queries
+            stats.db_seconds += db_seconds
+            stats.response_bytes += response_bytes
+            key = (view, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        buckets = settings.METRICS_LATENCY_BUCKETS
+        with self.lock:
+            views = sorted((view, vars(stats).copy()) for view, stats in self.views.items())
+            responses = sorted(self.responses.items())
+
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by view',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for view, stats in views:
+            cumulative = 0
+            for bound, count in zip(buckets, stats['latency_buckets']):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{view="{escape(view)}",le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{view="{escape(view)}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{view="{escape(view)}"}} {stats["latency_sum"]}')
+            lines.append(f'http_request_duration_seconds_count{{view="{escape(view)}"}} {stats["count"]}')
+
+        for name, field, help_text in [
+            ('db_queries_total', 'queries', 'SQL statements run by view'),
+            ('db_query_duration_seconds_total', 'db_seconds', 'Time spent in SQL by view'),
+            ('http_response_size_bytes_total', 'response_bytes', 'Bytes of the non streaming responses by view'),
+        ]:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{{view="{escape(view)}"}} {stats[field]}' for view, stats in views]
+
+        lines += ['# HELP http_requests_total Responses by view, method and status', '# TYPE http_requests_total counter']
+        lines += [
+            f'http_requests_total{{view="{escape(view)}",method="{method}",status="{status}"}} {count}'
+            for (view, method, status), count in responses
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+            self.responses.clear()
+
+
+registry = MetricsRegistry()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def view_name(request):
+    """ViewSet.action or APIView.method of the resolved view, like TransactionViewSet.create"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+    if view_class is None:
+        return f"{match.func.__module__}.{match.func.__name__}"
+    actions = getattr(match.func, 'actions', None)
+    method = request.method.lower()
+    return f"{view_class.__name__}.{actions.get(method, method) if actions else method}"
+
+
+class QueryRecorder:
+    """connection.execute_wrapper counting the statements and their time, keeping the SQL only when asked to"""
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if self.statements is not None:
+                self.statements.append((sql, elapsed))
+
+
+class MetricsMiddleware:
+    """Records latency, SQL count and time and response size of every request under its view name"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_seconds = settings.METRICS_SLOW_REQUEST_SECONDS
+        recorder = QueryRecorder(keep_sql=slow_seconds is not None)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - start
+
+        view = view_name(request)
+        response_bytes = 0 if response.streaming else len(response.content)
+        registry.observe(view, request.method, response.status_code, seconds, recorder.count, recorder.seconds, response_bytes)
+
+        if slow_seconds is not None and seconds >= slow_seconds:
+            logger('METRICS').warning(
+                "Slow request %s %s (%s) took %.3fs with %s queries: %s",
+                request.method, request.path, view, seconds, recorder.count,
+                [{'sql': sql, 'seconds': round(elapsed, 6)} for sql, elapsed in recorder.statements],
+            )
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint behind the METRICS_TOKEN bearer token, only open without one when DEBUG is on"""
+    if not settings.METRICS_TOKEN:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif request.headers.get('Authorization') != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
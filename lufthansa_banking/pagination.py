@@ -0,0 +1,110 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Keyset pagination classes shared by the list endpoints
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination, every page continues right after the last row of the previous one
+    with a WHERE on the ordering columns instead of an OFFSET, so page N costs the same as page 1.
+    The ordering has to end with a unique column, the cursor is the opaque encoded position of the last row.
+    """
+    ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        # one extra row tells if there is a next page
+        results = list(queryset[:self.page_size + 1])
+        self.next_position = self.position_of(results[self.page_size - 1]) if len(results) > self.page_size else None
+        return results[:self.page_size]
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        """Page size from the query string, capped by KEYSET_MAX_PAGE_SIZE"""
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, settings.KEYSET_PAGE_SIZE))
+        except ValueError:
+            page_size = settings.KEYSET_PAGE_SIZE
+        return max(1, min(page_size, settings.KEYSET_MAX_PAGE_SIZE))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    @property
+    def fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def position_of(self, instance):
+        return [getattr(instance, field) for field in self.fields]
+
+    def after(self, position):
+        """Lexicographic 'comes after' filter: (a > x) or (a = x and b > y) ..."""
+        condition = Q()
+        equal = {}
+        for ordering, field, value in zip(self.ordering, self.fields, position):
+            lookup = 'lt' if ordering.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def encode_cursor(self, position):
+        data = json.dumps([str(value) for value in position])
+        return urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        """Turn the cursor back into typed values, the model fields do the parsing"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+
+class TransactionPagination(KeysetPagination):
+    """Newest transactions first"""
+    ordering = ('-date', '-id')
+
+
+class AccountPagination(KeysetPagination):
+    ordering = ('creation_date', 'id')
+
+
+class CardPagination(KeysetPagination):
+    ordering = ('card_number',)
@@ -0,0 +1,96 @@
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+from metrics import QueryRecorder
+
+# Query budgets for the test suite: the statements run inside a block are recorded, the block fails when
+# they are more than the budget or when one statement shape keeps coming back (a suspected N+1)
+
+# Baseline budgets of the API endpoints by view name, the same names /metrics reports.
+# Measured with several rows in every table, so a budget only holds if the cost doesn't grow with the rows
+BUDGETS = {
+    'AccountViewSet.list': 1,
+    'AccountViewSet.retrieve': 1,
+    'AccountViewSet.create': 4,
+    'AccountViewSet.partial_update': 2,
+    'AccountViewSet.destroy': 8,
+    'AccountViewSet.statement': 4,
+    'CardViewSet.list': 1,
+    'CardViewSet.retrieve': 1,
+    'CardViewSet.create': 3,
+    'CardViewSet.partial_update': 2,
+    'CardViewSet.destroy': 2,
+    'AccountRequestViewSet.list': 2,
+    'AccountRequestViewSet.retrieve': 2,
+    'AccountRequestViewSet.create': 3,
+    'CardRequestViewSet.list': 2,
+    'CardRequestViewSet.retrieve': 2,
+    'CardRequestViewSet.create': 6,
+    'ApproveAccountRequestView.post': 6,
+    'RejectAccountRequestView.post': 2,
+    'ApproveCardRequestView.post': 5,
+    'RejectCardRequestView.post': 2,
+    'BulkApproveAccountRequestView.post': 4,
+    'BulkRejectAccountRequestView.post': 1,
+    'BulkApproveCardRequestView.post': 5,
+    'WorkQueueClaimView.post': 3,
+    'TransactionViewSet.list': 1,
+    'TransactionViewSet.retrieve': 2,
+    'TransactionViewSet.create': 9,  # with the first load of the currency registry and exchange rates
+    'TransactionViewSet.partial_update': 10,
+    'TransactionViewSet.destroy': 3,
+    'TransactionViewSet.batch': 4,
+    'UserViewSet.list': 2,
+    'UserViewSet.retrieve': 2,
+    'UserViewSet.create': 6,
+    'UserViewSet.partial_update': 7,
+    'UserViewSet.destroy': 10,
+    'UserViewSet.import_users': 3,
+}
+
+# how often one query shape may run inside a block before it counts as an N+1
+MAX_REPEATS = 3
+
+TRANSACTION_CONTROL = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT|BEGIN|COMMIT|ROLLBACK)\b', re.IGNORECASE)
+LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\((?:\s*(?:\?|%s)\s*,)*\s*(?:\?|%s)\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    """The statement with its literals and parameter lists blanked out, equal for the runs of one query in a loop"""
+    for pattern, replacement in LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+@contextmanager
+def query_budget(budget, max_repeats=MAX_REPEATS):
+    """
+    Fail the block if it runs more statements than budget, a number or a view name of BUDGETS,
+    or if a statement shape runs more than max_repeats times. Savepoints and the like don't count.
+    """
+    limit = BUDGETS[budget] if isinstance(budget, str) else budget
+    recorder = QueryRecorder(keep_sql=True)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+    statements = [sql for sql, _ in recorder.statements if not TRANSACTION_CONTROL.match(sql)]
+    listing = '\n'.join(f"{position}. {sql}" for position, sql in enumerate(statements, start=1))
+    if len(statements) > limit:
+        raise QueryBudgetExceeded(f"{len(statements)} queries run, the budget of {budget} is {limit}:\n{listing}")
+
+    repeated = [(shape, count) for shape, count in Counter(map(query_shape, statements)).items() if count > max_repeats]
+    if repeated:
+        shapes = '\n'.join(f"{count}x {shape}" for shape, count in repeated)
+        raise QueryBudgetExceeded(f"Suspected N+1, the same query ran over and over:\n{shapes}\n\nAll queries:\n{listing}")
@@ -0,0 +1,333 @@
+import csv
+import uuid
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from accounts.models import Account, Currencies
+from accounts.rates import exchange_rates
+from bulk_copy import copy_rows, supports_copy
+from utils import logger
+from .models import BalanceSnapshot, LedgerEntry, Transaction
+
+# Import of historical transactions from CSV or NDJSON. Rows are checked one by one while the file is streamed,
+# everything that needs the database (accounts, currencies, balances) is checked for the whole file at once.
+
+IMPORT_FIELDS = ['id', 'transaction_type', 'amount', 'currency', 'from_account', 'to_account', 'date']
+REJECT_FIELDS = ['row', 'error', *IMPORT_FIELDS]
+MAX_AMOUNT = Decimal('100000000')
+CENTS = Decimal('0.01')
+MISSING_SIDES = {
+    'DEBIT': (['from_account'], "A debit transaction requires a 'from_account'."),
+    'CREDIT': (['to_account'], "A credit transaction requires a 'to_account'."),
+    'TRANSFER': (['from_account', 'to_account'], "A transfer transaction must have both 'from_account' and 'to_account'"),
+}
+
+
+def parse_uuid(value, name):
+    if not value:
+        return None
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise ValidationError(f"Invalid {name} {value}")
+
+
+def parse_row(row):
+    """The typed transaction of a row as a Transaction.create_batch item, ValidationError for a malformed row"""
+    transaction_type = (row.get('transaction_type') or '').strip().upper()
+    if transaction_type not in MISSING_SIDES:
+        raise ValidationError(f"Unknown transaction type {transaction_type}")
+
+    try:
+        amount = Decimal(str(row.get('amount')).strip())
+    except InvalidOperation:
+        raise ValidationError(f"Invalid amount {row.get('amount')}")
+    if not amount.is_finite() or abs(amount) >= MAX_AMOUNT or amount != amount.quantize(CENTS):
+        raise ValidationError(f"Invalid amount {row.get('amount')}")
+    amount = amount.quantize(CENTS)
+    if amount <= 0:
+        raise ValidationError("Amount must be greater than 0.")
+    if transaction_type == 'CREDIT':
+        try:
+            Transaction(transaction_type=transaction_type, amount=amount).validate_credit_amount()
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+    currency = (row.get('currency') or '').strip().upper()
+    if not currency:
+        raise ValidationError("currency is required")
+
+    date = timezone.now()
+    if row.get('date'):
+        date = parse_datetime(str(row['date']).strip())
+        if date is None:
+            raise ValidationError(f"Invalid date {row['date']}")
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+
+    sides, missing_error = MISSING_SIDES[transaction_type]
+    accounts = {side: parse_uuid(row.get(side), side) if side in sides else None for side in ('from_account', 'to_account')}
+    if not all(accounts[side] for side in sides):
+        raise ValidationError(missing_error)
+
+    return {
+        'id': parse_uuid(row.get('id'), 'id') or uuid.uuid4(),
+        'transaction_type': transaction_type,
+        'amount': amount,
+        'currency': currency,
+        'date': date,
+        **accounts,
+    }
+
+
+def round_half_even(value):
+    """SQL rounding the numeric value to cents like utils.convert_currency (ROUND_HALF_EVEN),
+    ROUND of postgres rounds halves away from zero"""
+    return (
+        f"CASE WHEN abs({value} * 100 - trunc({value} * 100)) = 0.5 AND mod(trunc({value} * 100), 2) = 0 "
+        f"THEN ROUND(trunc({value} * 100) / 100, 2) ELSE ROUND({value}, 2) END"
+    )
+
+
+def rate_rows(matrix, currency_codes):
+    """(from, to, rate) of every known conversion. Like utils.convert_currency, a currency converts
+    to itself at 1 whether or not it has exchange rates"""
+    rates = {
+        (from_currency, to_currency): matrix.get(from_currency, to_currency)
+        for from_currency in matrix.codes for to_currency in matrix.codes if matrix.get(from_currency, to_currency) is not None
+    }
+    for code in currency_codes:
+        rates[(code, code)] = Decimal(1)
+    return [(from_currency, to_currency, rate) for (from_currency, to_currency), rate in sorted(rates.items())]
+
+
+class TransactionImporter:
+    """
+    Imports the rows with their ledger entries and balance changes, the balance snapshots taken since an imported
+    date are corrected to include it. On postgres the rows are copied into a temporary
+    staging table TRANSACTION_IMPORT_BATCH_SIZE at a time, validated against the accounts and currencies with a few
+    set based UPDATEs and moved into the transaction and ledger tables with one INSERT each, every account getting
+    its net change in a single UPDATE. The whole import is one transaction. Elsewhere the rows go through
+    Transaction.create_batch a batch at a time. Rejected rows are written to the reject CSV with their error.
+    """
+    def __init__(self, reject_file, batch_size=None):
+        self.batch_size = batch_size or settings.TRANSACTION_IMPORT_BATCH_SIZE
+        self.rejects = csv.DictWriter(reject_file, fieldnames=REJECT_FIELDS, extrasaction='ignore')
+        self.rejects.writeheader()
+        self.imported = self.rejected = 0
+
+    def run(self, rows):
+        """Import the rows, returns the number of imported transactions"""
+        rows = enumerate(rows, start=1)
+        if supports_copy():
+            self.copy_import(rows)
+        else:
+            while batch := list(islice(rows, self.batch_size)):
+                self.import_batch(batch)
+        return self.imported
+
+    def reject(self, number, row, error):
+        self.rejected += 1
+        self.rejects.writerow({**row, 'row': number, 'error': error})
+
+    def parsed(self, batch):
+        """The (row number, raw row, item) of the well formed rows, the others are rejected"""
+        items = []
+        for number, row in batch:
+            try:
+                items.append((number, row, parse_row(row)))
+            except ValidationError as e:
+                self.reject(number, row, e.messages[0])
+        return items
+
+    def import_batch(self, batch):
+        """Fallback without COPY, one create_batch call per batch"""
+        parsed, items, seen = self.parsed(batch), [], set()
+        existing = set(Transaction.objects.filter(pk__in=[item['id'] for _, _, item in parsed]).values_list('pk', flat=True))
+        for number, row, item in parsed:
+            if item['id'] in existing or item['id'] in seen:
+                self.reject(number, row, "The transaction already exists.")
+            else:
+                seen.add(item['id'])
+                items.append((number, row, item))
+
+        with transaction.atomic():
+            created, failed = Transaction.create_batch([item for _, _, item in items])
+            BalanceSnapshot.include_backdated(
+                LedgerEntry.objects.filter(transaction__in=[instance.pk for instance in created]).values_list('account_id', 'amount', 'created_at')
+            )
+        for index, error in failed:
+            number, row, _ = items[index]
+            self.reject(number, row, error)
+        self.imported += len(created)
+        logger('TRANSACTIONS').info("Imported %s transactions, %s rows rejected", self.imported, self.rejected)
+
+    def copy_import(self, rows):
+        quote = connection.ops.quote_name
+        tables = {
+            'transaction': quote(Transaction._meta.db_table), 'ledger': quote(LedgerEntry._meta.db_table),
+            'account': quote(Account._meta.db_table), 'currency': quote(Currencies._meta.db_table),
+            'snapshot': quote(BalanceSnapshot._meta.db_table),
+        }
+        with transaction.atomic(), connection.cursor() as cursor:
+            for statement in STAGING_TABLES:
+                cursor.execute(statement)
+            copy_rows('transaction_import_rates', ['from_currency', 'to_currency', 'rate'], rate_rows(
+                exchange_rates.current_matrix(), Currencies.objects.values_list('currency_code', flat=True)
+            ))
+
+            while batch := list(islice(rows, self.batch_size)):
+                copy_rows('transaction_import', ['source_row', *IMPORT_FIELDS], [
+                    (number, *(item[field] for field in IMPORT_FIELDS)) for number, _, item in self.parsed(batch)
+                ])
+            cursor.execute("ANALYZE transaction_import")
+
+            for condition, error in VALIDATIONS:
+                statement = f"UPDATE transaction_import s SET error = {error} WHERE s.error IS NULL AND ({condition})"
+                cursor.execute(statement.format(missing_rate=MISSING_RATE.format(**tables), **tables))
+            cursor.execute(MOVEMENTS.format(converted=round_half_even('s.amount * r.rate'), **tables))
+            cursor.execute(LOCK_ACCOUNTS.format(**tables))
+            cursor.execute(FIRST_OVERDRAFT.format(**tables))
+            first = cursor.fetchone()[0]
+            if first is not None:
+                logger('TRANSACTIONS').info("Insufficient funds from row %s on, checking the rest of the file in order", first)
+                for statement in INSUFFICIENT_FUNDS:
+                    cursor.execute(statement.format(first=int(first), **tables))
+
+            for statement in APPLY:
+                cursor.execute(statement.format(**tables))
+            cursor.execute("SELECT count(*) FROM transaction_import WHERE error IS NULL")
+            self.imported = cursor.fetchone()[0]
+
+            with connection.chunked_cursor() as rejects:
+                rejects.execute(f"SELECT source_row, error, {', '.join(IMPORT_FIELDS)} FROM transaction_import WHERE error IS NOT NULL ORDER BY source_row")
+                while chunk := rejects.fetchmany(self.batch_size):
+                    for number, error, *values in chunk:
+                        self.reject(number, dict(zip(IMPORT_FIELDS, values)), error)
+            # dropped on commit as well, but an outer transaction would keep them around
+            cursor.execute("DROP TABLE transaction_import, transaction_import_rates, transaction_import_movements")
+        logger('TRANSACTIONS').info("Imported %s transactions, %s rows rejected", self.imported, self.rejected)
+
+
+STAGING_TABLES = [
+    """CREATE TEMPORARY TABLE transaction_import (
+        source_row bigint PRIMARY KEY, id uuid NOT NULL, transaction_type varchar(8) NOT NULL, amount numeric(10, 2) NOT NULL,
+        currency varchar(10) NOT NULL, from_account uuid, to_account uuid, date timestamptz NOT NULL, error text
+    ) ON COMMIT DROP""",
+    """CREATE TEMPORARY TABLE transaction_import_rates (
+        from_currency varchar(10), to_currency varchar(10), rate numeric NOT NULL, PRIMARY KEY (from_currency, to_currency)
+    ) ON COMMIT DROP""",
+]
+
+# currency of an account of the row that the row's currency can't be converted to
+MISSING_RATE = (
+    "SELECT a.currency_id FROM {account} a WHERE a.id IN (s.from_account, s.to_account) AND NOT EXISTS "
+    "(SELECT 1 FROM transaction_import_rates r WHERE r.from_currency = s.currency AND r.to_currency = a.currency_id)"
+)
+
+# (condition, error) of every check, applied in order to the rows without an error yet.
+# The errors are the ones Transaction.create_batch gives
+VALIDATIONS = [
+    ("s.source_row IN (SELECT source_row FROM (SELECT source_row, row_number() OVER (PARTITION BY id ORDER BY source_row) AS n "
+     "FROM transaction_import) d WHERE n > 1)",
+     "'The transaction already exists.'"),
+    ("EXISTS (SELECT 1 FROM {transaction} t WHERE t.id = s.id)", "'The transaction already exists.'"),
+    ("NOT EXISTS (SELECT 1 FROM {currency} c WHERE c.currency_code = s.currency)", "'The currency does not exist.'"),
+    ("s.from_account IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {account} a WHERE a.id = s.from_account)", "'The ''from_account'' does not exist.'"),
+    ("s.to_account IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {account} a WHERE a.id = s.to_account)", "'The ''to_account'' does not exist.'"),
+    ("EXISTS (SELECT 1 FROM {account} a WHERE a.id = s.from_account AND NOT a.is_active)", "'The ''from_account'' is not active.'"),
+    ("EXISTS (SELECT 1 FROM {account} a WHERE a.id = s.to_account AND NOT a.is_active)", "'The ''to_account'' is not active.'"),
+    ("EXISTS (SELECT 1 FROM {account} a JOIN {currency} c ON c.currency_code = a.currency_id "
+     "WHERE a.id IN (s.from_account, s.to_account) AND NOT c.is_active)", "'This currency is not active'"),
+    ("EXISTS ({missing_rate})", "'No exchange rate from ' || s.currency || ' to ' || ({missing_rate} LIMIT 1) || '.'"),
+]
+
+# the signed balance movement of every account side of the valid rows, in the account's currency
+# and rounded like the amounts of Transaction.create_batch
+MOVEMENTS = """
+    CREATE TEMPORARY TABLE transaction_import_movements ON COMMIT DROP AS
+    SELECT s.source_row, a.id AS account_id, sign * {converted} AS amount, s.id AS transaction_id, s.date
+    FROM transaction_import s
+    CROSS JOIN LATERAL (VALUES (s.from_account, -1), (s.to_account, 1)) AS side (account_id, sign)
+    JOIN {account} a ON a.id = side.account_id
+    JOIN transaction_import_rates r ON r.from_currency = s.currency AND r.to_currency = a.currency_id
+    WHERE s.error IS NULL
+"""
+
+LOCK_ACCOUNTS = "SELECT 1 FROM {account} WHERE id IN (SELECT account_id FROM transaction_import_movements) ORDER BY id FOR UPDATE"
+
+# First row whose debit takes a running balance below zero, in file order over the valid rows. Usually there
+# is none and a single scan is all the balance check costs
+FIRST_OVERDRAFT = """
+    SELECT min(source_row) FROM (
+        SELECT m.source_row, m.amount, a.balance + SUM(m.amount) OVER (PARTITION BY m.account_id ORDER BY m.source_row) AS balance
+        FROM transaction_import_movements m
+        JOIN transaction_import s ON s.source_row = m.source_row AND s.error IS NULL
+        JOIN {account} a ON a.id = m.account_id
+    ) running WHERE balance < 0 AND amount < 0
+"""
+
+# Rejects the rows Transaction.create_batch would reject from the first overdraft on, in one pass over the
+# movements in file order: a rejected transfer also takes its credit away from the receiving account, so every
+# later row depends on the decisions before it. The balances start as they stand right before the first overdraft
+INSUFFICIENT_FUNDS = [
+    """CREATE TEMPORARY TABLE transaction_import_balances ON COMMIT DROP AS
+    SELECT a.id AS account_id, a.balance + COALESCE(SUM(m.amount) FILTER (WHERE m.source_row < {first}), 0) AS balance
+    FROM {account} a
+    JOIN transaction_import_movements m ON m.account_id = a.id
+    JOIN transaction_import s ON s.source_row = m.source_row AND s.error IS NULL
+    GROUP BY a.id, a.balance""",
+    "ALTER TABLE transaction_import_balances ADD PRIMARY KEY (account_id)",
+    # the debit side of a row comes first, the credit of a rejected transfer is skipped
+    """DO $$
+    DECLARE
+        movement record;
+        rejected bigint;
+    BEGIN
+        FOR movement IN
+            SELECT m.source_row, m.account_id, m.amount, s.transaction_type
+            FROM transaction_import_movements m JOIN transaction_import s ON s.source_row = m.source_row AND s.error IS NULL
+            WHERE m.source_row >= {first} ORDER BY m.source_row, m.amount
+        LOOP
+            CONTINUE WHEN movement.source_row = rejected;
+            IF movement.amount < 0 AND movement.amount + (
+                SELECT balance FROM transaction_import_balances WHERE account_id = movement.account_id
+            ) < 0 THEN
+                UPDATE transaction_import SET error = CASE WHEN movement.transaction_type = 'TRANSFER'
+                    THEN 'Insufficient funds for transfer in ''from_account''.' ELSE 'Insufficient funds in ''from_account''.' END
+                WHERE source_row = movement.source_row;
+                rejected := movement.source_row;
+            ELSE
+                UPDATE transaction_import_balances SET balance = balance + movement.amount WHERE account_id = movement.account_id;
+            END IF;
+        END LOOP;
+    END $$""",
+    "DROP TABLE transaction_import_balances",
+]
+
+APPLY = [
+    """INSERT INTO {transaction} (id, transaction_type, amount, date, from_account_id, to_account_id,
+        from_account_reference, to_account_reference, currency_id, currency_reference)
+    SELECT id, transaction_type, amount, date, from_account, to_account, from_account::text, to_account::text, currency, currency
+    FROM transaction_import WHERE error IS NULL""",
+    """INSERT INTO {ledger} (account_id, amount, transaction_id, entry_type, created_at)
+    SELECT m.account_id, m.amount, m.transaction_id, 'MOVEMENT', m.date
+    FROM transaction_import_movements m JOIN transaction_import s ON s.source_row = m.source_row AND s.error IS NULL
+    ORDER BY m.date, m.source_row""",
+    """UPDATE {account} a SET balance = a.balance + n.total FROM (
+        SELECT m.account_id, SUM(m.amount) AS total
+        FROM transaction_import_movements m JOIN transaction_import s ON s.source_row = m.source_row AND s.error IS NULL
+        GROUP BY m.account_id
+    ) n WHERE a.id = n.account_id""",
+    # snapshots taken after an imported date have to include the imported movements up to them
+    """UPDATE {snapshot} b SET balance = b.balance + n.total FROM (
+        SELECT taken.id, SUM(m.amount) AS total FROM {snapshot} taken
+        JOIN transaction_import_movements m ON m.account_id = taken.account_id AND m.date <= taken.taken_at
+        JOIN transaction_import s ON s.source_row = m.source_row AND s.error IS NULL
+        GROUP BY taken.id
+    ) n WHERE b.id = n.id""",
+]
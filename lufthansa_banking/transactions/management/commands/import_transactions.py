@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from transactions.importer import TransactionImporter
+from users.importer import read_rows
+
+
+class Command(BaseCommand):
+    help = "Import historical transactions from a CSV or NDJSON file, rejected rows are written to a reject file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'ndjson'], help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, help="Rows read from the file at once")
+        parser.add_argument('--rejects', help="CSV file for the rejected rows, defaults to <path>.rejects.csv")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        rejects_path = options['rejects'] or f"{path}.rejects.csv"
+
+        try:
+            with open(path, newline='', encoding='utf-8') as stream, open(rejects_path, 'w', newline='', encoding='utf-8') as rejects:
+                importer = TransactionImporter(rejects, batch_size=options['batch_size'])
+                importer.run(read_rows(stream, file_format))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if importer.rejected:
+            self.stderr.write(f"{importer.rejected} row(s) rejected, see {rejects_path}")
+        self.stdout.write(self.style.SUCCESS(f"{importer.imported} transaction(s) imported, {importer.rejected} row(s) rejected"))
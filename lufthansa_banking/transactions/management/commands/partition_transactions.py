@@ -0,0 +1,47 @@
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from transactions import partitioning
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise CommandError(f"Invalid month {value}, expected YYYY-MM")
+
+
+class Command(BaseCommand):
+    help = ("Monthly partitioning of the transaction table on postgres: enable it once, then run regularly "
+            "to create the coming months' partitions and to detach the old ones")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enable', action='store_true', help="Convert the transaction table into a partitioned one")
+        parser.add_argument('--months-ahead', type=int, help="Months to create partitions for after the current one")
+        parser.add_argument('--from', dest='first_month', help="Also create the partitions from this month (YYYY-MM) on")
+        parser.add_argument('--detach-before', help="Detach the partitions of the months before this one (YYYY-MM)")
+        parser.add_argument('--drop', action='store_true', help="Drop the detached partitions instead of keeping them to archive")
+
+    def handle(self, *args, **options):
+        months_ahead = options['months_ahead']
+        if months_ahead is None:
+            months_ahead = settings.TRANSACTION_PARTITION_MONTHS_AHEAD
+        last = partitioning.add_months(partitioning.month_of(timezone.now()), months_ahead)
+        first = parse_month(options['first_month']) if options['first_month'] else timezone.now()
+        detach_before = parse_month(options['detach_before']) if options['detach_before'] else None
+        if options['drop'] and not detach_before:
+            raise CommandError("--drop goes with --detach-before")
+
+        try:
+            created = partitioning.enable(months_ahead) if options['enable'] else []
+            created += partitioning.create_partitions(first, last)
+            retired = partitioning.detach_partitions(detach_before, drop=options['drop']) if detach_before else []
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        for name in retired:
+            self.stdout.write(f"{'Dropped' if options['drop'] else 'Detached'} {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partition(s) created, {len(retired)} {'dropped' if options['drop'] else 'detached'}"))
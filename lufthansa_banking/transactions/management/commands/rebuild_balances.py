@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from transactions.models import LedgerEntry
+
+
+class Command(BaseCommand):
+    help = "Recompute the account balances from the ledger entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report the accounts whose balance drifted")
+
+    def handle(self, *args, **options):
+        drifted = LedgerEntry.rebuild_balances(dry_run=options['dry_run'])
+        for account_id, balance, expected in drifted:
+            self.stdout.write(f"{account_id}: balance {balance}, ledger {expected}")
+
+        action = "drifted" if options['dry_run'] else "rebuilt"
+        self.stdout.write(self.style.SUCCESS(f"{len(drifted)} account balance(s) {action}"))
@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from transactions.seeding import UNTIL, BankSeeder
+
+
+class Command(BaseCommand):
+    help = "Generate users, accounts, cards and a transaction history with consistent balances for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--accounts', type=int, default=2000)
+        parser.add_argument('--cards', type=int, default=1000)
+        parser.add_argument('--transactions', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365, help="Length of the transaction history")
+        parser.add_argument('--until', help="ISO datetime the history ends at, defaults to 2026-01-01 UTC")
+        parser.add_argument('--seed', type=int, default=0, help="The same seed and volumes give the same data")
+        parser.add_argument('--workers', type=int, help="Processes writing the history on postgres, 0 to write it in this process")
+        parser.add_argument('--password', default='password', help="Password of every generated user")
+
+    def handle(self, *args, **options):
+        until = UNTIL
+        if options['until']:
+            until = parse_datetime(options['until'])
+            if until is None:
+                raise CommandError(f"Invalid datetime: {options['until']}")
+
+        seeder = BankSeeder(
+            users=options['users'], accounts=options['accounts'], cards=options['cards'], transactions=options['transactions'],
+            days=options['days'], seed=options['seed'], until=until, workers=options['workers'], password=options['password'],
+        )
+        started = time.monotonic()
+        try:
+            seeder.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['users']} user(s), {options['accounts']} account(s), {options['cards']} card(s) and "
+            f"{options['transactions']} transaction(s) seeded in {time.monotonic() - started:.1f}s"
+        ))
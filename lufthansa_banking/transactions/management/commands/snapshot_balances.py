@@ -0,0 +1,37 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from transactions.models import BalanceSnapshot
+
+
+class Command(BaseCommand):
+    help = "Snapshot the balance of every account, once or every BALANCE_SNAPSHOT_INTERVAL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help="ISO 8601 datetime to take the snapshot at, defaults to now")
+        parser.add_argument('--force', action='store_true', help="Snapshot even if the last one is more recent than the interval")
+        parser.add_argument('--watch', action='store_true', help="Keep running and snapshot at every interval")
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            as_of = parse_datetime(options['as_of'])
+            if not as_of:
+                raise CommandError("--as-of must be an ISO 8601 datetime")
+
+        while True:
+            self.snapshot(as_of, options['force'])
+            if not options['watch']:
+                break
+            time.sleep(settings.BALANCE_SNAPSHOT_INTERVAL.total_seconds())
+
+    def snapshot(self, as_of, force):
+        latest = BalanceSnapshot.objects.order_by('-taken_at').values_list('taken_at', flat=True).first()
+        if not force and not as_of and latest and timezone.now() - latest < settings.BALANCE_SNAPSHOT_INTERVAL:
+            self.stdout.write(f"Last snapshot taken at {latest.isoformat()}, nothing to do")
+            return
+
+        count = BalanceSnapshot.take(as_of)
+        self.stdout.write(self.style.SUCCESS(f"{count} account balance(s) snapshotted"))
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledgers(apps, schema_editor):
+    """Existing accounts start their ledger with their current balance"""
+    Account = apps.get_model('accounts', 'Account')
+    LedgerEntry = apps.get_model('transactions', 'LedgerEntry')
+    entries = (
+        LedgerEntry(account_id=account_id, amount=balance, entry_type='OPENING')
+        for account_id, balance in Account.objects.values_list('id', 'balance').iterator(chunk_size=2000)
+    )
+    while batch := [entry for _, entry in zip(range(2000), entries)]:
+        LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_account_balance_non_negative'),
+        ('transactions', '0002_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('entry_type', models.CharField(choices=[('OPENING', 'Opening'), ('MOVEMENT', 'Movement'), ('REVALUATION', 'Revaluation')], default='MOVEMENT', max_length=11)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='accounts.account')),
+                ('transaction', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='transactions.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'created_at'], name='ledger_account_created_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledgers, migrations.RunPython.noop),
+    ]
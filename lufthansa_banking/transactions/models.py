@@ -1,8 +1,14 @@
 from django.db import models
+from django.db.models import F, Sum, Max
+from django.utils import timezone
+from decimal import Decimal
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from utils import convert_currency
 from uuid import uuid4
 from django.db import transaction
+from accounts.models import Account
+from accounts.registry import currency_registry
 
 class Transaction(models.Model):
     """Transaction model to represent a financial transaction"""
@@ -13,13 +19,24 @@ class Transaction(models.Model):
         CREDIT = 'CREDIT', 'Credit'
         TRANSFER = 'TRANSFER', 'Transfer'
 
+    class ExecutionModes(models.TextChoices):
+        """How the balance updates are executed, picked with the TRANSACTION_EXECUTION_MODE setting"""
+        LOCKING = 'LOCKING', 'Locking'
+        CONDITIONAL_UPDATE = 'CONDITIONAL_UPDATE', 'Conditional update'
+
+    # credits have to be above the minimum and at most the maximum
+    MIN_CREDIT_AMOUNT = Decimal('20')
+    MAX_CREDIT_AMOUNT = Decimal('10000')
+
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     transaction_type = models.CharField(max_length=8, choices=TransactionTypes.choices, default=TransactionTypes.DEBIT)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    date = models.DateTimeField(auto_now_add=True)
+    # set on creation, but imported and generated history keeps its original dates
+    date = models.DateTimeField(default=timezone.now, editable=False)
     
-    from_account = models.ForeignKey('accounts.Account', related_name='from_account', null=True, on_delete=models.SET_NULL)
-    to_account = models.ForeignKey('accounts.Account', related_name='to_account', null=True, on_delete=models.SET_NULL)
+    # the FKs are covered by the leading column of the (account, date) indexes below
+    from_account = models.ForeignKey('accounts.Account', related_name='from_account', null=True, on_delete=models.SET_NULL, db_index=False)
+    to_account = models.ForeignKey('accounts.Account', related_name='to_account', null=True, on_delete=models.SET_NULL, db_index=False)
     
     from_account_reference = models.CharField(max_length=200, null=True)
     to_account_reference = models.CharField(max_length=200, null=True)
@@ -27,6 +44,12 @@ class Transaction(models.Model):
     currency = models.ForeignKey('accounts.Currencies', max_length=10, null=True, on_delete=models.SET_NULL)
     currency_reference = models.CharField(max_length=10, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_account', 'date'], name='transaction_from_date_idx'),
+            models.Index(fields=['to_account', 'date'], name='transaction_to_date_idx'),
+        ]
+
     def validate_accounts(self):
         """Validate the accounts based on the transaction type"""
         if self.transaction_type == 'TRANSFER' and (not self.from_account or not self.to_account):
@@ -46,50 +69,116 @@ class Transaction(models.Model):
         
     def convert_transaction_amount(self, account_currency_code):
         """Currency convertion check for the transaction amount, if not the proper currency it is converted"""
-        if self.currency.currency_code != account_currency_code:
-            return convert_currency(self.amount, self.currency.currency_code, account_currency_code)
+        if self.currency_id and self.currency_id != account_currency_code:
+            return convert_currency(self.amount, self.currency_id, account_currency_code)
         return self.amount
 
+    def validate_credit_amount(self):
+        """Credit transactions have to stay in the allowed amount range"""
+        if self.amount <= self.MIN_CREDIT_AMOUNT:
+            raise ValueError("The amount is too small.")
+        if self.amount > self.MAX_CREDIT_AMOUNT:
+            raise ValueError(f"The amount exceeds the {self.MAX_CREDIT_AMOUNT:,} limit.")
+
+    def lock_accounts(self):
+        """Lock the involved accounts with SELECT ... FOR UPDATE and re-read their balances.
+        The rows are always locked in the same order (by account id) so two transactions
+        touching the same pair of accounts can't deadlock each other"""
+        account_ids = [account.pk for account in (self.from_account, self.to_account) if account]
+        if not account_ids:
+            return
+
+        locked_accounts = Account.objects.select_for_update().filter(pk__in=account_ids).order_by('pk').in_bulk()
+
+        if self.from_account:
+            self.from_account = locked_accounts[self.from_account.pk]
+        if self.to_account:
+            self.to_account = locked_accounts[self.to_account.pk]
+
     def process_balance_updates(self):
-        """Process the balance updates based on the transaction type""" 
-        
-        # debit transaction, removes money from the account
-        if self.transaction_type == 'DEBIT':
-            converted_amount_from = self.convert_transaction_amount(self.from_account.currency.currency_code)
-            if converted_amount_from > self.from_account.balance:
-                raise ValueError("Insufficient funds in 'from_account'.")
-            self.from_account.balance -= converted_amount_from
-            self.from_account.save()
-
-        # credit transaction, adds money to the account
-        elif self.transaction_type == 'CREDIT':
-            if self.amount <= 20:
-                raise ValueError("The amount is too small.")
-            if self.amount > 10000:
-                raise ValueError("The amount exceeds the 10,000 limit.")
-            converted_amount_to = self.convert_transaction_amount(self.to_account.currency.currency_code)
-            self.to_account.balance += converted_amount_to
-            self.to_account.save()
-
-        # transfer transaction, moves money from one account to another
-        elif self.transaction_type == 'TRANSFER':
-            converted_amount_from = self.convert_transaction_amount(self.from_account.currency.currency_code)
-            if converted_amount_from > self.from_account.balance:
-                raise ValueError("Insufficient funds for transfer in 'from_account'.")            
-            converted_amount_to = self.convert_transaction_amount(self.to_account.currency.currency_code)
-            self.from_account.balance -= converted_amount_from
-            self.to_account.balance += converted_amount_to
-            self.from_account.save()
-            self.to_account.save()
+        """Process the balance updates based on the transaction type, on the locked accounts"""
+        movements = self.balance_movements()
+        for account, amount in movements:
+            if account.balance + amount < 0:
+                raise self.insufficient_funds_error()
+
+        for account, amount in movements:
+            account.balance += amount
+            account.save()
+        return movements
+
+    def balance_movements(self):
+        """The signed balance change of every involved account, in the account's own currency"""
+        movements = []
+        if self.transaction_type in ('DEBIT', 'TRANSFER'):
+            movements.append((self.from_account, -self.convert_transaction_amount(self.from_account.currency_id)))
+        if self.transaction_type == 'CREDIT':
+            self.validate_credit_amount()
+        if self.transaction_type in ('CREDIT', 'TRANSFER'):
+            movements.append((self.to_account, self.convert_transaction_amount(self.to_account.currency_id)))
+        return movements
+
+    def insufficient_funds_error(self):
+        if self.transaction_type == 'TRANSFER':
+            return ValueError("Insufficient funds for transfer in 'from_account'.")
+        return ValueError("Insufficient funds in 'from_account'.")
+
+    def apply_conditional_updates(self):
+        """Fast path for the balance updates, every move is a single UPDATE ... SET balance = balance +/- X.
+        The debit only matches while the balance covers it, so 0 updated rows means insufficient funds.
+        Moves are applied in account id order, the same order the locking mode uses"""
+        movements = self.balance_movements()
+        for account, _ in movements:
+            if not currency_registry.is_active(account.currency_id):
+                raise ValidationError("This currency is not active")
+
+        for account, amount in sorted(movements, key=lambda movement: movement[0].pk):
+            # the same checks Account.save does, the currency one is made against the registry
+            accounts = Account.objects.filter(pk=account.pk, is_active=True, currency_id=account.currency_id)
+            if amount < 0:
+                accounts = accounts.filter(balance__gte=-amount)
+
+            if not accounts.update(balance=F('balance') + amount):
+                self.raise_update_error(account)
+        return movements
+
+    def raise_update_error(self, account):
+        """Find out why a conditional update didn't match, only runs on the failure path"""
+        currency_code = account.currency_id
+        account.refresh_from_db(fields=['is_active', 'currency'])
+        side = 'from_account' if account == self.from_account else 'to_account'
+
+        if account.currency_id != currency_code:
+            raise ValidationError(f"The currency of the '{side}' changed, please try again.")
+        if not account.is_active:
+            raise ValidationError(f"The '{side}' is not active.")
+        if not currency_registry.is_active(account.currency_id):
+            raise ValidationError("This currency is not active")
+        raise self.insufficient_funds_error()
 
     def save(self, *args, **kwargs):
-        """All the validations are done when the transaction is saved and the transaction is processed in an atomic fashion"""
+        """All the validations are done when the transaction is saved and the transaction is processed in an atomic fashion,
+        either with both accounts locked for the (short) duration of the balance move or with conditional updates"""
         self.validate_accounts()
         
         with transaction.atomic():
-            self.set_up_transaction()
-            self.process_balance_updates()
+            if settings.TRANSACTION_EXECUTION_MODE == self.ExecutionModes.CONDITIONAL_UPDATE:
+                self.set_up_transaction()
+                movements = self.apply_conditional_updates()
+            else:
+                self.lock_accounts()
+                self.validate_accounts()
+                self.set_up_transaction()
+                movements = self.process_balance_updates()
             super().save(*args, **kwargs)
+            LedgerEntry.objects.bulk_create(self.build_ledger_entries(movements))
+
+    def build_ledger_entries(self, movements):
+        """One ledger entry per balance movement of the transaction"""
+        return [
+            LedgerEntry(account=account, amount=amount, transaction=self, created_at=self.date)
+            for account, amount in movements
+        ]
 
     def set_up_transaction(self):
         """Set up transaction metadata in case of missing relations"""
@@ -99,8 +188,224 @@ class Transaction(models.Model):
         if not self.to_account_reference and self.to_account:
             self.to_account_reference = self.to_account.id
         
-        if not self.currency_reference and self.currency:
-            self.currency_reference = self.currency.currency_code
+        if not self.currency_reference and self.currency_id:
+            self.currency_reference = self.currency_id
+
+    @classmethod
+    def history_for_user(cls, user):
+        """All the transactions touching the user's accounts, outgoing and incoming, newest first.
+        Each side is an index scan on its (account, date) index, the two are combined with UNION ALL
+        in a subquery so the whole history is still a single query that can be filtered and paginated"""
+        account_ids = Account.objects.filter(user=user).values('pk')
+        outgoing = cls.objects.filter(from_account__in=account_ids).values('pk')
+        incoming = cls.objects.filter(to_account__in=account_ids).values('pk')
+        return cls.objects.filter(pk__in=outgoing.union(incoming, all=True)).select_related('currency').order_by('-date', '-id')
+
+    @classmethod
+    def create_batch(cls, items, user=None):
+        """Create many transactions at once. Items are dicts with the account ids, currency code, amount and type (optionally the id and date).
+        The referenced accounts are loaded with one query, the currencies come from the registry, every account gets its net balance
+        change written once and the transactions are bulk inserted, all in a single atomic block.
+        Returns the created transactions and the (index, error) pairs of the items that failed validation"""
+        created, failed = [], []
+
+        with transaction.atomic():
+            account_ids = {item.get(side) for item in items for side in ('from_account', 'to_account')} - {None}
+            accounts = Account.objects.select_for_update().filter(pk__in=account_ids).order_by('pk').in_bulk()
+            currencies = currency_registry.current()
+            touched_accounts = {}
+            created_movements = []
+
+            for index, item in enumerate(items):
+                try:
+                    instance = cls.build_batch_item(item, accounts, currencies, user)
+                    movements = instance.balance_movements()
+                    if any(account.balance + amount < 0 for account, amount in movements):
+                        raise instance.insufficient_funds_error()
+                except (ValidationError, ValueError) as e:
+                    failed.append((index, ' '.join(e.messages) if isinstance(e, ValidationError) else str(e)))
+                    continue
+
+                for account, amount in movements:
+                    account.balance += amount
+                    touched_accounts[account.pk] = account
+                created.append(instance)
+                created_movements.append(movements)
+
+            Account.objects.bulk_update(touched_accounts.values(), ['balance'])
+            cls.objects.bulk_create(created)
+            LedgerEntry.objects.bulk_create([
+                entry for instance, movements in zip(created, created_movements) for entry in instance.build_ledger_entries(movements)
+            ])
+
+        return created, failed
+
+    @classmethod
+    def build_batch_item(cls, item, accounts, currencies, user=None):
+        """Build and validate a transaction of a batch against the preloaded accounts and currencies"""
+        for side in ('from_account', 'to_account'):
+            if item.get(side) and item[side] not in accounts:
+                raise ValidationError(f"The '{side}' does not exist.")
+        if item.get('currency') and item['currency'] not in currencies:
+            raise ValidationError("The currency does not exist.")
+
+        instance = cls(
+            transaction_type=item['transaction_type'],
+            amount=item['amount'],
+            from_account=accounts.get(item.get('from_account')),
+            to_account=accounts.get(item.get('to_account')),
+            currency=currencies.get(item.get('currency')),
+        )
+        # imported history brings its own ids and dates
+        if item.get('id'):
+            instance.id = item['id']
+        if item.get('date'):
+            instance.date = item['date']
+        if instance.amount <= 0:
+            raise ValidationError("Amount must be greater than 0.")
+        instance.validate_accounts()
+
+        if user and user.type == 'CUSTOMER' and instance.from_account and instance.from_account.user_id != user.id:
+            raise ValidationError("You can only debit from your own account.")
+        for account in (instance.from_account, instance.to_account):
+            if account and not currencies[account.currency_id].is_active:
+                raise ValidationError("This currency is not active")
+
+        instance.set_up_transaction()
+        return instance
+
+    def __str__(self):
+        return f"{self.transaction_type} transaction of {self.amount} on {self.date}"
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only ledger, one row per balance movement of an account, signed and in the account's currency.
+    Entries are only ever inserted, the balance of an account is the sum of its entries.
+    """
+    class EntryTypes(models.TextChoices):
+        OPENING = 'OPENING', 'Opening'
+        MOVEMENT = 'MOVEMENT', 'Movement'
+        REVALUATION = 'REVALUATION', 'Revaluation'
+
+    sequence = models.BigAutoField(primary_key=True)
+    account = models.ForeignKey('accounts.Account', related_name='ledger_entries', on_delete=models.CASCADE, db_index=False)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # no database constraint: a partitioned transaction table (see transactions/partitioning.py) can't be referenced
+    # by a foreign key without the date, and archived months take their transactions but keep their ledger entries
+    transaction = models.ForeignKey(
+        'transactions.Transaction', related_name='ledger_entries', null=True, on_delete=models.SET_NULL, db_constraint=False
+    )
+    entry_type = models.CharField(max_length=11, choices=EntryTypes.choices, default=EntryTypes.MOVEMENT)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'created_at'], name='ledger_account_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Entries can be written once and never changed"""
+        if not self._state.adding:
+            raise ValidationError("Ledger entries can't be changed")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Ledger entries can't be deleted")
+
+    @classmethod
+    def balance_of(cls, account):
+        """Balance of the account according to the ledger"""
+        return cls.objects.filter(account=account).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+
+    @classmethod
+    def rebuild_balances(cls, dry_run=False, chunk_size=2000):
+        """Recompute the account balances from the ledger, returns the (account id, balance, ledger balance)
+        of every account that drifted. Unless dry_run, the drifted balances are written back.
+        Chunk by chunk the accounts are locked before their ledger is summed, a transaction committing
+        in between can't make a balance look drifted and get overwritten with an older total"""
+        account_ids = list(Account.objects.order_by('pk').values_list('pk', flat=True))
+        drifted = []
+        for start in range(0, len(account_ids), chunk_size):
+            chunk = account_ids[start:start + chunk_size]
+            with transaction.atomic():
+                balances = Account.objects.select_for_update().filter(pk__in=chunk).order_by('pk').values_list('pk', 'balance')
+                totals = dict(cls.objects.filter(account_id__in=chunk).values_list('account').annotate(total=Sum('amount')).order_by())
+                chunk_drifted = [
+                    (account_id, balance, totals.get(account_id, Decimal('0.00')))
+                    for account_id, balance in balances if balance != totals.get(account_id, Decimal('0.00'))
+                ]
+                if not dry_run:
+                    Account.objects.bulk_update(
+                        [Account(id=account_id, balance=expected) for account_id, _, expected in chunk_drifted], ['balance'], batch_size=1000
+                    )
+            drifted += chunk_drifted
+        return drifted
+
+    def __str__(self):
+        return f"{self.entry_type} of {self.amount} on account {self.account_id}"
+
+
+class BalanceSnapshot(models.Model):
+    """Balance of an account at a point in time. Taken periodically for all accounts so a point in time
+    balance only has to replay the ledger entries since the closest earlier snapshot"""
+    account = models.ForeignKey('accounts.Account', related_name='balance_snapshots', on_delete=models.CASCADE, db_index=False)
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'taken_at'], name='unique_account_snapshot'),
+        ]
+
+    @classmethod
+    def take(cls, as_of=None):
+        """Snapshot every account as of the given time, building on the previous snapshot run so only
+        the ledger entries since then are aggregated. Returns the number of snapshots written"""
+        as_of = as_of or timezone.now() - settings.BALANCE_SNAPSHOT_DELAY
+        previous = cls.objects.filter(taken_at__lt=as_of).aggregate(taken_at=Max('taken_at'))['taken_at']
+
+        balances = dict(cls.objects.filter(taken_at=previous).values_list('account_id', 'balance')) if previous else {}
+        entries = LedgerEntry.objects.filter(created_at__lte=as_of)
+        if previous:
+            entries = entries.filter(created_at__gt=previous)
+        for account_id, total in entries.values_list('account_id').annotate(total=Sum('amount')).order_by():
+            balances[account_id] = balances.get(account_id, Decimal('0.00')) + total
+
+        snapshots = [cls(account_id=account_id, balance=balance, taken_at=as_of) for account_id, balance in balances.items()]
+        cls.objects.bulk_create(snapshots, batch_size=2000, ignore_conflicts=True)
+        return len(snapshots)
+
+    @classmethod
+    def balance_as_of(cls, account, timestamp, inclusive=True):
+        """Balance of the account at the given time: the nearest earlier snapshot plus the ledger entries since.
+        Not inclusive leaves out what happened at exactly that time (the balance right before it)"""
+        before = 'lte' if inclusive else 'lt'
+        snapshot = cls.objects.filter(account=account, **{f'taken_at__{before}': timestamp}).order_by('-taken_at').first()
+        entries = LedgerEntry.objects.filter(account=account, **{f'created_at__{before}': timestamp})
+        if snapshot:
+            entries = entries.filter(created_at__gt=snapshot.taken_at)
+
+        balance = snapshot.balance if snapshot else Decimal('0.00')
+        return balance + (entries.aggregate(total=Sum('amount'))['total'] or Decimal('0.00'))
+
+    @classmethod
+    def include_backdated(cls, entries):
+        """Add ledger entries written after the fact with an earlier created_at (imported history) to the snapshots
+        taken since, entries are (account id, amount, created_at). Returns the number of corrected snapshots"""
+        entries = list(entries)
+        if not entries:
+            return 0
+        snapshots = list(cls.objects.filter(
+            account_id__in={account_id for account_id, _, _ in entries}, taken_at__gte=min(created_at for _, _, created_at in entries)
+        ))
+        for snapshot in snapshots:
+            snapshot.balance += sum(
+                (amount for account_id, amount, created_at in entries if account_id == snapshot.account_id and created_at <= snapshot.taken_at),
+                Decimal('0.00')
+            )
+        cls.objects.bulk_update(snapshots, ['balance'], batch_size=1000)
+        return len(snapshots)
 
     def __str__(self):
-        return f"{self.transaction_type} transaction of {self.amount} on {self.date}"
\ No newline at end of file
+        return f"Balance of {self.balance} on account {self.account_id} at {self.taken_at}"
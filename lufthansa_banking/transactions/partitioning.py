@@ -0,0 +1,206 @@
+import re
+from datetime import date
+from django.db import connection, transaction
+from django.utils import timezone
+from utils import logger
+from .models import Transaction
+
+# Optional monthly range partitioning of the transaction table on postgres.
+#
+# Once enabled the table is partitioned by date with one partition per month, plus a default partition catching
+# dates no month was created for. Queries with a date range (the history, the keyset pages, the statements) only
+# scan the months they need, and retiring a month is a DETACH instead of a DELETE of millions of rows.
+#
+# A partitioned table can only enforce uniqueness on keys holding the partition column, so the primary key
+# becomes (id, date). Django still treats id alone as the primary key, ids are random UUIDs and the imports check
+# them against the table, but the database no longer guarantees them unique on its own. For the same reason
+# nothing can reference a transaction with a foreign key: LedgerEntry.transaction has no database constraint.
+
+PARTITION_NAME = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(value):
+    return date(value.year, value.month, 1)
+
+
+def months_between(first, last):
+    """First day of every month from the month of first up to the month of last, both included"""
+    month, last = month_of(first), month_of(last)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def table_name():
+    return Transaction._meta.db_table
+
+
+def partition_name(month):
+    return f"{table_name()}_p{month:%Y%m}"
+
+
+def default_partition_name():
+    return f"{table_name()}_default"
+
+
+def require_postgres():
+    if connection.vendor != 'postgresql':
+        raise ValueError("Partitioning the transactions needs postgres.")
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", [table_name()])
+    return cursor.fetchone()[0]
+
+
+def monthly_partitions(cursor):
+    """The (month, name) of the attached monthly partitions, oldest first"""
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = %s::regclass", [table_name()]
+    )
+    months = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.search(name)
+        if match:
+            months.append((date(int(match[1]), int(match[2]), 1), name))
+    return sorted(months)
+
+
+def bounds(month):
+    return f"'{month:%Y-%m-%d} 00:00:00+00'", f"'{add_months(month, 1):%Y-%m-%d} 00:00:00+00'"
+
+
+def enable(months_ahead):
+    """
+    Turn the plain transaction table into a partitioned one, in a single transaction holding an exclusive lock.
+    The rows are copied into monthly partitions covering the oldest transaction up to months_ahead from now,
+    then the indexes and constraints of the old table are recreated, under the same names, on the new one.
+    Returns the names of the created partitions
+    """
+    require_postgres()
+    quote = connection.ops.quote_name
+    table = quote(table_name())
+    old_table = quote(f"{table_name()}_unpartitioned")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            raise ValueError("The transactions are already partitioned.")
+        cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [table_name()])
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('c', 'f')",
+            [table_name()]
+        )
+        constraints = cursor.fetchall()
+        # the other indexes, constraint ones come back with their constraints
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+            [table_name(), table_name()]
+        )
+        indexes = [indexdef for (indexdef,) in cursor.fetchall()]
+
+        cursor.execute(
+            "SELECT conname, conrelid::regclass::text FROM pg_constraint WHERE confrelid = %s::regclass AND contype = 'f'", [table_name()]
+        )
+        for name, referencing_table in cursor.fetchall():
+            logger('TRANSACTIONS').warning("Dropping the foreign key %s of %s, a partitioned table can't be referenced", name, referencing_table)
+            cursor.execute(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {quote(name)}")
+
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        cursor.execute(f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS) PARTITION BY RANGE (date)")
+        cursor.execute(f"CREATE TABLE {quote(default_partition_name())} PARTITION OF {table} DEFAULT")
+
+        cursor.execute(f"SELECT min(date) FROM {old_table}")
+        oldest = cursor.fetchone()[0] or timezone.now()
+        created = []
+        for month in months_between(oldest, add_months(month_of(timezone.now()), months_ahead)):
+            lower, upper = bounds(month)
+            cursor.execute(f"CREATE TABLE {quote(partition_name(month))} PARTITION OF {table} FOR VALUES FROM ({lower}) TO ({upper})")
+            created.append(partition_name(month))
+
+        # loaded before the indexes exist, building them afterwards is much cheaper
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {old_table}")
+        cursor.execute(f"DROP TABLE {old_table}")
+
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {quote(primary_key)} PRIMARY KEY (id, date)")
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {quote(name)} {definition}")
+
+    logger('TRANSACTIONS').info("Partitioned the transactions into %s monthly partitions", len(created))
+    return created
+
+
+def create_partitions(first, last):
+    """
+    Create the missing monthly partitions from the month of first to the month of last. Rows of such a month that
+    ended up in the default partition are moved into the new one. Returns the names of the created partitions
+    """
+    require_postgres()
+    quote = connection.ops.quote_name
+    table, default = quote(table_name()), quote(default_partition_name())
+    created = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            raise ValueError("The transactions are not partitioned, enable the partitioning first.")
+        existing = {month for month, _ in monthly_partitions(cursor)}
+
+        for month in months_between(first, last):
+            if month in existing:
+                continue
+            lower, upper = bounds(month)
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE date >= {lower} AND date < {upper})")
+            if cursor.fetchone()[0]:
+                # the new partition's range must not hold rows of the default one: take it off while they move
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+                cursor.execute(f"CREATE TABLE {quote(partition_name(month))} PARTITION OF {table} FOR VALUES FROM ({lower}) TO ({upper})")
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {default} WHERE date >= {lower} AND date < {upper} RETURNING *) "
+                    f"INSERT INTO {table} SELECT * FROM moved"
+                )
+                cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+            else:
+                cursor.execute(f"CREATE TABLE {quote(partition_name(month))} PARTITION OF {table} FOR VALUES FROM ({lower}) TO ({upper})")
+            created.append(partition_name(month))
+
+    if created:
+        logger('TRANSACTIONS').info("Created the transaction partitions %s", ', '.join(created))
+    return created
+
+
+def detach_partitions(before, drop=False):
+    """
+    Detach the monthly partitions of the months before the month of before. Detached partitions stay
+    around as plain tables to be archived (pg_dump -t) and dropped, or attached again; with drop they are dropped
+    right away. The ledger entries and the balances are left untouched. Returns the names of the partitions
+    """
+    require_postgres()
+    quote = connection.ops.quote_name
+    table = quote(table_name())
+    retired = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            raise ValueError("The transactions are not partitioned, enable the partitioning first.")
+        for month, name in monthly_partitions(cursor):
+            if month >= month_of(before):
+                break
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {quote(name)}")
+            if drop:
+                cursor.execute(f"DROP TABLE {quote(name)}")
+            retired.append(name)
+
+    if retired:
+        logger('TRANSACTIONS').info("%s the transaction partitions %s", "Dropped" if drop else "Detached", ', '.join(retired))
+    return retired
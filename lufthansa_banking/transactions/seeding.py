@@ -0,0 +1,237 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_EVEN
+from uuid import UUID
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from accounts.iban import iban_allocator
+from accounts.models import Account, Card, Currencies
+from accounts.rates import exchange_rates
+from accounts.cards import card_number_pool, random_cvv
+from bulk_copy import supports_copy, update_field, write_rows
+from users.importer import setup_worker
+from users.models import CustomUser
+from utils import logger
+from .models import LedgerEntry, Transaction
+
+# Synthetic bank for load testing: users, accounts, cards and a transaction history with consistent balances.
+# Everything is drawn from random generators seeded with the seed, the same seed and volumes give the same rows.
+
+# the history ends here unless told otherwise, a default depending on the clock would seed another bank every day
+UNTIL = datetime(2026, 1, 1, tzinfo=timezone.utc)
+CENTS = Decimal('0.01')
+ZERO = Decimal('0.00')
+TRANSACTION_TYPES = ['TRANSFER', 'DEBIT', 'CREDIT']
+TRANSACTION_WEIGHTS = [6, 2, 2]
+
+TRANSACTION_FIELDS = [
+    'id', 'transaction_type', 'amount', 'date', 'from_account_id', 'to_account_id',
+    'from_account_reference', 'to_account_reference', 'currency_id', 'currency_reference',
+]
+LEDGER_FIELDS = ['account_id', 'amount', 'transaction_id', 'entry_type', 'created_at']
+ACCOUNT_FIELDS = ['id', 'iban', 'balance', 'creation_date', 'currency_id', 'user_id', 'is_active']
+CARD_FIELDS = ['card_number', 'card_type', 'cvv', 'account_id']
+
+
+def random_uuid(rng):
+    return UUID(int=rng.getrandbits(128), version=4)
+
+
+def convert(matrix, amount, from_currency, to_currency):
+    """Same rounding as utils.convert_currency, with the rates of the matrix given"""
+    if from_currency == to_currency:
+        return amount
+    return (amount * matrix.get(from_currency, to_currency)).quantize(CENTS, rounding=ROUND_HALF_EVEN)
+
+
+@dataclass
+class HistoryPlan:
+    """What a worker needs to generate its chunks of the history: the accounts as (id, currency) and the rates"""
+    seed: int
+    transactions: int
+    chunk_size: int
+    start: datetime
+    chunk_span: timedelta
+    accounts: list
+    matrix: object
+
+
+worker_plan = None
+
+
+def start_worker(plan):
+    """Keeps the plan in the worker process, processes started with spawn also need django configured"""
+    global worker_plan
+    if not apps.ready:
+        setup_worker()
+    worker_plan = plan
+
+
+def write_chunk(index):
+    """
+    Generate and insert the transactions of one chunk of the history with their ledger entries. Every chunk
+    has its own time window and random generator, so the chunks can be written in any order by any process.
+    Returns the net change and the lowest running change of every account the chunk touches, by account position
+    """
+    plan = worker_plan
+    rng = random.Random(f"{plan.seed}-{index}")
+    count = min(plan.chunk_size, plan.transactions - index * plan.chunk_size)
+    window = plan.start + plan.chunk_span * index
+    transactions, entries, changes = [], [], {}
+
+    def move(position, amount, transaction_id, date):
+        account_id, _ = plan.accounts[position]
+        entries.append((account_id, amount, transaction_id, LedgerEntry.EntryTypes.MOVEMENT, date))
+        net, low = changes.get(position, (ZERO, ZERO))
+        changes[position] = (net + amount, min(low, net + amount))
+
+    for offset in sorted(rng.random() for _ in range(count)):
+        date = window + plan.chunk_span * offset
+        transaction_type = rng.choices(TRANSACTION_TYPES, TRANSACTION_WEIGHTS)[0]
+        transaction_id = random_uuid(rng)
+        amount = Decimal(rng.randint(2100, 50000)) / 100
+        sender, receiver = rng.sample(range(len(plan.accounts)), 2)
+        if transaction_type == 'CREDIT':
+            # credits are bounded by the credit limits, keep them in euros
+            sender, currency = None, 'EUR'
+        elif transaction_type == 'DEBIT':
+            receiver, currency = None, plan.accounts[sender][1]
+        else:
+            currency = plan.accounts[sender][1]
+        amount = convert(plan.matrix, amount, 'EUR', currency)
+
+        if sender is not None:
+            move(sender, -amount, transaction_id, date)
+        if receiver is not None:
+            move(receiver, convert(plan.matrix, amount, currency, plan.accounts[receiver][1]), transaction_id, date)
+        from_account = plan.accounts[sender][0] if sender is not None else None
+        to_account = plan.accounts[receiver][0] if receiver is not None else None
+        transactions.append((transaction_id, transaction_type, amount, date, from_account, to_account,
+                             from_account, to_account, currency, currency))
+
+    with transaction.atomic():
+        write_rows(Transaction, TRANSACTION_FIELDS, transactions)
+        write_rows(LedgerEntry, LEDGER_FIELDS, entries)
+    return changes
+
+
+class BankSeeder:
+    """
+    Generates the bank in four steps: the users (one password hash shared by all), the accounts with an empty
+    balance, the transaction history in chunks of SEED_BANK_CHUNK_SIZE spread over a process pool on postgres,
+    and finally the opening balances. Each account opens, right before the history starts, with what its lowest
+    point in the history needs plus a random cushion, so no balance ever goes negative and every balance is the
+    sum of its ledger entries. Rows are written with COPY on postgres and bulk_create elsewhere.
+    """
+    def __init__(self, users, accounts, cards=0, transactions=0, days=365, seed=0, until=UNTIL, workers=None, password='password'):
+        self.users, self.accounts, self.cards, self.transactions = users, accounts, cards, transactions
+        self.days, self.seed, self.password = days, seed, password
+        self.until = until
+        self.start = self.until - timedelta(days=days)
+        self.workers = settings.SEED_BANK_WORKERS if workers is None else workers
+        if not supports_copy():
+            # in-memory or file databases can't be shared with other processes
+            self.workers = 0
+        self.rng = random.Random(seed)
+
+    def run(self):
+        matrix = exchange_rates.current_matrix()
+        currencies = sorted(
+            code for code in Currencies.objects.filter(is_active=True).values_list('currency_code', flat=True)
+            if matrix.get('EUR', code) is not None and matrix.get(code, 'EUR') is not None
+        )
+        if not currencies:
+            raise ValueError("No active currency with exchange rates to and from EUR.")
+        if self.accounts and not self.users:
+            raise ValueError("Accounts need users to belong to.")
+        if self.cards and not self.accounts:
+            raise ValueError("Cards need accounts to belong to.")
+        if self.transactions and self.accounts < 2:
+            raise ValueError("The transaction history needs at least 2 accounts.")
+
+        users = self.create_users()
+        accounts = self.create_accounts(users, currencies)
+        self.create_cards(accounts)
+        changes = self.create_history(accounts, matrix)
+        self.open_balances(accounts, changes, matrix)
+
+    def create_users(self):
+        prefix = f"seed{self.seed}_"
+        if CustomUser.objects.filter(username__startswith=prefix).exists():
+            raise ValueError(f"The bank of seed {self.seed} is already there, pick another seed.")
+
+        # hashing is what would take the time, every user gets the same hash
+        password = make_password(self.password)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=password, date_joined=self.start)
+            for i in range(self.users)
+        ], batch_size=5000)
+        logger('TRANSACTIONS').info("Seeded %s users", len(users))
+        return [user.pk for user in users]
+
+    def create_accounts(self, users, currencies):
+        """The accounts as (id, currency), they start empty and are opened once the history is known"""
+        accounts = [(random_uuid(self.rng), self.rng.choice(currencies)) for _ in range(self.accounts)]
+        owners = [self.rng.choice(users) for _ in accounts]
+        with transaction.atomic():
+            write_rows(Account, ACCOUNT_FIELDS, [
+                (account_id, iban, ZERO, self.start, currency, owner, True)
+                for (account_id, currency), owner, iban in zip(accounts, owners, iban_allocator.allocate_many(len(accounts)))
+            ])
+        logger('TRANSACTIONS').info("Seeded %s accounts", len(accounts))
+        return accounts
+
+    def create_cards(self, accounts):
+        numbers = card_number_pool(self.cards, rng=self.rng)
+        write_rows(Card, CARD_FIELDS, [
+            (number, self.rng.choice(Card.CardTypes.values), random_cvv(self.rng), self.rng.choice(accounts)[0])
+            for number in numbers
+        ])
+
+    def create_history(self, accounts, matrix):
+        """Write the history chunk by chunk, returns the net change and lowest running change of every account"""
+        chunk_size = settings.SEED_BANK_CHUNK_SIZE
+        chunks = -(-self.transactions // chunk_size)
+        plan = HistoryPlan(self.seed, self.transactions, chunk_size, self.start, (self.until - self.start) / max(chunks, 1), accounts, matrix)
+
+        if self.workers:
+            # forked workers must not share the connection of this process
+            connections.close_all()
+            pool = ProcessPoolExecutor(self.workers, initializer=start_worker, initargs=(plan,))
+            results = pool.map(write_chunk, range(chunks))
+        else:
+            pool = None
+            start_worker(plan)
+            results = map(write_chunk, range(chunks))
+
+        # the chunks cover consecutive time windows, combined in order they give the running balance of the whole history
+        net, low = {}, {}
+        try:
+            for index, chunk in enumerate(results, start=1):
+                for position, (chunk_net, chunk_low) in chunk.items():
+                    before = net.get(position, ZERO)
+                    low[position] = min(low.get(position, ZERO), before + chunk_low)
+                    net[position] = before + chunk_net
+                logger('TRANSACTIONS').info("Seeded %s of %s history chunks", index, chunks)
+        finally:
+            if pool:
+                pool.shutdown()
+        return net, low
+
+    def open_balances(self, accounts, changes, matrix):
+        """Opening ledger entry of every account and its final balance"""
+        net, low = changes
+        openings, balances = [], {}
+        for position, (account_id, currency) in enumerate(accounts):
+            cushion = Decimal(self.rng.randint(10000, 1000000)) / 100
+            opening = convert(matrix, cushion, 'EUR', currency) - low.get(position, ZERO)
+            openings.append((account_id, opening, None, LedgerEntry.EntryTypes.OPENING, self.start))
+            balances[account_id] = opening + net.get(position, ZERO)
+
+        with transaction.atomic():
+            write_rows(LedgerEntry, LEDGER_FIELDS, openings)
+            update_field(Account, 'balance', balances)
@@ -1,12 +1,12 @@
 from .models import Transaction
-from rest_framework.serializers import ModelSerializer, ValidationError
+from rest_framework.serializers import ModelSerializer, Serializer, ValidationError, UUIDField, DecimalField, CharField, ChoiceField
 from accounts.models import Account
 from uuid import UUID
 
 class TransactionSerializer(ModelSerializer):
     class Meta:
         model = Transaction
-        fields = ['from_account', 'amount', 'currency', 'transaction_type', 'to_account']
+        fields = ['id', 'from_account', 'amount', 'currency', 'transaction_type', 'to_account', 'date']
 
     def validate(self, data):
         if data["amount"] <= 0:
@@ -21,4 +21,26 @@ class TransactionSerializer(ModelSerializer):
         if data['transaction_type'] == 'DEBIT' and not data['from_account']:
             raise ValidationError({"from_account": "Cannot DEBIT without a 'from_account'."})
         
-        return data
\ No newline at end of file
+        return data
+
+
+class BatchTransactionSerializer(Serializer):
+    """Field level validation for the items of a transaction batch, the accounts and currencies are left as plain
+    ids so they can be loaded for the whole batch at once"""
+    from_account = UUIDField(required=False, allow_null=True)
+    to_account = UUIDField(required=False, allow_null=True)
+    amount = DecimalField(max_digits=10, decimal_places=2)
+    currency = CharField(max_length=10, required=False, allow_null=True)
+    transaction_type = ChoiceField(choices=Transaction.TransactionTypes.choices)
+
+    def validate(self, data):
+        if data["amount"] <= 0:
+            raise ValidationError("Amount must be greater than 0.")
+
+        if data['transaction_type'] == 'CREDIT' and not data.get('to_account'):
+            raise ValidationError({"to_account": "Cannot CREDIT without a 'to_account'."})
+
+        if data['transaction_type'] == 'DEBIT' and not data.get('from_account'):
+            raise ValidationError({"from_account": "Cannot DEBIT without a 'from_account'."})
+
+        return data
@@ -0,0 +1,60 @@
+import csv
+import json
+from django.conf import settings
+from .models import BalanceSnapshot, LedgerEntry
+
+# Account statements, generated row by row so they can be streamed no matter how long they are
+
+STATEMENT_COLUMNS = ['date', 'transaction', 'type', 'amount', 'balance']
+
+
+class Echo:
+    """File-like object handing back what's written, lets csv.writer feed a streaming response"""
+    def write(self, value):
+        return value
+
+
+def opening_balance(account, start):
+    """Balance of the account right before start, from the nearest snapshot instead of the whole ledger"""
+    return BalanceSnapshot.balance_as_of(account, start, inclusive=False)
+
+
+def statement_rows(account, start, end):
+    """Yield the statement rows between start and end with a running balance.
+    Reads plain tuples of the narrow ledger table through a (server side, on postgres) cursor, so memory stays flat"""
+    balance = opening_balance(account, start)
+    rows = (
+        LedgerEntry.objects
+        .filter(account=account, created_at__gte=start, created_at__lte=end)
+        .order_by('created_at', 'sequence')
+        .values_list('created_at', 'transaction_id', 'entry_type', 'amount')
+        .iterator(chunk_size=settings.STATEMENT_CHUNK_SIZE)
+    )
+
+    for created_at, transaction_id, entry_type, amount in rows:
+        balance += amount
+        yield {
+            'date': created_at.isoformat(),
+            'transaction': str(transaction_id or ''),
+            'type': entry_type,
+            'amount': str(amount),
+            'balance': str(balance),
+        }
+
+
+def render_csv(rows):
+    writer = csv.DictWriter(Echo(), fieldnames=STATEMENT_COLUMNS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+RENDERERS = {
+    'csv': (render_csv, 'text/csv'),
+    'ndjson': (render_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,339 @@
+import csv
+import json
+import pytest
+from datetime import UTC, date, datetime
+from io import StringIO
+from decimal import Decimal
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.utils import timezone
+from accounts.models import Account, Card, Currencies
+from accounts.rates import exchange_rates
+from transactions import partitioning
+from transactions.importer import rate_rows
+from transactions.models import BalanceSnapshot, LedgerEntry, Transaction
+from users.models import CustomUser
+
+
+@pytest.fixture
+def account():
+    currency = Currencies.objects.create(currency_name='Euro', currency_code='EUR', is_active=True)
+    user = CustomUser.objects.create(username='testuser', email='test@example.com', password='testpass')
+    return Account.objects.create(balance=Decimal('1000.00'), currency=currency, user=user, is_active=True)
+
+
+@pytest.mark.django_db
+def test_rebuild_balances_command(account):
+    Account.objects.filter(pk=account.pk).update(balance=Decimal('1.00'))
+    out = StringIO()
+    call_command('rebuild_balances', stdout=out)
+    account.refresh_from_db()
+    assert account.balance == Decimal('1000.00')
+    assert "1 account balance(s) rebuilt" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_snapshot_balances_command_respects_interval(account):
+    out = StringIO()
+    call_command('snapshot_balances', '--as-of', timezone.now().isoformat(), stdout=out)
+    call_command('snapshot_balances', stdout=out)
+    assert BalanceSnapshot.objects.count() == 1
+    assert "nothing to do" in out.getvalue()
+
+
+@pytest.fixture
+def currencies():
+    Currencies.objects.create(currency_name='Euro', currency_code='EUR', is_active=True)
+    Currencies.objects.create(currency_name='Dollar', currency_code='USD', is_active=True)
+
+
+def seed_bank(seed, stdout=None):
+    # worker processes couldn't see the rows of the test transaction
+    call_command('seed_bank', '--users', '5', '--accounts', '10', '--cards', '4', '--transactions', '300', '--seed', str(seed),
+                 '--until', '2026-01-01T00:00:00+00:00', '--days', '30', '--workers', '0', stdout=stdout or StringIO())
+
+
+@pytest.mark.django_db
+def test_seed_bank_balances_follow_the_ledger(currencies, settings):
+    """Every generated balance is the sum of its ledger entries and never goes negative along the history"""
+    settings.SEED_BANK_CHUNK_SIZE = 100
+    out = StringIO()
+    seed_bank(1, stdout=out)
+
+    assert "5 user(s), 10 account(s), 4 card(s) and 300 transaction(s) seeded" in out.getvalue()
+    assert Transaction.objects.count() == 300
+    assert Card.objects.count() == 4
+
+    running = {}
+    for account_id, amount in LedgerEntry.objects.order_by('created_at', 'sequence').values_list('account_id', 'amount'):
+        running[account_id] = running.get(account_id, Decimal('0.00')) + amount
+        assert running[account_id] >= 0
+    assert {account.pk: account.balance for account in Account.objects.all()} == running
+
+
+@pytest.mark.django_db
+def test_seed_bank_is_deterministic(currencies, settings):
+    """The same seed generates the same history, another seed a different one"""
+    settings.SEED_BANK_CHUNK_SIZE = 100
+    seed_bank(1)
+    first = list(Transaction.objects.order_by('date').values_list('id', 'amount', 'date'))
+    Transaction.objects.all().delete()
+
+    seed_bank(2)
+    assert list(Transaction.objects.order_by('date').values_list('id', 'amount', 'date')) != first
+    Transaction.objects.all().delete()
+    CustomUser.objects.filter(username__startswith='seed1_').delete()
+
+    seed_bank(1)
+    assert list(Transaction.objects.order_by('date').values_list('id', 'amount', 'date')) == first
+
+
+@pytest.mark.django_db
+def test_seed_bank_history_ends_at_a_fixed_date(currencies):
+    """Without --until the history ends at the same date whenever it's seeded"""
+    call_command('seed_bank', '--users', '2', '--accounts', '3', '--transactions', '50', '--days', '10', '--workers', '0', stdout=StringIO())
+
+    dates = Transaction.objects.values_list('date', flat=True)
+    assert min(dates) >= datetime(2025, 12, 22, tzinfo=UTC)
+    assert max(dates) < datetime(2026, 1, 1, tzinfo=UTC)
+
+
+@pytest.mark.django_db
+def test_seed_bank_refuses_an_existing_seed(currencies):
+    seed_bank(1)
+    with pytest.raises(CommandError, match="already there"):
+        seed_bank(1)
+
+
+@pytest.fixture
+def accounts(currencies):
+    user = CustomUser.objects.create(username='importer', email='importer@example.com', password='testpass')
+    return [Account.objects.create(balance=Decimal('100.00'), currency_id='EUR', user=user) for _ in range(2)]
+
+
+@pytest.mark.django_db
+def test_import_transactions_moves_balances_and_rejects_bad_rows(accounts, tmp_path):
+    """Valid rows keep their dates and move the balances through the ledger, bad rows land in the reject file"""
+    source, target = accounts
+    path = tmp_path / 'history.csv'
+    path.write_text(
+        "transaction_type,amount,currency,from_account,to_account,date\n"
+        f"TRANSFER,40.00,EUR,{source.pk},{target.pk},2024-03-01T10:00:00+00:00\n"
+        f"CREDIT,25.50,EUR,,{source.pk},2024-03-02T10:00:00+00:00\n"
+        f"DEBIT,abc,EUR,{source.pk},,2024-03-03T10:00:00+00:00\n"
+        f"DEBIT,10.00,XXX,{source.pk},,2024-03-03T10:00:00+00:00\n"
+        f"DEBIT,1000.00,EUR,{target.pk},,2024-03-04T10:00:00+00:00\n"
+        f"CREDIT,30.00,EUR,,{Account._meta.pk.default()},2024-03-04T10:00:00+00:00\n"
+    )
+    out, err = StringIO(), StringIO()
+    call_command('import_transactions', str(path), stdout=out, stderr=err)
+
+    assert "2 transaction(s) imported, 4 row(s) rejected" in out.getvalue()
+    source.refresh_from_db()
+    target.refresh_from_db()
+    assert source.balance == Decimal('85.50')
+    assert target.balance == Decimal('140.00')
+    assert LedgerEntry.objects.filter(entry_type=LedgerEntry.EntryTypes.MOVEMENT).count() == 3
+    assert sorted(date.isoformat() for date in Transaction.objects.values_list('date', flat=True)) == [
+        '2024-03-01T10:00:00+00:00', '2024-03-02T10:00:00+00:00'
+    ]
+
+    with open(f"{path}.rejects.csv") as rejects:
+        errors = {int(row['row']): row['error'] for row in csv.DictReader(rejects)}
+    assert errors == {
+        3: "Invalid amount abc",
+        4: "The currency does not exist.",
+        5: "Insufficient funds in 'from_account'.",
+        6: "The 'to_account' does not exist.",
+    }
+
+
+@pytest.mark.django_db
+def test_import_transactions_rejects_in_file_order(accounts, tmp_path):
+    """Like create_batch, only the debits that would overdraw the account at their turn in the file are rejected,
+    the earlier and later ones still go through. A rejected transfer doesn't credit its target"""
+    source, target = accounts
+    path = tmp_path / 'history.csv'
+    path.write_text(
+        "transaction_type,amount,currency,from_account,to_account\n"
+        f"DEBIT,60.00,EUR,{source.pk},\n"
+        f"TRANSFER,60.00,EUR,{source.pk},{target.pk}\n"
+        f"DEBIT,30.00,EUR,{source.pk},\n"
+        f"DEBIT,150.00,EUR,{target.pk},\n"
+        f"DEBIT,100.00,EUR,{target.pk},\n"
+    )
+    out = StringIO()
+    call_command('import_transactions', str(path), stdout=out, stderr=StringIO())
+
+    assert "3 transaction(s) imported, 2 row(s) rejected" in out.getvalue()
+    with open(f"{path}.rejects.csv") as rejects:
+        errors = {int(row['row']): row['error'] for row in csv.DictReader(rejects)}
+    assert errors == {2: "Insufficient funds for transfer in 'from_account'.", 4: "Insufficient funds in 'from_account'."}
+    source.refresh_from_db()
+    target.refresh_from_db()
+    assert (source.balance, target.balance) == (Decimal('10.00'), Decimal('0.00'))
+
+
+@pytest.mark.django_db
+def test_import_transactions_dependent_overdrafts(accounts, tmp_path):
+    """Money passed along a chain of empty accounts arrives, a chain fed by a rejected transfer is rejected link by link"""
+    source, target = accounts
+    funded = [Account.objects.create(balance=Decimal('0.00'), currency_id='EUR', user=source.user) for _ in range(21)]
+    unfunded = [Account.objects.create(balance=Decimal('0.00'), currency_id='EUR', user=source.user) for _ in range(21)]
+    rows = [(source, funded[0], '60.00')] + list(zip(funded, funded[1:], ['60.00'] * 20))
+    rows += [(source, unfunded[0], '50.00')] + list(zip(unfunded, unfunded[1:], ['50.00'] * 20))
+    rows += [(funded[-1], target, '60.00')]
+    path = tmp_path / 'history.csv'
+    path.write_text("transaction_type,amount,currency,from_account,to_account\n" + ''.join(
+        f"TRANSFER,{amount},EUR,{from_account.pk},{to_account.pk}\n" for from_account, to_account, amount in rows
+    ))
+    out = StringIO()
+    call_command('import_transactions', str(path), '--batch-size', '10', stdout=out, stderr=StringIO())
+
+    assert "22 transaction(s) imported, 21 row(s) rejected" in out.getvalue()
+    with open(f"{path}.rejects.csv") as rejects:
+        assert [int(row['row']) for row in csv.DictReader(rejects)] == list(range(22, 43))
+    balances = dict(Account.objects.values_list('pk', 'balance'))
+    assert (balances[source.pk], balances[target.pk]) == (Decimal('40.00'), Decimal('160.00'))
+    assert all(balances[account.pk] == Decimal('0.00') for account in funded + unfunded)
+
+
+@pytest.mark.django_db
+def test_import_transactions_corrects_later_snapshots(accounts, tmp_path):
+    """Imported history dated before a snapshot is part of the point in time balances after it"""
+    source, target = accounts
+    LedgerEntry.objects.filter(account__in=accounts).update(created_at=datetime(2024, 1, 1, tzinfo=UTC))
+    BalanceSnapshot.take(as_of=datetime(2024, 6, 1, tzinfo=UTC))
+    path = tmp_path / 'history.csv'
+    path.write_text(
+        "transaction_type,amount,currency,from_account,to_account,date\n"
+        f"TRANSFER,30.00,EUR,{source.pk},{target.pk},2024-03-01T00:00:00Z\n"
+        f"TRANSFER,5.00,EUR,{source.pk},{target.pk},2024-09-01T00:00:00Z\n"
+    )
+    call_command('import_transactions', str(path), stdout=StringIO(), stderr=StringIO())
+
+    assert BalanceSnapshot.balance_as_of(source, datetime(2024, 2, 1, tzinfo=UTC)) == Decimal('100.00')
+    assert BalanceSnapshot.balance_as_of(source, datetime(2024, 7, 1, tzinfo=UTC)) == Decimal('70.00')
+    assert BalanceSnapshot.balance_as_of(target, datetime(2024, 7, 1, tzinfo=UTC)) == Decimal('130.00')
+    assert BalanceSnapshot.balance_as_of(source, datetime(2024, 10, 1, tzinfo=UTC)) == Decimal('65.00')
+
+
+@pytest.mark.django_db
+def test_import_transactions_rounds_half_even(accounts, tmp_path):
+    """Converted amounts round to cents like the API does, 12.10 USD at 0.85 is 10.285 and gives 10.28 EUR"""
+    source, target = accounts
+    path = tmp_path / 'history.csv'
+    path.write_text(
+        "transaction_type,amount,currency,from_account,to_account\n"
+        f"TRANSFER,12.10,USD,{source.pk},{target.pk}\n"
+    )
+    call_command('import_transactions', str(path), stdout=StringIO(), stderr=StringIO())
+
+    source.refresh_from_db()
+    target.refresh_from_db()
+    assert (source.balance, target.balance) == (Decimal('89.72'), Decimal('110.28'))
+
+
+@pytest.mark.django_db
+def test_import_transactions_same_currency_needs_no_rate(currencies, tmp_path):
+    """A currency without any exchange rate still converts to itself, on every backend"""
+    Currencies.objects.create(currency_name='Pound', currency_code='GBP', is_active=True)
+    user = CustomUser.objects.create(username='pounds', email='pounds@example.com', password='testpass')
+    source, target = [Account.objects.create(balance=Decimal('100.00'), currency_id='GBP', user=user) for _ in range(2)]
+    path = tmp_path / 'history.csv'
+    path.write_text(
+        "transaction_type,amount,currency,from_account,to_account,date\n"
+        f"TRANSFER,40.00,GBP,{source.pk},{target.pk},2024-03-01T10:00:00+00:00\n"
+    )
+    out = StringIO()
+    call_command('import_transactions', str(path), stdout=out, stderr=StringIO())
+
+    assert "1 transaction(s) imported, 0 row(s) rejected" in out.getvalue()
+    target.refresh_from_db()
+    assert target.balance == Decimal('140.00')
+
+
+@pytest.mark.django_db
+def test_import_rate_rows_cover_every_currency(currencies):
+    """The staging rates hold the stored and derived pairs plus an identity rate for every currency"""
+    Currencies.objects.create(currency_name='Pound', currency_code='GBP', is_active=True)
+    rates = {(from_currency, to_currency): rate for from_currency, to_currency, rate in
+             rate_rows(exchange_rates.current_matrix(), Currencies.objects.values_list('currency_code', flat=True))}
+
+    assert rates[('GBP', 'GBP')] == 1
+    assert rates[('EUR', 'USD')] == Decimal('1.18')
+    assert ('GBP', 'EUR') not in rates
+
+
+@pytest.mark.django_db
+def test_import_transactions_is_safe_to_rerun(accounts, tmp_path):
+    """Rows with an id already in the table are rejected, so importing a file twice doesn't move money twice"""
+    source, target = accounts
+    path = tmp_path / 'history.ndjson'
+    path.write_text(json.dumps({
+        'id': '6f1c3ef4-3a4b-4f7e-9d9e-3c1b2f6a7d10', 'transaction_type': 'TRANSFER', 'amount': '10.00', 'currency': 'EUR',
+        'from_account': str(source.pk), 'to_account': str(target.pk), 'date': '2024-01-01T00:00:00Z',
+    }) + '\n')
+
+    call_command('import_transactions', str(path), stdout=StringIO(), stderr=StringIO())
+    out = StringIO()
+    call_command('import_transactions', str(path), stdout=out, stderr=StringIO())
+
+    assert "0 transaction(s) imported, 1 row(s) rejected" in out.getvalue()
+    source.refresh_from_db()
+    assert source.balance == Decimal('90.00')
+
+
+def test_partition_months():
+    """Partitions are named and bounded by calendar month, ranges wrap over the year end"""
+    assert list(partitioning.months_between(datetime(2024, 11, 15), date(2025, 2, 1))) == [
+        date(2024, 11, 1), date(2024, 12, 1), date(2025, 1, 1), date(2025, 2, 1)
+    ]
+    assert partitioning.add_months(date(2024, 12, 1), 3) == date(2025, 3, 1)
+    assert partitioning.partition_name(date(2025, 1, 1)) == 'transactions_transaction_p202501'
+    assert partitioning.bounds(date(2024, 12, 1)) == ("'2024-12-01 00:00:00+00'", "'2025-01-01 00:00:00+00'")
+
+
+@pytest.mark.django_db
+def test_partition_transactions_needs_postgres():
+    with pytest.raises(CommandError, match="needs postgres"):
+        call_command('partition_transactions', '--enable', stdout=StringIO())
+    with pytest.raises(CommandError, match="Invalid month"):
+        call_command('partition_transactions', '--detach-before', '2024', stdout=StringIO())
+
+
+def partition_count(name):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(name)}")
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="Partitioning requires postgres")
+def test_partitioned_transactions(currencies):
+    """On a seeded bank a date range only scans its months, a new month takes its rows out of the default
+    partition and old months detach with their rows"""
+    call_command('seed_bank', '--users', '5', '--accounts', '10', '--transactions', '300', '--seed', '1',
+                 '--until', '2026-01-01T00:00:00+00:00', '--days', '90', '--workers', '0', stdout=StringIO())
+    partitioning.enable(months_ahead=0)
+    assert Transaction.objects.count() == 300
+
+    plan = Transaction.objects.filter(date__gte=datetime(2025, 11, 1, tzinfo=UTC), date__lt=datetime(2025, 12, 1, tzinfo=UTC)).explain()
+    assert 'transactions_transaction_p202511' in plan
+    assert not any(name in plan for name in ['transactions_transaction_p202510', 'transactions_transaction_p202512', 'transactions_transaction_default'])
+
+    # June has no partition yet, its rows wait in the default one
+    Transaction.objects.bulk_create([
+        Transaction(transaction_type='CREDIT', amount=Decimal('50.00'), date=datetime(2025, 6, 15, tzinfo=UTC), to_account=Account.objects.first(), currency_id='EUR')
+    ])
+    assert partition_count('transactions_transaction_default') == 1
+    assert partitioning.create_partitions(date(2025, 6, 1), date(2025, 6, 1)) == ['transactions_transaction_p202506']
+    assert partition_count('transactions_transaction_default') == 0
+    assert partition_count('transactions_transaction_p202506') == 1
+
+    october = partition_count('transactions_transaction_p202510')
+    assert october
+    assert partitioning.detach_partitions(date(2025, 11, 1)) == ['transactions_transaction_p202506', 'transactions_transaction_p202510']
+    assert not Transaction.objects.filter(date__lt=datetime(2025, 11, 1, tzinfo=UTC)).exists()
+    assert Transaction.objects.count() == 300 - october
+    assert partition_count('transactions_transaction_p202510') == october
@@ -0,0 +1,71 @@
+import pytest
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.db import connection, connections
+from transactions.models import Transaction
+from accounts.models import Account, Currencies
+from users.models import CustomUser
+
+TRANSFER_COUNT = 2000
+WORKERS = 16
+ACCOUNT_COUNT = 4
+INITIAL_BALANCE = Decimal('1000.00')
+
+# SQLite doesn't support row locks and its in-memory test database can't be shared
+# between threads, so the stress test only runs against postgres
+pytestmark = pytest.mark.skipif(connection.vendor != 'postgresql', reason="Row locking requires postgres")
+
+
+@pytest.fixture
+def hot_accounts():
+    """A handful of accounts that every transfer competes for"""
+    currency, _ = Currencies.objects.get_or_create(currency_code='EUR', defaults={'currency_name': 'Euro'})
+    user = CustomUser.objects.create_user(username='stress', email='stress@test.com', password='password')
+    return [
+        Account.objects.create(balance=INITIAL_BALANCE, currency=currency, user=user, is_active=True)
+        for _ in range(ACCOUNT_COUNT)
+    ]
+
+
+def transfer(from_account_id, to_account_id, amount):
+    """Run a single transfer on its own connection, returns whether it went through"""
+    try:
+        Transaction.objects.create(
+            transaction_type='TRANSFER',
+            amount=amount,
+            from_account=Account.objects.get(pk=from_account_id),
+            to_account=Account.objects.get(pk=to_account_id),
+            currency_id='EUR',
+        )
+        return True
+    except ValueError:
+        return False
+    finally:
+        connections.close_all()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_transfers_conserve_money(hot_accounts):
+    """Thousands of parallel transfers between the same accounts neither lose updates nor deadlock"""
+    rng = random.Random(42)
+    ids = [account.pk for account in hot_accounts]
+    transfers = []
+    for _ in range(TRANSFER_COUNT):
+        from_id, to_id = rng.sample(ids, 2)
+        transfers.append((from_id, to_id, Decimal(rng.randint(1, 50))))
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        results = list(executor.map(lambda args: transfer(*args), transfers))
+
+    expected = Counter({account_id: INITIAL_BALANCE for account_id in ids})
+    for (from_id, to_id, amount), succeeded in zip(transfers, results):
+        if succeeded:
+            expected[from_id] -= amount
+            expected[to_id] += amount
+
+    balances = dict(Account.objects.filter(pk__in=ids).values_list('id', 'balance'))
+    assert sum(balances.values()) == INITIAL_BALANCE * ACCOUNT_COUNT
+    assert balances == dict(expected)
+    assert Transaction.objects.count() == sum(results)
@@ -107,4 +107,182 @@ def test_amount_too_small_credit(active_account):
 def test_amount_exceeds_limit_credit(active_account):
     with pytest.raises(ValueError) as excinfo:
         Transaction.objects.create(transaction_type='CREDIT', amount=Decimal('15000.00'), to_account=active_account)
-        assert str(excinfo.value) == "The amount exceeds the 10,000 limit."
\ No newline at end of file
+        assert str(excinfo.value) == "The amount exceeds the 10,000 limit."
+
+@pytest.mark.django_db
+def test_transfer_rereads_balance_under_lock(active_account, active_currency):
+    """The balance is re-read under the row lock, a stale in-memory balance can't be used for the transfer"""
+    account2 = Account.objects.create(balance=Decimal('500.00'), currency=active_account.currency, user=active_account.user, is_active=True)
+    Account.objects.filter(pk=active_account.pk).update(balance=Decimal('50.00'))
+
+    with pytest.raises(ValueError):
+        Transaction.objects.create(transaction_type='TRANSFER', amount=Decimal('150.00'), from_account=active_account, to_account=account2, currency=active_currency)
+
+    account2.refresh_from_db()
+    assert account2.balance == Decimal('500.00')
+    assert Transaction.objects.count() == 0
+
+@pytest.fixture
+def conditional_update_mode(settings):
+    settings.TRANSACTION_EXECUTION_MODE = Transaction.ExecutionModes.CONDITIONAL_UPDATE
+
+@pytest.mark.django_db
+def test_conditional_update_transfer(conditional_update_mode, active_account, active_currency):
+    """The conditional update mode moves the money with plain UPDATE statements"""
+    account2 = Account.objects.create(balance=Decimal('500.00'), currency=active_account.currency, user=active_account.user, is_active=True)
+    Transaction.objects.create(transaction_type='TRANSFER', amount=Decimal('150.00'), from_account=active_account, to_account=account2, currency=active_currency)
+    active_account.refresh_from_db()
+    account2.refresh_from_db()
+    assert active_account.balance == Decimal('850.00')
+    assert account2.balance == Decimal('650.00')
+
+@pytest.mark.django_db
+def test_conditional_update_insufficient_funds(conditional_update_mode, active_account, active_currency):
+    """A debit that doesn't match any row is reported as insufficient funds and leaves no trace"""
+    account2 = Account.objects.create(balance=Decimal('500.00'), currency=active_account.currency, user=active_account.user, is_active=True)
+    with pytest.raises(ValueError) as excinfo:
+        Transaction.objects.create(transaction_type='TRANSFER', amount=Decimal('1500.00'), from_account=active_account, to_account=account2, currency=active_currency)
+    assert str(excinfo.value) == "Insufficient funds for transfer in 'from_account'."
+    account2.refresh_from_db()
+    assert account2.balance == Decimal('500.00')
+    assert Transaction.objects.count() == 0
+
+@pytest.mark.django_db
+def test_conditional_update_inactive_currency(conditional_update_mode, active_account, active_currency):
+    """Account.save's currency check still holds for the conditional updates"""
+    Currencies.objects.create(currency_name='Lek', currency_code='ALL', is_active=True)
+    Account.objects.filter(pk=active_account.pk).update(currency='ALL')
+    Currencies.objects.filter(currency_code='ALL').update(is_active=False)
+    active_account.refresh_from_db()
+    with pytest.raises(ValidationError) as excinfo:
+        Transaction.objects.create(transaction_type='DEBIT', amount=Decimal('100.00'), from_account=active_account, currency_id='ALL')
+    assert excinfo.value == ValidationError("This currency is not active")
+
+@pytest.mark.django_db
+def test_conditional_update_round_trips(conditional_update_mode, active_account, active_currency):
+    """A transfer costs one UPDATE per account, the INSERT and the ledger INSERT"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    account2 = Account.objects.create(balance=Decimal('500.00'), currency=active_account.currency, user=active_account.user, is_active=True)
+    with CaptureQueriesContext(connection) as queries:
+        Transaction.objects.create(transaction_type='TRANSFER', amount=Decimal('150.00'), from_account=active_account, to_account=account2, currency=active_currency)
+    statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+    assert len(statements) == 4
+
+@pytest.mark.django_db
+def test_create_batch_loads_references_once(active_account, active_currency):
+    """A batch costs the same number of queries no matter how many transactions it holds"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    account2 = Account.objects.create(balance=Decimal('500.00'), currency=active_account.currency, user=active_account.user, is_active=True)
+    items = [
+        {'transaction_type': 'TRANSFER', 'amount': Decimal('10.00'), 'from_account': active_account.pk, 'to_account': account2.pk, 'currency': 'EUR'}
+        for _ in range(50)
+    ]
+    with CaptureQueriesContext(connection) as queries:
+        created, failed = Transaction.create_batch(items)
+    statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+
+    assert len(created) == 50 and failed == []
+    assert len(statements) == 4
+    active_account.refresh_from_db()
+    account2.refresh_from_db()
+    assert active_account.balance == Decimal('500.00')
+    assert account2.balance == Decimal('1000.00')
+
+@pytest.mark.django_db
+def test_transfer_writes_ledger_entries(active_account, active_currency):
+    """Each side of a transfer gets its own signed ledger entry and the ledger adds up to the balance"""
+    from transactions.models import LedgerEntry
+    account2 = Account.objects.create(balance=Decimal('500.00'), currency=active_account.currency, user=active_account.user, is_active=True)
+    transaction = Transaction.objects.create(transaction_type='TRANSFER', amount=Decimal('150.00'), from_account=active_account, to_account=account2, currency=active_currency)
+
+    entries = LedgerEntry.objects.filter(transaction=transaction)
+    assert sorted(entries.values_list('amount', flat=True)) == [Decimal('-150.00'), Decimal('150.00')]
+    assert LedgerEntry.balance_of(active_account) == Decimal('850.00')
+    assert LedgerEntry.balance_of(account2) == Decimal('650.00')
+
+@pytest.mark.django_db
+def test_ledger_entries_are_insert_only(active_account):
+    from transactions.models import LedgerEntry
+    entry = LedgerEntry.objects.get(account=active_account)
+    entry.amount = Decimal('1.00')
+    with pytest.raises(ValidationError):
+        entry.save()
+    with pytest.raises(ValidationError):
+        entry.delete()
+
+@pytest.mark.django_db
+def test_rebuild_balances_from_ledger(active_account):
+    """A balance changed behind the ledger's back is reported and restored"""
+    from transactions.models import LedgerEntry
+    Account.objects.filter(pk=active_account.pk).update(balance=Decimal('5.00'))
+
+    assert LedgerEntry.rebuild_balances(dry_run=True) == [(active_account.pk, Decimal('5.00'), Decimal('1000.00'))]
+    LedgerEntry.rebuild_balances()
+    active_account.refresh_from_db()
+    assert active_account.balance == Decimal('1000.00')
+    assert LedgerEntry.rebuild_balances() == []
+
+@pytest.mark.django_db
+def test_rebuild_balances_with_transaction_in_between(active_account, active_currency):
+    """A debit committing after the accounts are listed and before they are locked is neither reported nor undone"""
+    from django.db import connection
+    from transactions.models import LedgerEntry
+    ran = []
+
+    def debit_after_first_query(execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if not ran:
+            ran.append(sql)
+            Transaction.objects.create(transaction_type='DEBIT', amount=Decimal('100.00'), from_account=active_account, currency=active_currency)
+        return result
+
+    with connection.execute_wrapper(debit_after_first_query):
+        assert LedgerEntry.rebuild_balances() == []
+    active_account.refresh_from_db()
+    assert active_account.balance == Decimal('900.00') == LedgerEntry.balance_of(active_account)
+
+@pytest.mark.django_db
+def test_balance_as_of_uses_snapshots(active_account, active_currency, django_assert_num_queries):
+    """Point in time balances start from the nearest earlier snapshot and replay the ledger after it"""
+    from datetime import timedelta
+    from django.utils import timezone
+    from transactions.models import LedgerEntry, BalanceSnapshot
+    now = timezone.now()
+    LedgerEntry.objects.filter(account=active_account).update(created_at=now - timedelta(days=10))
+    credit = Transaction.objects.create(transaction_type='CREDIT', amount=Decimal('100.00'), to_account=active_account, currency=active_currency)
+    LedgerEntry.objects.filter(transaction=credit).update(created_at=now - timedelta(days=5))
+
+    assert BalanceSnapshot.take(as_of=now - timedelta(days=3)) == 1
+    Transaction.objects.create(transaction_type='DEBIT', amount=Decimal('30.00'), from_account=active_account, currency=active_currency)
+
+    assert BalanceSnapshot.balance_as_of(active_account, now - timedelta(days=20)) == Decimal('0.00')
+    assert BalanceSnapshot.balance_as_of(active_account, now - timedelta(days=7)) == Decimal('1000.00')
+    assert BalanceSnapshot.balance_as_of(active_account, now - timedelta(days=2)) == Decimal('1100.00')
+    with django_assert_num_queries(2):
+        assert BalanceSnapshot.balance_as_of(active_account, timezone.now()) == Decimal('1070.00')
+
+@pytest.mark.django_db
+def test_snapshots_build_on_the_previous_run(active_account, active_currency):
+    from datetime import timedelta
+    from django.utils import timezone
+    from transactions.models import BalanceSnapshot
+    now = timezone.now()
+    BalanceSnapshot.take(as_of=now)
+    Transaction.objects.create(transaction_type='DEBIT', amount=Decimal('30.00'), from_account=active_account, currency=active_currency)
+    BalanceSnapshot.take(as_of=timezone.now() + timedelta(seconds=1))
+
+    assert list(BalanceSnapshot.objects.order_by('taken_at').values_list('balance', flat=True)) == [Decimal('1000.00'), Decimal('970.00')]
+
+@pytest.mark.parametrize('mode', Transaction.ExecutionModes.values)
+@pytest.mark.django_db
+def test_transfer_does_not_query_currencies(mode, settings, active_account, active_currency):
+    """Currencies come from the process local registry, a transfer never reads the currency table"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    settings.TRANSACTION_EXECUTION_MODE = mode
+    account2 = Account.objects.create(balance=Decimal('500.00'), currency=active_account.currency, user=active_account.user, is_active=True)
+    with CaptureQueriesContext(connection) as queries:
+        Transaction.objects.create(transaction_type='TRANSFER', amount=Decimal('150.00'), from_account=active_account, to_account=account2, currency=active_currency)
+    assert not [query for query in queries if 'accounts_currencies' in query['sql']]
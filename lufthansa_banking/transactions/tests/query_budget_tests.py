@@ -0,0 +1,78 @@
+import pytest
+from decimal import Decimal
+from django.urls import reverse
+from accounts.models import Account, Currencies
+from transactions.models import Transaction
+
+# Every transaction endpoint within its baseline query budget, with enough rows to show an N+1
+
+
+@pytest.fixture
+def accounts(customer):
+    """A few accounts of the customer in two currencies, with transactions between them"""
+    Currencies.objects.create(currency_name='Euro', currency_code='EUR', is_active=True)
+    Currencies.objects.create(currency_name='Dollar', currency_code='USD', is_active=True)
+    accounts = [Account.objects.create(user=customer, balance=Decimal('1000.00'), currency_id=currency) for currency in ['EUR', 'USD'] * 3]
+    for from_account, to_account in zip(accounts, accounts[1:]):
+        Transaction.objects.create(transaction_type='TRANSFER', from_account=from_account, to_account=to_account, currency_id='EUR', amount=10)
+    return accounts
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('user', ['customer', 'admin_user'])
+def test_transaction_list_budget(api_client, accounts, user, request, query_budget):
+    api_client.force_authenticate(user=request.getfixturevalue(user))
+    with query_budget('TransactionViewSet.list'):
+        response = api_client.get(reverse('transaction-list'))
+    assert len(response.data['results']) == 5
+
+@pytest.mark.django_db
+def test_transaction_retrieve_budget(api_client, accounts, customer, query_budget):
+    api_client.force_authenticate(user=customer)
+    with query_budget('TransactionViewSet.retrieve'):
+        response = api_client.get(reverse('transaction-detail', kwargs={'pk': Transaction.objects.first().pk}))
+    assert response.status_code == 200
+
+@pytest.mark.django_db
+def test_transaction_create_budget(api_client, accounts, customer, query_budget):
+    api_client.force_authenticate(user=customer)
+    data = {'from_account': accounts[0].id, 'to_account': accounts[1].id, 'transaction_type': 'TRANSFER', 'currency': 'USD', 'amount': 10}
+    with query_budget('TransactionViewSet.create'):
+        response = api_client.post(reverse('transaction-list'), data=data, format='json')
+    assert response.status_code == 201
+
+@pytest.mark.django_db
+def test_transaction_partial_update_budget(api_client, accounts, admin_user, query_budget):
+    api_client.force_authenticate(user=admin_user)
+    transaction = Transaction.objects.first()
+    data = {'from_account': transaction.from_account_id, 'to_account': transaction.to_account_id, 'transaction_type': 'TRANSFER', 'currency': 'EUR', 'amount': 12}
+    with query_budget('TransactionViewSet.partial_update'):
+        response = api_client.patch(reverse('transaction-detail', kwargs={'pk': transaction.pk}), data=data, format='json')
+    assert response.status_code == 200
+
+@pytest.mark.django_db
+def test_transaction_destroy_budget(api_client, accounts, admin_user, query_budget):
+    api_client.force_authenticate(user=admin_user)
+    url = reverse('transaction-detail', kwargs={'pk': Transaction.objects.first().pk})
+    with query_budget('TransactionViewSet.destroy'):
+        response = api_client.delete(url)
+    assert response.status_code == 204
+
+@pytest.mark.django_db
+def test_transaction_batch_budget(api_client, accounts, customer, query_budget):
+    api_client.force_authenticate(user=customer)
+    data = [
+        {'from_account': from_account.id, 'to_account': to_account.id, 'transaction_type': 'TRANSFER', 'currency': 'EUR', 'amount': 1}
+        for from_account, to_account in zip(accounts, accounts[1:])
+    ]
+    with query_budget('TransactionViewSet.batch'):
+        response = api_client.post(reverse('transaction-batch'), data=data, format='json')
+    assert response.status_code == 201
+
+@pytest.mark.django_db
+def test_n_plus_one_detected(query_budget):
+    """A query repeated in a loop fails the block even within budget."""
+    from query_budget import QueryBudgetExceeded
+    with pytest.raises(QueryBudgetExceeded, match="Suspected N"):
+        with query_budget(100):
+            for pk in range(5):
+                list(Transaction.objects.filter(pk=pk))
@@ -0,0 +1,61 @@
+import pytest
+from decimal import Decimal
+from django.db import connection
+from accounts.iban import iban_allocator
+from accounts.models import Account, Currencies
+from transactions.models import Transaction
+from users.models import CustomUser
+
+# postgres gets the full sized table, sqlite a smaller one so the suite stays quick
+SEED_SIZE = 1_000_000 if connection.vendor == 'postgresql' else 5_000
+ACCOUNT_COUNT = 1_000
+
+
+@pytest.fixture
+def seeded_history():
+    """Many users with many accounts and a big transaction table between them"""
+    currency = Currencies.objects.create(currency_name='Euro', currency_code='EUR', is_active=True)
+    users = CustomUser.objects.bulk_create([
+        CustomUser(username=f'user{i}', email=f'user{i}@test.com') for i in range(ACCOUNT_COUNT // 10)
+    ])
+    accounts = Account.objects.bulk_create([
+        Account(balance=Decimal('1000.00'), currency=currency, user=users[i % len(users)], iban=iban)
+        for i, iban in enumerate(iban_allocator.allocate_many(ACCOUNT_COUNT))
+    ])
+    account_ids = [str(account.pk) for account in accounts]
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("""
+                INSERT INTO transactions_transaction (id, transaction_type, amount, date, from_account_id, to_account_id, currency_id)
+                SELECT md5(i::text)::uuid, 'TRANSFER', 10, now() - i * interval '1 minute',
+                       (%s::uuid[])[i %% %s + 1], (%s::uuid[])[(i + 1) %% %s + 1], 'EUR'
+                FROM generate_series(1, %s) AS i
+            """, [account_ids, ACCOUNT_COUNT, account_ids, ACCOUNT_COUNT, SEED_SIZE])
+        else:
+            Transaction.objects.bulk_create([
+                Transaction(transaction_type='TRANSFER', amount=Decimal('10.00'), currency=currency,
+                            from_account_id=account_ids[i % ACCOUNT_COUNT], to_account_id=account_ids[(i + 1) % ACCOUNT_COUNT])
+                for i in range(SEED_SIZE)
+            ], batch_size=1000)
+        cursor.execute("ANALYZE")
+    return users[0]
+
+
+@pytest.mark.django_db
+def test_history_query_uses_account_date_indexes(seeded_history):
+    """Both sides of the customer history are answered from the (account, date) indexes"""
+    plan = Transaction.history_for_user(seeded_history)[:100].explain()
+
+    assert 'transaction_from_date_idx' in plan
+    assert 'transaction_to_date_idx' in plan
+
+
+@pytest.mark.django_db
+def test_history_query_is_a_single_query(seeded_history, django_assert_num_queries):
+    """The customer history is fetched with one query, currencies included"""
+    with django_assert_num_queries(1):
+        history = list(Transaction.history_for_user(seeded_history)[:50])
+        currencies = {transaction.currency.currency_code for transaction in history}
+
+    assert currencies == {'EUR'}
@@ -122,7 +122,7 @@ def test_get_transactions_as_admin(api_client, admin_user):
     response = api_client.get(url)
     
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == Transaction.objects.count()
+    assert len(response.data['results']) == Transaction.objects.count()
 
 @pytest.mark.django_db
 def test_get_transactions_as_banker(api_client, banker_user):
@@ -133,7 +133,7 @@ def test_get_transactions_as_banker(api_client, banker_user):
     response = api_client.get(url)
     
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == Transaction.objects.count()
+    assert len(response.data['results']) == Transaction.objects.count()
 
 @pytest.mark.django_db
 def test_get_transactions_as_regular_user(api_client, regular_user, create_transaction):
@@ -144,7 +144,7 @@ def test_get_transactions_as_regular_user(api_client, regular_user, create_trans
     response = api_client.get(url)
     
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 1
+    assert len(response.data['results']) == 1
 
 @pytest.mark.django_db
 def test_delete_transaction_as_admin(api_client, admin_user, create_transaction):
@@ -168,3 +168,109 @@ def test_delete_transaction_as_banker(api_client, banker_user, create_transactio
     
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert Transaction.objects.count() == 0
+
+@pytest.mark.django_db
+def test_batch_create_transactions(api_client, from_acccount, to_account, banker_user):
+    """Test that a batch reports every item and applies the net balance change of the valid ones"""
+    api_client.force_authenticate(user=banker_user)
+    url = reverse('transaction-batch')
+    data = [
+        {'from_account': from_acccount.id, 'to_account': to_account.id, 'transaction_type': 'TRANSFER', 'currency': 'EUR', 'amount': 300},
+        {'from_account': from_acccount.id, 'transaction_type': 'DEBIT', 'currency': 'EUR', 'amount': 5000},
+        {'to_account': to_account.id, 'transaction_type': 'CREDIT', 'currency': 'EUR', 'amount': -5},
+        {'to_account': to_account.id, 'transaction_type': 'CREDIT', 'currency': 'EUR', 'amount': 100},
+    ]
+    response = api_client.post(url, data=data, format='json')
+
+    assert response.status_code == status.HTTP_207_MULTI_STATUS
+    assert [item['index'] for item in response.data['succeeded']] == [0, 3]
+    assert [item['index'] for item in response.data['failed']] == [1, 2]
+    assert Transaction.objects.count() == 2
+    from_acccount.refresh_from_db()
+    to_account.refresh_from_db()
+    assert from_acccount.balance == 700
+    assert to_account.balance == 900
+
+@pytest.mark.django_db
+def test_batch_customer_cannot_debit_foreign_account(api_client, from_acccount, to_account, admin_user):
+    """Test that a customer can't debit someone else's account through a batch"""
+    customer = CustomUser.objects.create_user(email='other@test.com', username="other", password='password', type='CUSTOMER')
+    api_client.force_authenticate(user=customer)
+    url = reverse('transaction-batch')
+    data = [{'from_account': from_acccount.id, 'transaction_type': 'DEBIT', 'currency': 'EUR', 'amount': 100}]
+    response = api_client.post(url, data=data, format='json')
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data['failed'][0]['errors'] == "You can only debit from your own account."
+    assert Transaction.objects.count() == 0
+
+@pytest.mark.django_db
+def test_transactions_keyset_pagination(api_client, admin_user, to_account, active_currency):
+    """Test that following the cursors walks every transaction once, newest first"""
+    for _ in range(5):
+        Transaction.objects.create(transaction_type='CREDIT', to_account=to_account, currency=active_currency, amount=50)
+    api_client.force_authenticate(user=admin_user)
+
+    url = reverse('transaction-list') + '?page_size=2'
+    pages = []
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        pages.append(response.data['results'])
+        url = response.data['next']
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    expected = list(Transaction.objects.order_by('-date', '-id').values_list('id', flat=True))
+    assert [item['id'] for page in pages for item in page] == [str(id) for id in expected]
+
+@pytest.mark.django_db
+def test_transactions_invalid_cursor(api_client, admin_user):
+    """Test that a tampered cursor is rejected"""
+    api_client.force_authenticate(user=admin_user)
+    response = api_client.get(reverse('transaction-list') + '?cursor=bm90LWEtY3Vyc29y')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.django_db
+def test_get_transactions_with_only_incoming_money(api_client, to_account, active_currency):
+    """Test that a customer who only received money still sees it"""
+    Transaction.objects.create(transaction_type='CREDIT', to_account=to_account, currency=active_currency, amount=100)
+    api_client.force_authenticate(user=to_account.user)
+
+    response = api_client.get(reverse('transaction-list'))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == 1
+
+@pytest.mark.django_db
+def test_metrics_per_view(api_client, admin_user, from_acccount, to_account, settings, caplog):
+    """Requests are counted under their view and action, slow ones are logged with their SQL."""
+    settings.METRICS_SLOW_REQUEST_SECONDS = 0
+    settings.METRICS_TOKEN = 'scrape'
+    api_client.force_authenticate(user=admin_user)
+    api_client.get(reverse('transaction-list'))
+    api_client.post(reverse('transaction-batch'), [], format='json')
+
+    response = api_client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape')
+    body = response.content.decode()
+
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{view="TransactionViewSet.list"} 1' in body
+    assert 'http_requests_total{view="TransactionViewSet.batch",method="POST",status="201"} 1' in body
+    assert 'db_queries_total{view="TransactionViewSet.list"} ' in body
+    assert any('TransactionViewSet.list' in record.getMessage() and 'SELECT' in record.getMessage() for record in caplog.records)
+
+@pytest.mark.django_db
+def test_metrics_token(api_client, settings):
+    """With a token configured the scraper has to send it."""
+    settings.METRICS_TOKEN = 'scrape'
+    assert api_client.get(reverse('metrics')).status_code == 403
+    assert api_client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape').status_code == 200
+
+@pytest.mark.django_db
+def test_metrics_closed_without_token(api_client, settings):
+    """Without a token the metrics are only served in DEBUG."""
+    settings.METRICS_TOKEN = ''
+    settings.DEBUG = False
+    assert api_client.get(reverse('metrics')).status_code == 403
+    settings.DEBUG = True
+    assert api_client.get(reverse('metrics')).status_code == 200
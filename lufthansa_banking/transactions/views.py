@@ -1,40 +1,67 @@
 from rest_framework.response import Response
+from django.conf import settings
 
-from .serializers import TransactionSerializer
+from .serializers import TransactionSerializer, BatchTransactionSerializer
 from .models import Transaction
 from utils import logger
+from pagination import TransactionPagination
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 
 class TransactionViewSet(ModelViewSet):
     """Viewset for Transaction model"""
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    pagination_class = TransactionPagination
 
     def perform_create(self, serializer: TransactionSerializer):
         """Transaction POST method"""
         try:
             serializer.save()
         except ValidationError as e:
-            logger('TRANSACTIONS').error(f"Validation error: {e}")
+            logger('TRANSACTIONS').error("Validation error: %s", e)
             return Response({"detail": str(e)}, status=404)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Batch POST method, validates a list of transactions together and creates them in one atomic block"""
+        if not isinstance(request.data, list):
+            return Response({"error": "Expected a list of transactions."}, status=400)
+        if len(request.data) > settings.TRANSACTION_BATCH_MAX_SIZE:
+            return Response({"error": f"A batch can hold at most {settings.TRANSACTION_BATCH_MAX_SIZE} transactions."}, status=400)
+
+        positions, items, failed = [], [], []
+        for index, data in enumerate(request.data):
+            serializer = BatchTransactionSerializer(data=data)
+            if serializer.is_valid():
+                positions.append(index)
+                items.append(serializer.validated_data)
+            else:
+                failed.append({"index": index, "errors": serializer.errors})
+
+        try:
+            created, rejected = Transaction.create_batch(items, user=request.user)
+        except Exception as e:
+            logger('TRANSACTIONS').error("Batch error: %s", e)
+            return Response({"error": "Something went wrong"}, status=500)
+
+        failed += [{"index": positions[index], "errors": error} for index, error in rejected]
+        failed.sort(key=lambda item: item["index"])
+        rejected_positions = {index for index, _ in rejected}
+        created_positions = [index for position, index in enumerate(positions) if position not in rejected_positions]
+        succeeded = [{"index": index, "id": str(instance.id)} for index, instance in zip(created_positions, created)]
+
+        status = 201 if not failed else 207 if succeeded else 400
+        return Response({"succeeded": succeeded, "failed": failed}, status=status)
+
     def get_queryset(self):
         """GET, DELETE methods for Transaction"""
         try:
             if self.request.user.type == 'ADMIN' or self.request.user.type == 'BANKER':
                 return Transaction.objects.all()
             
-            user = self.request.user
-            debit_transactions = Transaction.objects.filter(from_account__user=user)
-            if not debit_transactions.exists():
-                raise Transaction.DoesNotExist
-            
-            credit_transactions = Transaction.objects.filter(to_account__user=user)
-            if not credit_transactions.exists():
-                raise Transaction.DoesNotExist
-
-            return debit_transactions | credit_transactions
+            return Transaction.history_for_user(self.request.user)
         except Exception as e:
-            logger('TRANSACTIONS').error(f"Error: {str(e)}")
+            logger('TRANSACTIONS').error("Error: %s", e)
             return Transaction.objects.none()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from .models import CustomUser
+
+# Claims the user is built from, get_token of CustomTokenObtainPairSerializer puts them in every access token
+TOKEN_USER_FIELDS = {'id': api_settings.USER_ID_CLAIM, 'username': 'username', 'type': 'type'}
+
+# Only these users are trusted from the claims, the others are looked up so a deactivation or demotion applies at once
+TOKEN_USER_TYPES = {'CUSTOMER'}
+
+
+class ValidatedTokenCache:
+    """
+    LRU cache of the already validated access tokens, so a token is decoded and its signature checked once
+    instead of on every request. Keyed by the whole raw token: the signature alone would also match a token
+    with a tampered payload. An entry is dropped once its token expires.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = OrderedDict()
+
+    def get(self, raw_token, validate):
+        with self.lock:
+            entry = self.tokens.get(raw_token)
+            if entry is not None and entry[1] > time.time():
+                self.tokens.move_to_end(raw_token)
+                return entry[0]
+
+        token = validate(raw_token)
+        with self.lock:
+            self.tokens[raw_token] = (token, token['exp'])
+            while len(self.tokens) > settings.JWT_VALIDATION_CACHE_SIZE:
+                self.tokens.popitem(last=False)
+        return token
+
+    def invalidate(self):
+        with self.lock:
+            self.tokens.clear()
+
+
+validated_tokens = ValidatedTokenCache()
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """
+    JWT authentication resolving request.user of customers from the token claims instead of a CustomUser query.
+    The user comes with id, username and type loaded, its other fields are deferred and fetched from
+    the database the first time a view reads one. The trade-off is that deactivating a customer only shows
+    once their access token expires (ACCESS_TOKEN_LIFETIME). Bankers and admins, and tokens issued without
+    these claims, go through the usual lookup, which rejects inactive users.
+    """
+    def get_validated_token(self, raw_token):
+        return validated_tokens.get(raw_token, super().get_validated_token)
+
+    def get_user(self, validated_token):
+        try:
+            claims = {field: validated_token[claim] for field, claim in TOKEN_USER_FIELDS.items()}
+        except KeyError:
+            return super().get_user(validated_token)
+        if claims['type'] not in TOKEN_USER_TYPES:
+            return super().get_user(validated_token)
+
+        field_names = [field.attname for field in CustomUser._meta.concrete_fields if field.attname in claims]
+        return CustomUser.from_db(router.db_for_read(CustomUser), field_names, [claims[name] for name in field_names])
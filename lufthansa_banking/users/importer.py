@@ -0,0 +1,150 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from utils import logger
+from .models import CustomUser
+
+# Bulk import of users from CSV or NDJSON, streamed in batches so memory stays flat however big the file is
+
+IMPORT_FIELDS = ['username', 'email', 'first_name', 'last_name', 'type']
+
+
+def read_rows(stream, file_format):
+    """Yield the user rows of a text stream as dicts"""
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+    elif file_format == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Unknown import format {file_format}, expected csv or ndjson")
+
+
+def setup_worker():
+    """Hashing processes started with spawn need django configured"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lufthansa_banking.settings')
+    django.setup()
+
+
+class UserImporter:
+    """
+    Imports the rows in batches of USER_IMPORT_BATCH_SIZE: each batch is checked against the existing
+    usernames and emails with two queries, its passwords are hashed across a process pool, and it is
+    inserted with one bulk_create in its own transaction. After every committed batch the number of rows
+    done is written to the checkpoint file, a rerun starts right after it.
+    """
+    def __init__(self, batch_size=None, workers=None, checkpoint=None):
+        self.batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+        self.workers = settings.USER_IMPORT_WORKERS if workers is None else workers
+        self.checkpoint = checkpoint
+        self.rows_done = self.created = self.failed = 0
+        self.errors = []
+
+    def run(self, rows):
+        """Import the rows, returns the number of created users"""
+        self.rows_done = self.read_checkpoint()
+        rows = islice(rows, self.rows_done, None)
+
+        pool = ProcessPoolExecutor(self.workers, initializer=setup_worker) if self.workers else None
+        try:
+            while batch := list(islice(rows, self.batch_size)):
+                self.import_batch(batch, pool)
+                self.rows_done += len(batch)
+                self.write_checkpoint()
+                logger('USERS').info("Imported %s rows, %s users created", self.rows_done, self.created)
+        finally:
+            if pool:
+                pool.shutdown()
+        return self.created
+
+    def import_batch(self, rows, pool=None):
+        numbers, users, passwords = [], [], []
+        for number, row in enumerate(rows, start=self.rows_done + 1):
+            try:
+                users.append(self.build_user(row))
+                numbers.append(number)
+                passwords.append(row.get('password') or None)
+            except ValidationError as e:
+                self.fail(number, e.messages[0])
+
+        # hashing is the slow part, PBKDF2 is CPU bound so it gets spread over processes
+        if pool:
+            hashes = pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (self.workers * 4)))
+        else:
+            hashes = map(make_password, passwords)
+        for user, password in zip(users, hashes):
+            user.password = password
+
+        entries = list(zip(numbers, users))
+        for attempt in range(2):
+            entries = self.drop_duplicates(entries)
+            try:
+                with transaction.atomic():
+                    CustomUser.objects.bulk_create([user for _, user in entries])
+                break
+            except IntegrityError:
+                # a user with the same username or email was created in the meantime, look again
+                if attempt:
+                    raise
+        self.created += len(entries)
+
+    def build_user(self, row):
+        """Unsaved user of a row, ValidationError for a row that can't be imported"""
+        data = {field: (row.get(field) or '').strip() for field in IMPORT_FIELDS}
+        if not data['username']:
+            raise ValidationError("username is required")
+        validate_email(data['email'])
+        data['type'] = data['type'].upper() or CustomUser.UserTypes.CUSTOMER
+        if data['type'] not in CustomUser.UserTypes.values:
+            raise ValidationError(f"Not allowed user type {data['type']}")
+        return CustomUser(**data)
+
+    def drop_duplicates(self, entries):
+        """The (row number, user) entries whose username and email are free, both in the table and earlier in the batch"""
+        usernames = set(CustomUser.objects.filter(username__in=[user.username for _, user in entries]).values_list('username', flat=True))
+        emails = set(CustomUser.objects.filter(email__in=[user.email for _, user in entries]).values_list('email', flat=True))
+
+        unique = []
+        for number, user in entries:
+            if user.username in usernames:
+                self.fail(number, f"A user with the username {user.username} already exists.")
+            elif user.email in emails:
+                self.fail(number, f"A user with the email {user.email} already exists.")
+            else:
+                usernames.add(user.username)
+                emails.add(user.email)
+                unique.append((number, user))
+        return unique
+
+    def fail(self, row, error):
+        self.failed += 1
+        if len(self.errors) < settings.USER_IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+    def read_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as checkpoint:
+            return json.load(checkpoint)['rows_done']
+
+    def write_checkpoint(self):
+        if not self.checkpoint:
+            return
+        # written aside and renamed, a crash never leaves half a checkpoint
+        with open(f"{self.checkpoint}.tmp", 'w') as checkpoint:
+            json.dump({'rows_done': self.rows_done}, checkpoint)
+        os.replace(f"{self.checkpoint}.tmp", self.checkpoint)
+
+    def remove_checkpoint(self):
+        """Once the whole file is in, an empty file or one with only a header never wrote a checkpoint"""
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
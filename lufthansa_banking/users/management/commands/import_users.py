@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.importer import UserImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import users from a CSV or NDJSON file in batches, resuming from the checkpoint of an interrupted run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'ndjson'], help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, help="Users inserted per transaction")
+        parser.add_argument('--workers', type=int, help="Password hashing processes, 0 to hash in this process")
+        parser.add_argument('--checkpoint', help="Checkpoint file, defaults to <path>.checkpoint")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        checkpoint = options['checkpoint'] or f"{path}.checkpoint"
+
+        importer = UserImporter(batch_size=options['batch_size'], workers=options['workers'], checkpoint=checkpoint)
+        if importer.read_checkpoint():
+            self.stdout.write(f"Resuming after row {importer.read_checkpoint()}")
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                importer.run(read_rows(stream, file_format))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        importer.remove_checkpoint()
+        for error in importer.errors:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(f"{importer.created} user(s) imported, {importer.failed} row(s) rejected"))
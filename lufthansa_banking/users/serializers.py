@@ -52,5 +52,6 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def get_token(cls, user):
         token = super().get_token(user)
         token['type'] = user.type
+        token['username'] = user.username
 
         return token
\ No newline at end of file
@@ -0,0 +1,90 @@
+import base64
+import json
+import pytest
+from django.test import RequestFactory
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from users.authentication import TokenUserAuthentication
+from users.models import CustomUser
+from users.serializers import CustomTokenObtainPairSerializer
+
+
+@pytest.fixture
+def banker():
+    """Fixture to create a banker user."""
+    return CustomUser.objects.create_user(username="banker", password="bankerpassword", email="banker@test.com", type="BANKER")
+
+def authenticate(token):
+    request = RequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {token}")
+    return TokenUserAuthentication().authenticate(request)
+
+@pytest.mark.django_db
+def test_user_built_from_token_claims(customer, django_assert_num_queries):
+    """A customer comes from the claims without a query, other fields load on first access."""
+    token = CustomTokenObtainPairSerializer.get_token(customer).access_token
+
+    with django_assert_num_queries(0):
+        user, _ = authenticate(token)
+        assert (user.pk, user.username, user.type) == (customer.pk, 'customer', 'CUSTOMER')
+        assert user.is_authenticated
+
+    with django_assert_num_queries(1):
+        assert user.email == 'user@test.com'
+
+@pytest.mark.django_db
+def test_privileged_user_checked_against_database(banker, django_assert_num_queries):
+    """Bankers are looked up on every request, a deactivated or demoted banker loses access at once."""
+    token = str(CustomTokenObtainPairSerializer.get_token(banker).access_token)
+    with django_assert_num_queries(1):
+        user, _ = authenticate(token)
+    assert user.type == 'BANKER'
+
+    banker.type = 'CUSTOMER'
+    banker.save()
+    user, _ = authenticate(token)
+    assert user.type == 'CUSTOMER'
+
+    banker.is_active = False
+    banker.save()
+    with pytest.raises(AuthenticationFailed):
+        authenticate(token)
+
+@pytest.mark.django_db
+def test_token_validation_cached(banker, monkeypatch):
+    """A token is validated once, then served from the cache."""
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    token = str(CustomTokenObtainPairSerializer.get_token(banker).access_token)
+    calls = []
+    validate = JWTAuthentication.get_validated_token
+    monkeypatch.setattr(JWTAuthentication, 'get_validated_token', lambda self, raw: calls.append(raw) or validate(self, raw))
+
+    authenticate(token)
+    authenticate(token)
+    assert len(calls) == 1
+
+@pytest.mark.django_db
+def test_tampered_token_rejected(banker):
+    """A payload swapped under a cached token's signature doesn't validate."""
+    token = str(CustomTokenObtainPairSerializer.get_token(banker).access_token)
+    authenticate(token)
+
+    header, payload, signature = token.split('.')
+    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    claims['type'] = 'ADMIN'
+    forged_payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip('=')
+
+    with pytest.raises(InvalidToken):
+        authenticate(f"{header}.{forged_payload}.{signature}")
+
+@pytest.mark.django_db
+def test_token_without_claims_falls_back_to_lookup(banker):
+    """Tokens issued before the claims existed still authenticate through the database."""
+    from rest_framework_simplejwt.tokens import AccessToken
+    token = AccessToken.for_user(banker)
+    user, _ = authenticate(token)
+    assert user.type == 'BANKER'
+
+    banker.is_active = False
+    banker.save()
+    with pytest.raises(AuthenticationFailed):
+        authenticate(token)
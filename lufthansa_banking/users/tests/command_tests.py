@@ -0,0 +1,68 @@
+import json
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from users.importer import UserImporter, read_rows
+from users.models import CustomUser
+
+
+@pytest.fixture
+def users_csv(tmp_path):
+    path = tmp_path / 'users.csv'
+    path.write_text(
+        "username,email,password,first_name,type\n"
+        "anna,anna@test.com,secret1,Anna,customer\n"
+        "ben,ben@test.com,secret2,Ben,\n"
+        "anna,other@test.com,secret3,Anna,\n"
+        "carl,not-an-email,secret4,Carl,\n"
+        "dora,dora@test.com,secret5,Dora,BANKER\n"
+    )
+    return path
+
+
+@pytest.mark.django_db
+def test_import_users_command(users_csv):
+    """Valid rows are created with hashed passwords, duplicates and invalid rows are reported."""
+    CustomUser.objects.create_user(username='dora', email='dora@old.com', password='x')
+    out, err = StringIO(), StringIO()
+    call_command('import_users', str(users_csv), '--workers', '0', '--batch-size', '2', stdout=out, stderr=err)
+
+    assert "2 user(s) imported, 3 row(s) rejected" in out.getvalue()
+    assert "Row 3: A user with the username anna already exists." in err.getvalue()
+    assert "Row 4: Enter a valid email address." in err.getvalue()
+    anna = CustomUser.objects.get(username='anna')
+    assert anna.check_password('secret1') and anna.type == 'CUSTOMER'
+    assert not (users_csv.parent / 'users.csv.checkpoint').exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('content', ["", "username,email,password\n"])
+def test_import_users_command_without_rows(tmp_path, content):
+    """A file without any user imports nothing, there is no checkpoint to clean up."""
+    path = tmp_path / 'users.csv'
+    path.write_text(content)
+    out = StringIO()
+    call_command('import_users', str(path), '--workers', '0', stdout=out, stderr=StringIO())
+    assert "0 user(s) imported, 0 row(s) rejected" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_import_resumes_from_checkpoint(users_csv, tmp_path):
+    """A rerun skips the rows committed before the checkpoint."""
+    checkpoint = tmp_path / 'import.checkpoint'
+    checkpoint.write_text(json.dumps({'rows_done': 3}))
+
+    importer = UserImporter(batch_size=10, workers=0, checkpoint=str(checkpoint))
+    with open(users_csv, newline='') as stream:
+        importer.run(read_rows(stream, 'csv'))
+
+    assert sorted(CustomUser.objects.values_list('username', flat=True)) == ['dora']
+    assert json.loads(checkpoint.read_text()) == {'rows_done': 5}
+
+
+@pytest.mark.django_db
+def test_import_hashes_in_process_pool(tmp_path):
+    """Passwords hashed by the worker processes are valid."""
+    rows = [{'username': f'user{i}', 'email': f'user{i}@test.com', 'password': f'pass{i}'} for i in range(4)]
+    UserImporter(batch_size=4, workers=2).run(iter(rows))
+    assert CustomUser.objects.get(username='user3').check_password('pass3')
@@ -0,0 +1,56 @@
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from users.models import CustomUser
+
+# Every user endpoint within its baseline query budget, with enough rows to show an N+1
+
+
+@pytest.fixture
+def customers():
+    return [CustomUser.objects.create(email=f'user{i}@test.com', username=f'user{i}', type='CUSTOMER') for i in range(5)]
+
+@pytest.mark.django_db
+def test_user_list_budget(api_client, admin_user, customers, query_budget):
+    api_client.force_authenticate(user=admin_user)
+    with query_budget('UserViewSet.list'):
+        response = api_client.get(reverse('user-list'))
+    assert len(response.data) == 6
+
+@pytest.mark.django_db
+def test_user_retrieve_budget(api_client, admin_user, customers, query_budget):
+    api_client.force_authenticate(user=admin_user)
+    with query_budget('UserViewSet.retrieve'):
+        response = api_client.get(reverse('user-detail', kwargs={'id': customers[0].id}))
+    assert response.status_code == 200
+
+@pytest.mark.django_db
+def test_user_create_budget(api_client, admin_user, query_budget):
+    api_client.force_authenticate(user=admin_user)
+    data = {'username': 'new', 'email': 'new@test.com', 'password': 'password', 'type': 'CUSTOMER'}
+    with query_budget('UserViewSet.create'):
+        response = api_client.post(reverse('user-list'), data=data, format='json')
+    assert response.status_code == 201
+
+@pytest.mark.django_db
+def test_user_partial_update_budget(api_client, admin_user, customers, query_budget):
+    api_client.force_authenticate(user=admin_user)
+    with query_budget('UserViewSet.partial_update'):
+        response = api_client.patch(reverse('user-detail', kwargs={'id': customers[0].id}), data={'username': 'anna', 'email': 'anna@test.com', 'type': 'CUSTOMER'}, format='json')
+    assert response.status_code == 200
+
+@pytest.mark.django_db
+def test_user_destroy_budget(api_client, admin_user, customers, query_budget):
+    api_client.force_authenticate(user=admin_user)
+    with query_budget('UserViewSet.destroy'):
+        response = api_client.delete(reverse('user-detail', kwargs={'id': customers[0].id}))
+    assert response.status_code == 204
+
+@pytest.mark.django_db
+def test_user_import_budget(api_client, admin_user, settings, query_budget):
+    settings.USER_IMPORT_WORKERS = 0
+    api_client.force_authenticate(user=admin_user)
+    lines = ''.join(f'{{"username": "imported{i}", "email": "imported{i}@test.com"}}\n' for i in range(20)).encode()
+    with query_budget('UserViewSet.import_users'):
+        response = api_client.post(reverse('user-import-users'), {'file': SimpleUploadedFile('users.ndjson', lines)}, format='multipart')
+    assert response.data['created'] == 20
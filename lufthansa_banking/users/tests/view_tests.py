@@ -103,7 +103,7 @@ def test_customer_cannot_create_user(api_client, create_customer_user):
     }
     response = api_client.post(url, data, format='json')
     assert response.status_code == status.HTTP_400_BAD_REQUEST
-    assert response.data['error'] == "Something went wrong"
+    assert response.data['error'] == "User couldn't be validated"
 
 
 @pytest.mark.django_db
@@ -172,4 +172,22 @@ def test_token_obtain_pair_invalid_credentials(api_client, create_customer_user)
     }
     response = api_client.post(url, data, format='json')
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
-    assert 'detail' in response.data
\ No newline at end of file
+    assert 'detail' in response.data
+
+@pytest.mark.django_db
+def test_admin_can_import_users(api_client, create_admin_user, create_banker_user, settings):
+    """Only admins can upload users in bulk."""
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    settings.USER_IMPORT_WORKERS = 4
+    settings.USER_IMPORT_REQUEST_WORKERS = 0
+    lines = b'{"username": "erin", "email": "erin@test.com", "password": "pw"}\n{"username": "erin", "email": "erin2@test.com"}\n'
+
+    api_client.force_authenticate(user=create_banker_user())
+    response = api_client.post(reverse('user-import-users'), {'file': SimpleUploadedFile('users.ndjson', lines)}, format='multipart')
+    assert response.status_code == 403
+
+    api_client.force_authenticate(user=create_admin_user())
+    response = api_client.post(reverse('user-import-users'), {'file': SimpleUploadedFile('users.ndjson', lines)}, format='multipart')
+    assert response.status_code == 201
+    assert (response.data['created'], response.data['failed']) == (1, 1)
+    assert CustomUser.objects.filter(username='erin').exists()
@@ -1,10 +1,14 @@
+import io
 from utils import logger
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.request import Request
 from django.http import HttpResponseRedirect
+from django.conf import settings
 from .models import CustomUser
 from .serializers import CustomUserSerializer, CustomTokenObtainPairSerializer
+from .importer import UserImporter, read_rows
 from rest_framework.exceptions import ValidationError
 
 from rest_framework_simplejwt.views import TokenObtainPairView
@@ -32,10 +36,10 @@ class UserViewSet(ModelViewSet):
             serializer.save()
             return Response(serializer.data, status=201)
         except ValidationError as e:
-            logger('USERS').info(f"User creation problem", str(e))
+            logger('USERS').info("User creation problem: %s", e)
             return Response({"error": "User couldn't be validated"}, status=400)
         except Exception as e:
-            logger('USERS').info(f"User creation problem", str(e))
+            logger('USERS').info("User creation problem: %s", e)
             return Response({"error": "Something went wrong"}, status=400)
         
     def update(self, request, *args, **kwargs):
@@ -55,12 +59,36 @@ class UserViewSet(ModelViewSet):
             serializer.save() 
             return Response(serializer.data, status=200)
         except ValidationError as e:
-            logger('USERS').info(f"User update problem: {str(e)}")
+            logger('USERS').info("User update problem: %s", e)
             return Response({"error": str(e)}, status=400)
         except Exception as e:
-            logger('USERS').info(f"User update problem: {str(e)}")
+            logger('USERS').info("User update problem: %s", e)
             return Response({"error": "Something went wrong"}, status=400)
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_users(self, request):
+        """Bulk import POST method, takes a CSV or NDJSON file of users"""
+        if self.request.user.type != 'ADMIN':
+            return Response({"error": "Only admins can import users"}, status=403)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload the users as 'file'"}, status=400)
+        file_format = 'csv' if upload.name.endswith('.csv') else 'ndjson'
+
+        # no process pool inside a web request, large files go through the import_users command
+        importer = UserImporter(workers=settings.USER_IMPORT_REQUEST_WORKERS)
+        try:
+            importer.run(read_rows(io.TextIOWrapper(upload.file, encoding='utf-8', newline=''), file_format))
+        except (ValueError, UnicodeDecodeError) as e:
+            logger('USERS').info("User import problem: %s", e)
+            return Response({"error": "File couldn't be read", "created": importer.created}, status=400)
+        except Exception as e:
+            logger('USERS').error("Error: %s", e)
+            return Response({"error": "Something went wrong", "created": importer.created}, status=500)
+
+        return Response({"created": importer.created, "failed": importer.failed, "errors": importer.errors}, status=201)
+
     def get_queryset(self):
         """GET, DELETE methods for User"""
         try:
@@ -75,13 +103,13 @@ class UserViewSet(ModelViewSet):
                 return custom_user
             raise CustomUser.DoesNotExist
         except Exception as e:
-            logger('USERS').error(f"Error: {str(e)}")
+            logger('USERS').error("Error: %s", e)
             return CustomUser.objects.none()
         except CustomUser.DoesNotExist:
             logger('USERS').error("No user found")
             return CustomUser.objects.none()
         except ValidationError as e:
-            logger('USERS').error(f"Error: {str(e)}")
+            logger('USERS').error("Error: %s", e)
             return CustomUser.objects.none()
 
 
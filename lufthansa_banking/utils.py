@@ -1,46 +1,57 @@
 import logging
+from decimal import Decimal, ROUND_HALF_EVEN
 from functools import wraps
 from django.http import HttpResponseForbidden
 
 # Utils file where general concepts used thoruguout the project are defined
 
 
-# Set the logger configs such as the logger location and name, 
-# the provisory location is the root of the project but normally it should be in a log folder,
-# in the root of the system
-logging.basicConfig(filename='./example.log', encoding='utf-8', level=logging.DEBUG)
-
-# Create a factory function to create loggers
+# Create a factory function to create loggers, they are configured by settings.LOGGING (see logs.py).
+# Pass the values as arguments, logger(name).info("Created %s", obj), so they are only formatted when the record is kept
 logger = lambda name: logging.getLogger(name) 
 
-def convert_currency(amount: float, from_currency: str, to_currency: str) -> float:
+CENTS = Decimal('0.01')
+
+def convert_currency(amount: Decimal, from_currency: str, to_currency: str) -> Decimal:
     """
     Convert the amount from one currency to another
     :param amount: the amount to convert
     :param from_currency: the currency of the amount
     :param to_currency: the currency to convert to
-    :return: the converted amount
+    :return: the converted amount, rounded to cents
     """
+    if from_currency == to_currency:
+        return amount
+
     exhchange_rate = get_exchange_rate(from_currency, to_currency)
-    if exhchange_rate:
-        return amount * exhchange_rate
-    return amount
+    if exhchange_rate is None:
+        raise ValueError(f"No exchange rate from {from_currency} to {to_currency}.")
+    return (amount * exhchange_rate).quantize(CENTS, rounding=ROUND_HALF_EVEN)
 
 
-def get_exchange_rate(from_currency: str, to_currency: str) -> float:
+def get_exchange_rate(from_currency: str, to_currency: str) -> Decimal:
     """
-    Get the exchange rate between two currencies
+    Get the exchange rate between two currencies from the process local rate cache
     :param from_currency: the currency to convert from
     :param to_currency: the currency to convert to
-    :return: the exchange rate
+    :return: the exchange rate, None if the pair is unknown
     """
+    from accounts.rates import exchange_rates
+
     if from_currency == to_currency:
         return
     
-    currency_rates = {
-        'USD': {'EUR': 0.85, 'ALL': 100.0},
-        'EUR': {'USD': 1.18, 'ALL': 123.0},
-        'ALL': {'USD': 0.01, 'EUR': 0.0081}
-    }
+    return exchange_rates.get_rate(from_currency, to_currency)
+
+
+def convert_many(amounts: list, from_currencies, to_currency: str, minor_units: bool = False) -> list:
+    """
+    Convert a list of amounts to one currency in a single pass, for reports converting many balances
+    :param amounts: Decimal amounts, or integer minor units (cents) when minor_units is set
+    :param from_currencies: the currency of all the amounts, or a list with the currency of each amount
+    :param to_currency: the currency to convert to
+    :return: the converted amounts, in the same order
+    """
+    from accounts.rates import exchange_rates
 
-    return currency_rates.get(from_currency, {}).get(to_currency)
\ No newline at end of file
+    return exchange_rates.convert_many(amounts, from_currencies, to_currency, minor_units=minor_units)